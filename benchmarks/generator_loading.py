@@ -0,0 +1,78 @@
+"""
+# Generator Loading Benchmark
+Compares, in fresh processes, the time to first translation and the peak
+resident memory of three ways to get the A2B generator, next to the cost of
+importing TensorFlow alone:
+
+* full: build all four networks and a compiled `CycleGan`, then load the whole
+  H5 file (what the inference script used to do)
+* h5 generator: build `gen_G` only and load its weights from the H5 file
+* savedmodel: restore the exported `generator_G` SavedModel only
+
+Usage:
+    python -m cyclegan export --model_path model_27.h5 --export_dir export
+    python benchmarks/generator_loading.py --model_path model_27.h5 --export_dir export
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, resource, sys, time
+start = time.perf_counter()
+import tensorflow as tf
+method, model_path, export_dir, size = sys.argv[1], sys.argv[2], sys.argv[3], int(sys.argv[4])
+img = tf.zeros((1, size, size, 3))
+if method == "tensorflow only":
+    generator = lambda img, training: img
+elif method == "full":
+    from cyclegan.models import build_cycle_gan, read_generator_config
+    model = build_cycle_gan((size, size, 3), read_generator_config(model_path))
+    model.built = True
+    model.load_weights(model_path)
+    generator = model.gen_G
+elif method == "h5 generator":
+    from cyclegan.models import load_generator
+    generator = load_generator(model_path, "A2B", (size, size, 3))
+else:
+    from cyclegan.export import load_exported_generator
+    generator = load_exported_generator(export_dir, "A2B")
+loaded = time.perf_counter()
+generator(img, training=False)
+translated = time.perf_counter()
+print(json.dumps({
+    "load_s": loaded - start,
+    "first_translation_s": translated - start,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model_path", required=True)
+    parser.add_argument("--export_dir", required=True)
+    parser.add_argument("--size", type=int, default=256)
+    args = parser.parse_args()
+
+    env = dict(os.environ, TF_CPP_MIN_LOG_LEVEL="3")
+    print("%-16s %10s %22s %14s" % ("method", "load s", "first translation s", "peak RSS MB"))
+    for method in ("tensorflow only", "full", "h5 generator", "savedmodel"):
+        output = subprocess.run(
+            [sys.executable, "-c", CHILD, method, args.model_path, args.export_dir, str(args.size)],
+            cwd=REPO_ROOT,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        ).stdout
+        result = json.loads(output.decode("utf8").strip().splitlines()[-1])
+        print("%-16s %10.2f %22.2f %14.1f" % (method, result["load_s"], result["first_translation_s"], result["peak_rss_mb"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+# Generator Variant Latency And Parameter Table
+Builds every generator variant in `cyclegan.variants` and reports its
+parameter count, multiply-accumulate operations and CPU inference latency
+(median of a traced `tf.function` call) as a Markdown table.
+
+Usage:
+    python benchmarks/generator_variants.py --size 256 --repeats 10 --output variants.md
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import layers
+
+from cyclegan.models import build_generator
+from cyclegan.variants import GENERATOR_VARIANTS, generator_config
+
+
+def count_macs(model):
+    # Multiply-accumulate operations of the convolutions in one forward pass
+    macs = 0
+    for layer in model.layers:
+        if isinstance(layer, layers.DepthwiseConv2D):
+            kernel_size = np.prod(layer.kernel_size)
+            macs += np.prod(layer.output.shape[1:]) * kernel_size
+        elif isinstance(layer, layers.Conv2DTranspose):
+            kernel_size = np.prod(layer.kernel_size)
+            macs += np.prod(layer.input.shape[1:]) * kernel_size * layer.filters
+        elif isinstance(layer, layers.Conv2D):
+            kernel_size = np.prod(layer.kernel_size)
+            macs += np.prod(layer.output.shape[1:]) * kernel_size * layer.input.shape[-1]
+    return int(macs)
+
+
+def time_generator(generator, size, repeats):
+    img = tf.random.uniform((1, size, size, 3), -1.0, 1.0)
+    predict = tf.function(lambda x: generator(x, training=False))
+    predict(img)
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        predict(img).numpy()
+        timings.append(time.perf_counter() - start)
+    return np.median(timings) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--variants", nargs="+", default=list(GENERATOR_VARIANTS), choices=list(GENERATOR_VARIANTS))
+    parser.add_argument("--output", help="File to write the Markdown table to")
+    args = parser.parse_args()
+
+    rows = [
+        "| variant | filters | residual blocks | separable | parameters | GMACs | latency ms | speedup |",
+        "|---|---|---|---|---|---|---|---|",
+    ]
+    baseline_ms = None
+    for variant in args.variants:
+        config = generator_config(variant)
+        generator = build_generator("A2B", (args.size, args.size, 3), config)
+        latency_ms = time_generator(generator, args.size, args.repeats)
+        if baseline_ms is None:
+            baseline_ms = latency_ms
+        rows.append(
+            "| %s | %d | %d | %s | %s | %.2f | %.1f | %.2fx |"
+            % (
+                variant,
+                config["filters"],
+                config["num_residual_blocks"],
+                config["separable"],
+                "{:,}".format(generator.count_params()),
+                count_macs(generator) / 1e9,
+                latency_ms,
+                baseline_ms / latency_ms,
+            )
+        )
+        print(rows[-1])
+
+    table = "\n".join(rows)
+    print()
+    print("CPU latency at %dx%d, batch size 1, %d threads" % (args.size, args.size, os.cpu_count()))
+    print(table)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(table + "\n")
+
+
+if __name__ == "__main__":
+    main()
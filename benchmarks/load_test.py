@@ -0,0 +1,93 @@
+"""
+# Translation Service Load Test
+Sends concurrent translation requests to a running `python -m cyclegan serve`
+and reports the client-side throughput and latency percentiles, followed by
+the metrics the service collected (e.g. the mean micro-batch size).
+
+Only the standard library is used, so the load generator can run anywhere.
+
+Usage:
+    python -m cyclegan serve --model_path model_27.h5 --size 256 256 &
+    python benchmarks/load_test.py --images trainA --concurrency 16 --requests 200
+"""
+import argparse
+import itertools
+import json
+import os
+import statistics
+import threading
+import time
+import urllib.request
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100.0 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--images", required=True, help="Image file, or folder of JPG/PNG images, to upload")
+    parser.add_argument("--direction", choices=["A2B", "B2A"], default="A2B")
+    parser.add_argument("--concurrency", type=int, default=8, help="Number of clients sending requests at once")
+    parser.add_argument("--requests", type=int, default=100, help="Total number of requests")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.images):
+        paths = sorted(
+            os.path.join(args.images, file)
+            for file in os.listdir(args.images)
+            if file.lower().endswith((".jpg", ".jpeg", ".png"))
+        )
+    else:
+        paths = [args.images]
+    bodies = []
+    for path in paths:
+        with open(path, "rb") as f:
+            bodies.append(f.read())
+
+    # Requests are handed out round robin over the images
+    work = iter(itertools.islice(itertools.cycle(bodies), args.requests))
+    work_lock = threading.Lock()
+    latencies = []
+    errors = []
+
+    def client():
+        while True:
+            with work_lock:
+                body = next(work, None)
+            if body is None:
+                return
+            request = urllib.request.Request(
+                "%s/translate/%s" % (args.url, args.direction), data=body, headers={"Content-Type": "application/octet-stream"}
+            )
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+                latencies.append(time.perf_counter() - start)
+            except OSError as e:
+                errors.append(str(e))
+
+    start_time = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.perf_counter() - start_time
+
+    print("%d requests, %d clients, %d errors" % (len(latencies) + len(errors), args.concurrency, len(errors)))
+    if latencies:
+        latencies_ms = [latency * 1000.0 for latency in latencies]
+        print("throughput   %8.2f requests/sec" % (len(latencies) / wall_time))
+        print("latency mean %8.1f ms" % statistics.mean(latencies_ms))
+        for q in (50, 95, 99):
+            print("latency p%-3d %8.1f ms" % (q, percentile(latencies_ms, q)))
+    with urllib.request.urlopen(args.url + "/metrics") as response:
+        print("service metrics:", json.dumps(json.loads(response.read()), indent=2))
+
+
+if __name__ == "__main__":
+    main()
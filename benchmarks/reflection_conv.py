@@ -0,0 +1,147 @@
+"""
+# Fused Reflection Padded Convolution Benchmark
+Builds the ResNet generator once with `ReflectionPadding2D` + `Conv2D` and once
+with the fused `ReflectionConv2D`, copies the weights across and reports, per
+generator pass:
+
+* the largest output and gradient difference between both versions
+* the latency of inference and of a forward + backward pass
+* the padded activation bytes the gradient tape keeps for the backward
+  pass. Both versions still materialize every padded tensor during the
+  forward pass, the fused one only frees it right after its convolution,
+  so inference allocates the same
+* on a GPU, the measured peak memory of inference and of a forward +
+  backward pass
+
+Usage:
+    python benchmarks/reflection_conv.py --size 256 --batch_size 1 --repeats 20
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow.keras import layers
+import tensorflow_addons as tfa
+
+from cyclegan.layers import ReflectionConv2D, ReflectionPadding2D
+
+
+def reflection_conv(x, filters, kernel_size, fused, use_bias=False):
+    if fused:
+        return ReflectionConv2D(filters, kernel_size, use_bias=use_bias)(x)
+    x = ReflectionPadding2D(padding=(kernel_size[1] // 2, kernel_size[0] // 2))(x)
+    return layers.Conv2D(filters, kernel_size, padding="valid", use_bias=use_bias)(x)
+
+
+def build_generator(fused, size, filters=64, num_residual_blocks=9):
+    # Same topology and weight order as `get_resnet_generator`
+    img_input = layers.Input(shape=(size, size, 3))
+    x = reflection_conv(img_input, filters, (7, 7), fused)
+    x = tfa.layers.InstanceNormalization()(x)
+    x = layers.Activation("relu")(x)
+    for _ in range(2):
+        filters *= 2
+        x = layers.Conv2D(filters, (3, 3), strides=(2, 2), padding="same", use_bias=False)(x)
+        x = tfa.layers.InstanceNormalization()(x)
+        x = layers.Activation("relu")(x)
+    for _ in range(num_residual_blocks):
+        y = reflection_conv(x, filters, (3, 3), fused)
+        y = tfa.layers.InstanceNormalization()(y)
+        y = layers.Activation("relu")(y)
+        y = reflection_conv(y, filters, (3, 3), fused)
+        y = tfa.layers.InstanceNormalization()(y)
+        x = layers.add([x, y])
+    for _ in range(2):
+        filters //= 2
+        x = layers.Conv2DTranspose(filters, (3, 3), strides=(2, 2), padding="same", use_bias=False)(x)
+        x = tfa.layers.InstanceNormalization()(x)
+        x = layers.Activation("relu")(x)
+    x = reflection_conv(x, 3, (7, 7), fused, use_bias=True)
+    x = layers.Activation("tanh")(x)
+    return keras.models.Model(img_input, x)
+
+
+def padded_bytes(model, batch_size):
+    # Bytes of every padded tensor the unfused version keeps for the backward pass
+    total = 0
+    for layer in model.layers:
+        if isinstance(layer, ReflectionPadding2D):
+            total += batch_size * int(np.prod(layer.output.shape[1:])) * layer.output.dtype.size
+    return total
+
+
+def time_call(fn, repeats):
+    fn()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return np.median(timings) * 1000.0
+
+
+def peak_memory(fn):
+    # TF allocator stats are only available on GPU devices
+    if not tf.config.list_physical_devices("GPU"):
+        return None
+    tf.config.experimental.reset_memory_stats("GPU:0")
+    fn()
+    return tf.config.experimental.get_memory_info("GPU:0")["peak"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--batch_size", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    unfused = build_generator(fused=False, size=args.size)
+    fused = build_generator(fused=True, size=args.size)
+    # The fused layer creates the same weights in the same order
+    fused.set_weights(unfused.get_weights())
+
+    img = tf.random.uniform((args.batch_size, args.size, args.size, 3), -1.0, 1.0)
+
+    def gradients(model):
+        with tf.GradientTape() as tape:
+            loss = tf.reduce_mean(tf.abs(model(img, training=True)))
+        return tape.gradient(loss, model.trainable_variables)
+
+    output_diff = np.max(np.abs(unfused(img, training=False) - fused(img, training=False)))
+    grad_diff = max(
+        float(np.max(np.abs(a - b))) for a, b in zip(gradients(unfused), gradients(fused))
+    )
+
+    print("Max output difference:   %.3e" % output_diff)
+    print("Max gradient difference: %.3e" % grad_diff)
+    print("Padded activations kept for the backward pass: %.1f MB (unfused), none (fused)"
+          % (padded_bytes(unfused, args.batch_size) / 2 ** 20))
+    print("Padded tensors are still allocated by both versions during every forward pass, inference included")
+    print()
+    print("%-10s %14s %14s %18s %16s %16s" % ("", "eager ms", "graph ms", "fwd+bwd graph ms", "infer peak MB", "fwd+bwd peak MB"))
+    peaks = {}
+    for name, model in (("unfused", unfused), ("fused", fused)):
+        graph_call = tf.function(lambda: model(img, training=False))
+        graph_grads = tf.function(lambda: gradients(model))
+        eager_ms = time_call(lambda: model(img, training=False), args.repeats)
+        graph_ms = time_call(graph_call, args.repeats)
+        train_ms = time_call(graph_grads, args.repeats)
+        peaks[name] = (peak_memory(graph_call), peak_memory(graph_grads))
+        infer_peak, train_peak = ("n/a" if peak is None else "%.1f" % (peak / 2 ** 20) for peak in peaks[name])
+        print("%-10s %14.2f %14.2f %18.2f %16s %16s" % (name, eager_ms, graph_ms, train_ms, infer_peak, train_peak))
+    if peaks["fused"][0] is not None:
+        print()
+        print("Measured peak saving: %.1f MB inference, %.1f MB forward + backward" % tuple(
+            (unfused_peak - fused_peak) / 2 ** 20 for unfused_peak, fused_peak in zip(peaks["unfused"], peaks["fused"])
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+# Import And Startup Time Benchmark
+Runs every measurement in a fresh Python process, since import times only
+mean something cold, and reports the median wall time in seconds:
+
+* `import cyclegan` and `python -m cyclegan --help` (no TensorFlow)
+* importing the model builders (TensorFlow) and the data pipelines
+* importing every library the original notebook scripts loaded at the top
+* building only `gen_G`, compared with building all four networks
+
+Pass `--output results.jsonl` to append the results with a timestamp, so the
+numbers can be tracked across commits.
+
+Usage:
+    python benchmarks/startup.py --repeats 5 --output startup.jsonl
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MEASUREMENTS = [
+    ("import cyclegan", ["-c", "import cyclegan"]),
+    ("cli --help", ["-m", "cyclegan", "--help"]),
+    ("import cyclegan.models", ["-c", "import cyclegan.models"]),
+    ("import cyclegan.data", ["-c", "import cyclegan.data"]),
+    (
+        "legacy script imports",
+        ["-c", "import matplotlib.pyplot, tensorflow, tensorflow_addons, tensorflow_datasets, sklearn.utils, PIL.Image"],
+    ),
+    ("build gen_G", ["-c", "from cyclegan.models import build_generator; build_generator('A2B')"]),
+    ("build all four networks", ["-c", "from cyclegan.models import build_cycle_gan; build_cycle_gan()"]),
+]
+
+
+def time_process(args, repeats):
+    env = dict(os.environ, TF_CPP_MIN_LOG_LEVEL="3")
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable] + args, cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        timings.append(time.perf_counter() - start)
+        # Missing optional libraries make a measurement unavailable rather than fast
+        if result.returncode != 0:
+            return None
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", help="JSON lines file to append the results to")
+    args = parser.parse_args()
+
+    baseline = time_process(["-c", "pass"], args.repeats)
+    results = {"interpreter": baseline}
+    print("%-28s %10s" % ("measurement", "seconds"))
+    print("%-28s %10.3f" % ("interpreter", baseline))
+    for name, process_args in MEASUREMENTS:
+        results[name] = time_process(process_args, args.repeats)
+        print("%-28s %10s" % (name, "n/a" if results[name] is None else "%.3f" % results[name]))
+
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps({"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
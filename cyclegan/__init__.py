@@ -0,0 +1,35 @@
+"""
+# Neural Image Translation
+Reusable building blocks for the Cycle GAN training and inference scripts.
+
+Importing the package is cheap: TensorFlow and the other heavy dependencies
+are only imported once one of the attributes below is first accessed.
+"""
+import importlib
+
+_LAZY_ATTRIBUTES = {
+    "ReflectionConv2D": "cyclegan.layers",
+    "ReflectionPadding2D": "cyclegan.layers",
+    "CycleGan": "cyclegan.models",
+    "build_cycle_gan": "cyclegan.models",
+    "build_generator": "cyclegan.models",
+    "get_discriminator": "cyclegan.models",
+    "get_resnet_generator": "cyclegan.models",
+    "load_generator": "cyclegan.models",
+    "load_datasets": "cyclegan.data",
+    "GANMonitor": "cyclegan.callbacks",
+}
+
+__all__ = sorted(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError("module 'cyclegan' has no attribute %r" % name)
+    value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,4 @@
+from cyclegan.cli import main
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+## Inference backends
+One interface, `make_backend(generator, backend)`, over the ways to run a
+Keras generator. Every backend returns a callable mapping a normalized
+`[batch, height, width, 3]` batch to its translations:
+
+* `eager`: calls the Keras model eagerly, op by op (what the scripts used to do)
+* `function`: a `tf.function` traced once per input signature
+* `xla`: the same `tf.function` compiled by XLA, once per input shape
+* `tflite`: a float32 TFLite conversion run by the TFLite interpreter; needs
+  a fixed input size
+
+`benchmark_backends` runs the same inputs through several backends and
+reports their latency percentiles and throughput.
+
+TensorFlow is only imported once a backend is built, so the command line can
+list `BACKENDS` without importing it.
+"""
+import time
+
+BACKENDS = ["eager", "function", "xla", "tflite"]
+DEFAULT_BACKEND = "function"
+
+
+def convert_to_tflite(generator):
+    """Converts a Keras generator with a fixed input size to a float32 TFLite flatbuffer."""
+    import tensorflow as tf
+
+    return tf.lite.TFLiteConverter.from_keras_model(generator).convert()
+
+
+def make_backend(generator, backend=DEFAULT_BACKEND, input_img_size=None, num_threads=None):
+    """Wraps a Keras generator in one of the `BACKENDS`.
+    Args:
+        generator: Keras generator.
+        backend(str): One of `BACKENDS`.
+        input_img_size(tuple): Fixed input size of the batches, or None for
+        any size. The `tflite` backend needs a fixed size.
+        num_threads(int): CPU threads of the TFLite interpreter.
+    Returns:
+        A callable mapping a normalized image batch to its translations.
+    """
+    import tensorflow as tf
+
+    if backend == "eager":
+        return lambda img: generator(img, training=False)
+    if backend in ("function", "xla"):
+        shape = [None, None, None, 3] if input_img_size is None else [None, *input_img_size[:2], 3]
+        # A signature with a free batch dimension keeps smaller batches from retracing
+        return tf.function(
+            lambda img: generator(img, training=False),
+            input_signature=[tf.TensorSpec(shape, tf.float32)],
+            jit_compile=backend == "xla",
+        )
+    if backend == "tflite":
+        from tensorflow import keras
+
+        from cyclegan.quantize import TFLiteGenerator
+
+        if input_img_size is None:
+            raise ValueError("The tflite backend needs a fixed input size")
+        if tuple(generator.input_shape[1:3]) != tuple(input_img_size[:2]):
+            # The converter needs a fixed size, so call the generator on a fixed size input
+            inputs = keras.Input((*input_img_size[:2], 3))
+            generator = keras.Model(inputs, generator(inputs), name=generator.name)
+        return TFLiteGenerator(model_content=convert_to_tflite(generator), num_threads=num_threads)
+    raise ValueError("Unknown backend %r, choose one of %s" % (backend, ", ".join(BACKENDS)))
+
+
+def benchmark_backends(generator, backends, batches, repeats=20, input_img_size=None):
+    """Runs the same batches through several backends.
+    Args:
+        generator: Keras generator.
+        backends(list): Names of the backends to compare; the first one is
+        the reference for the output difference.
+        batches(list): Normalized image batches, all of `input_img_size`.
+        repeats(int): Number of timed passes over `batches` per backend.
+    Returns:
+        One result per backend with the setup and first call time, p50/p95
+        latency per batch, throughput and the L1 distance to the reference.
+    """
+    import numpy as np
+
+    from cyclegan.comparison import output_divergence
+
+    results = []
+    reference_outputs = None
+    for backend in backends:
+        start = time.perf_counter()
+        predict = make_backend(generator, backend, input_img_size)
+        setup_s = time.perf_counter() - start
+        # The first call traces or compiles, time it separately
+        start = time.perf_counter()
+        outputs = [np.asarray(predict(img)) for img in batches]
+        first_pass_s = time.perf_counter() - start
+        if reference_outputs is None:
+            reference_outputs = outputs
+
+        latencies = []
+        for _ in range(repeats):
+            for img in batches:
+                start = time.perf_counter()
+                np.asarray(predict(img))
+                latencies.append(time.perf_counter() - start)
+        num_images = sum(len(img) for img in batches) * repeats
+        results.append(
+            {
+                "backend": backend,
+                "setup_s": setup_s,
+                "first_pass_s": first_pass_s,
+                "p50_ms": float(np.percentile(latencies, 50) * 1000.0),
+                "p95_ms": float(np.percentile(latencies, 95) * 1000.0),
+                "images_per_second": num_images / sum(latencies),
+                "l1": float(np.mean([output_divergence(r, o)[0] for r, o in zip(reference_outputs, outputs)])),
+            }
+        )
+    return results
+
+
+def format_backend_results(results):
+    lines = [
+        "| backend | setup s | first pass s | p50 ms | p95 ms | images/sec | L1 vs %s |" % results[0]["backend"],
+        "|---|---|---|---|---|---|---|",
+    ]
+    for result in results:
+        lines.append(
+            "| %s | %.2f | %.2f | %.1f | %.1f | %.2f | %.2e |"
+            % (
+                result["backend"],
+                result["setup_s"],
+                result["first_pass_s"],
+                result["p50_ms"],
+                result["p95_ms"],
+                result["images_per_second"],
+                result["l1"],
+            )
+        )
+    return "\n".join(lines)
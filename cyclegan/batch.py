@@ -0,0 +1,310 @@
+"""
+## Streaming batch translation of whole directories
+Translates every image below a directory to disk with a three stage pipeline
+connected by bounded queues, so memory stays constant however many images
+the directory holds:
+```
+file list ==> decoder threads ==> batched generator ==> writer threads
+          (decode + resize)    (main thread)        (encode + write)
+```
+Without an input size every image is translated at its native resolution,
+batching images of similar sizes through the shape buckets of a `Translator`.
+Outputs are written to a temporary file and renamed once complete, so a
+re-run resumes by skipping every image whose output already exists. Inputs
+that differ only by their extension would overwrite each other's output, so
+they are reported as failed instead of translated. With a `ResultCache`,
+inputs translated before (duplicates, or other output folders) skip the
+generator and are copied from the cache.
+
+The input can also be a shard folder (see `cyclegan.shards`): a reader thread
+then streams its tar files sequentially into the decoders, and resuming only
+reads the index.
+"""
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from cyclegan.data import denormalize_img, list_image_paths, normalize_img
+from cyclegan.shards import is_shard_dir, iter_shard_members, read_index, shard_paths
+
+# Marks the end of a stream in the pipeline queues
+_END = object()
+
+
+class StageTimer:
+    """Accumulates the busy time of the worker threads of one pipeline stage."""
+
+    def __init__(self, workers=1):
+        self.workers = workers
+        self.busy = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        with self.lock:
+            self.busy += seconds
+
+    def utilization(self, wall_time):
+        return self.busy / max(wall_time * self.workers, 1e-9)
+
+
+def output_path_for(path, input_dir, output_dir, output_format="png"):
+    # Mirror the input folder structure, replacing the extension with the output format
+    relative = os.path.splitext(os.path.relpath(path, input_dir))[0]
+    return os.path.join(output_dir, relative + "." + output_format)
+
+
+def pending_images(input_dir, output_dir, output_format="png", resume=True):
+    """Returns the `(input, output)` paths still to translate, the number skipped
+    and the `(input, error)` of inputs whose output another input maps to too,
+    e.g. `a.jpg` and `a.png` both written to `a.png`. These are not translated.
+    """
+    pending = []
+    skipped = 0
+    collisions = []
+    if is_shard_dir(input_dir):
+        # Images of every split, named by their path in the original folder
+        index = read_index(input_dir)
+        members = [member for shards in index["splits"].values() for shard in shards for member in shard["members"]]
+        paths = [os.path.join(input_dir, name) for name, _, _ in members]
+    else:
+        paths = list_image_paths(input_dir)
+    inputs = {}
+    for path in paths:
+        inputs.setdefault(output_path_for(path, input_dir, output_dir, output_format), []).append(path)
+    for output_file, sources in inputs.items():
+        if len(sources) > 1:
+            for path in sources:
+                others = ", ".join(other for other in sources if other != path)
+                collisions.append((path, "output %s would also be written by %s" % (output_file, others)))
+        elif resume and os.path.exists(output_file):
+            skipped += 1
+        else:
+            pending.append((sources[0], output_file))
+    return pending, skipped, collisions
+
+
+def encode_translation(img, output_file, original_size=None):
+    """Encodes one normalized image in the format of `output_file`."""
+    if original_size is not None:
+        img = tf.image.resize(img, original_size)
+    img = denormalize_img(img)
+    if output_file.lower().endswith((".jpg", ".jpeg")):
+        return tf.io.encode_jpeg(img, quality=95).numpy()
+    return tf.io.encode_png(img).numpy()
+
+
+def write_file_atomically(data, output_file):
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    # Rename once complete, so interrupted writes are never mistaken for finished outputs.
+    # The temporary name is unique per process and thread, so concurrent writers never share it
+    temporary_file = "%s.%d.%d.tmp" % (output_file, os.getpid(), threading.get_ident())
+    try:
+        with open(temporary_file, "wb") as f:
+            f.write(data)
+        os.replace(temporary_file, output_file)
+    except BaseException:
+        if os.path.exists(temporary_file):
+            os.remove(temporary_file)
+        raise
+
+
+def translate_directory(
+    predict,
+    input_dir,
+    output_dir,
+    batch_size=8,
+    input_img_size=(256, 256, 3),
+    keep_size=False,
+    num_decoders=4,
+    num_writers=4,
+    queue_size=64,
+    output_format="png",
+    resume=True,
+    cache=None,
+    key_fn=None,
+):
+    """Translates every image below `input_dir` into `output_dir`.
+    Args:
+        predict: Callable mapping a list of normalized `[height, width, 3]`
+        images to their translations.
+        batch_size(int): Number of images per generator call.
+        input_img_size(tuple): Size images are resized to before translation,
+        or None to translate them at their native resolution.
+        keep_size(bool): Resize translations back to each input's size.
+        num_decoders(int): Threads reading and decoding images.
+        num_writers(int): Threads encoding and writing translations.
+        queue_size(int): Capacity of the queues between the stages.
+        resume(bool): Skip images whose output already exists.
+        cache: `ResultCache` of encoded translations, looked up before and
+        filled after translation.
+        key_fn: Callable mapping the bytes of an input file to its cache key.
+    Returns:
+        A summary with the image counts, throughput and per-stage utilization.
+    """
+    pending, skipped, collisions = pending_images(input_dir, output_dir, output_format, resume)
+
+    if is_shard_dir(input_dir):
+        # Read the shards front to back on one thread, handing the bytes to the decoders
+        paths = queue.Queue(maxsize=queue_size)
+        output_files = dict(pending)
+
+        def reader():
+            try:
+                for split in read_index(input_dir)["splits"]:
+                    for shard_file in shard_paths(input_dir, split):
+                        for name, data in iter_shard_members(shard_file):
+                            path = os.path.join(input_dir, name)
+                            if path in output_files:
+                                paths.put((path, output_files[path], data))
+            except Exception as e:
+                # The images after a shard that cannot be read are not translated
+                failed.append((input_dir, str(e)))
+            finally:
+                # Lets the decoders finish even when a shard cannot be read
+                for _ in range(num_decoders):
+                    paths.put(_END)
+
+        producers = [threading.Thread(target=reader, daemon=True)]
+    else:
+        paths = queue.Queue()
+        for path, output_file in pending:
+            paths.put((path, output_file, None))
+        for _ in range(num_decoders):
+            paths.put(_END)
+        producers = []
+    decoded = queue.Queue(maxsize=queue_size)
+    translated = queue.Queue(maxsize=queue_size)
+
+    decode_timer = StageTimer(num_decoders)
+    inference_timer = StageTimer(1)
+    write_timer = StageTimer(num_writers)
+    failed = list(collisions)
+    cached = []
+
+    def decoder():
+        try:
+            while True:
+                item = paths.get()
+                if item is _END:
+                    return
+                path, output_file, data = item
+                start = time.perf_counter()
+                try:
+                    data = tf.io.read_file(path) if data is None else tf.constant(data)
+                    key = key_fn(data.numpy()) if cache is not None else None
+                    cached_data = cache.get(key) if cache is not None else None
+                    if cached_data is None:
+                        img = tf.io.decode_image(data, channels=3, expand_animations=False)
+                        original_size = tuple(img.shape[:2])
+                        if input_img_size is not None:
+                            img = tf.image.resize(img, input_img_size[:2])
+                        img = normalize_img(img)
+                except Exception as e:
+                    failed.append((path, str(e)))
+                    continue
+                finally:
+                    decode_timer.add(time.perf_counter() - start)
+                if cached_data is not None:
+                    # Cache hits skip the generator and go straight to the writers
+                    cached.append(path)
+                    translated.put((cached_data, output_file, None, None))
+                else:
+                    decoded.put((path, img, output_file, original_size if keep_size and input_img_size is not None else None, key))
+        finally:
+            # Always tell the main thread this decoder is done, or it waits forever
+            decoded.put(_END)
+
+    def writer():
+        while True:
+            item = translated.get()
+            if item is _END:
+                return
+            img, output_file, original_size, key = item
+            start = time.perf_counter()
+            try:
+                if isinstance(img, bytes):
+                    data = img
+                else:
+                    data = encode_translation(img, output_file, original_size)
+                    if cache is not None:
+                        cache.put(key, data)
+                write_file_atomically(data, output_file)
+            except Exception as e:
+                # A dead writer would leave the bounded queue full and block the main thread
+                failed.append((output_file, str(e)))
+            write_timer.add(time.perf_counter() - start)
+
+    start_time = time.perf_counter()
+    threads = producers + [threading.Thread(target=decoder, daemon=True) for _ in range(num_decoders)]
+    threads += [threading.Thread(target=writer, daemon=True) for _ in range(num_writers)]
+    for thread in threads:
+        thread.start()
+
+    # Batch decoded images and translate them on the main thread
+    finished_decoders = 0
+    num_translated = 0
+    while finished_decoders < num_decoders:
+        batch = []
+        while len(batch) < batch_size and finished_decoders < num_decoders:
+            item = decoded.get()
+            if item is _END:
+                finished_decoders += 1
+            else:
+                batch.append(item)
+        if not batch:
+            continue
+        start = time.perf_counter()
+        try:
+            predictions = [np.asarray(prediction) for prediction in predict([img for _, img, _, _, _ in batch])]
+        except Exception as e:
+            # A failing batch (e.g. out of memory) fails its images, not the whole run
+            failed.extend((path, str(e)) for path, _, _, _, _ in batch)
+            continue
+        finally:
+            inference_timer.add(time.perf_counter() - start)
+        for prediction, (_, _, output_file, original_size, key) in zip(predictions, batch):
+            translated.put((prediction, output_file, original_size, key))
+        num_translated += len(batch)
+
+    for _ in range(num_writers):
+        translated.put(_END)
+    for thread in threads:
+        thread.join()
+    wall_time = time.perf_counter() - start_time
+
+    return {
+        "translated": num_translated,
+        "cached": len(cached),
+        "skipped": skipped,
+        "failed": failed,
+        "seconds": wall_time,
+        "images_per_second": (num_translated + len(cached)) / max(wall_time, 1e-9),
+        "utilization": {
+            "decode": decode_timer.utilization(wall_time),
+            "inference": inference_timer.utilization(wall_time),
+            "write": write_timer.utilization(wall_time),
+        },
+    }
+
+
+def format_summary(summary):
+    lines = [
+        "Translated %d images and copied %d cached ones in %.1f s (%.2f images/sec), skipped %d existing, %d failed"
+        % (
+            summary["translated"],
+            summary["cached"],
+            summary["seconds"],
+            summary["images_per_second"],
+            summary["skipped"],
+            len(summary["failed"]),
+        )
+    ]
+    for stage, utilization in summary["utilization"].items():
+        lines.append("%-10s %6.1f%% utilization" % (stage, utilization * 100.0))
+    for path, error in summary["failed"]:
+        lines.append("failed: %s (%s)" % (path, error.splitlines()[0] if error else ""))
+    return "\n".join(lines)
@@ -0,0 +1,172 @@
+"""
+## Content-addressed cache of translated images
+Retries, duplicate uploads and re-runs keep translating the same inputs. The
+cache stores encoded translations under a hash of everything that determines
+them:
+```
+sha256(input bytes, weights fingerprint, direction, resolution, output format)
+```
+The weights fingerprint hashes the generator variables, so entries of an
+older checkpoint are never returned for a new one; they simply stop being
+used and are evicted.
+
+Entries live in two tiers: an in-memory LRU bounded in bytes, and an
+optional on-disk tier bounded in bytes that evicts the least recently used
+files. Disk hits are promoted to the memory tier.
+"""
+import collections
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+
+def weights_fingerprint(generator):
+    """Hashes the variables of a Keras generator or an `ExportedGenerator`.
+    Both list the variables in the same order, so an export has the same
+    fingerprint as the checkpoint it was exported from.
+    """
+    if hasattr(generator, "module"):
+        variables = generator.module.generator_variables
+    else:
+        variables = generator.variables
+    digest = hashlib.sha256()
+    for variable in variables:
+        digest.update(np.ascontiguousarray(variable.numpy()).tobytes())
+    return digest.hexdigest()
+
+
+def resolution_key(input_img_size=None, bucket=None):
+    # The translation size, or the bucket padding of native resolution translations, changes the output
+    if input_img_size is None:
+        return "native-%s" % bucket
+    return "%dx%d" % tuple(input_img_size[:2])
+
+
+def cache_key(data, fingerprint, direction, resolution, output_format="png"):
+    digest = hashlib.sha256(data)
+    for part in (fingerprint, direction, resolution, output_format):
+        digest.update(b"\0" + str(part).encode("utf8"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Two tier cache of encoded translations, safe to share between threads.
+    Args:
+        memory_bytes(int): Capacity of the in-memory tier, 0 disables it.
+        disk_dir(str): Folder of the on-disk tier, None disables it.
+        disk_bytes(int): Capacity of the on-disk tier.
+    """
+
+    def __init__(self, memory_bytes=256 * 2 ** 20, disk_dir=None, disk_bytes=2 ** 30):
+        self.memory_bytes = memory_bytes
+        self.disk_dir = disk_dir
+        self.disk_bytes = disk_bytes
+        self.lock = threading.Lock()
+        self.memory = collections.OrderedDict()
+        self.memory_size = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        self.disk_size = 0
+        if disk_dir is not None:
+            os.makedirs(disk_dir, exist_ok=True)
+            self.disk_size = sum(os.path.getsize(path) for path in self.disk_files())
+
+    def disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key)
+
+    def disk_files(self):
+        for r, d, f in os.walk(self.disk_dir):
+            for file in f:
+                if not file.endswith(".tmp"):
+                    yield os.path.join(r, file)
+
+    def get(self, key):
+        """Returns the cached bytes of `key`, or None."""
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return self.memory[key]
+        data = self.read_disk(key)
+        with self.lock:
+            self.stats["disk_hits" if data is not None else "misses"] += 1
+        if data is not None:
+            self.put_memory(key, data)
+        return data
+
+    def put(self, key, data):
+        self.put_memory(key, data)
+        self.write_disk(key, data)
+
+    def put_memory(self, key, data):
+        if len(data) > self.memory_bytes:
+            return
+        with self.lock:
+            if key in self.memory:
+                return
+            self.memory[key] = data
+            self.memory_size += len(data)
+            while self.memory_size > self.memory_bytes:
+                _, evicted = self.memory.popitem(last=False)
+                self.memory_size -= len(evicted)
+
+    def read_disk(self, key):
+        if self.disk_dir is None:
+            return None
+        path = self.disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # Eviction goes by modification time, so touch the file to mark it recently used
+            os.utime(path)
+            return data
+        except OSError:
+            return None
+
+    def write_disk(self, key, data):
+        if self.disk_dir is None or len(data) > self.disk_bytes:
+            return
+        path = self.disk_path(key)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_file = "%s.%d.tmp" % (path, threading.get_ident())
+        with open(temporary_file, "wb") as f:
+            f.write(data)
+        os.replace(temporary_file, path)
+        with self.lock:
+            self.disk_size += len(data)
+            if self.disk_size > self.disk_bytes:
+                self.evict_disk()
+
+    def evict_disk(self):
+        # Remove the least recently used files until the tier is back to 90% of its capacity
+        files = []
+        for path in self.disk_files():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        self.disk_size = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if self.disk_size <= 0.9 * self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.disk_size -= size
+            self.stats["evictions"] += 1
+
+    def snapshot(self):
+        with self.lock:
+            lookups = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["misses"]
+            return dict(
+                self.stats,
+                hit_rate=(lookups - self.stats["misses"]) / max(lookups, 1),
+                memory_mb=self.memory_size / 2 ** 20,
+                memory_entries=len(self.memory),
+                disk_mb=self.disk_size / 2 ** 20,
+            )
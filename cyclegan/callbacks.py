@@ -0,0 +1,209 @@
+"""
+## Training callbacks
+"""
+import json
+import os
+import time
+
+import numpy as np
+from tensorflow import keras
+
+from cyclegan.memory import MB, MemoryMeter
+from cyclegan.plotting import plot_translations
+from cyclegan.snapshots import save_delta_checkpoint, save_generator_snapshot
+
+
+class GANMonitor(keras.callbacks.Callback):
+    """A callback to generate and save images after every interval epoch
+    Args:
+        test_dataset: Batched dataset of source domain images to translate.
+        model_save_path(str): Folder where samples and weights are saved.
+        interval(int): How many epochs between saving the model.
+        num_img(int): How many samples to plot.
+        show(bool): Whether to also display the sample figure.
+        checkpoint_format(str): "full" saves every network as float32, "delta"
+        only saves a full base every `base_interval` epochs and compressed
+        differences from it in between (see `cyclegan.snapshots`).
+        base_interval(int): How many epochs between full base checkpoints.
+        generator_snapshots(bool): Also save compact float16 generators.
+    """
+
+    def __init__(
+        self,
+        test_dataset,
+        model_save_path,
+        interval=1,
+        num_img=4,
+        show=True,
+        checkpoint_format="full",
+        base_interval=10,
+        generator_snapshots=False,
+    ):
+        super(GANMonitor, self).__init__()
+        self.test_dataset = test_dataset
+        self.model_save_path = model_save_path
+        self.interval = interval
+        self.num_img = num_img
+        self.show = show
+        self.checkpoint_format = checkpoint_format
+        self.base_interval = base_interval
+        self.generator_snapshots = generator_snapshots
+        self.base_epoch = None
+
+    def on_epoch_end(self, epoch, logs=None):
+        offset_epoch = epoch + 1
+        if(offset_epoch % self.interval == 0):
+            # Perform inference on random points from the test dataset
+            plot_translations(
+                self.model.gen_G,
+                self.test_dataset,
+                num_img=self.num_img,
+                title="Epoch: " + str(offset_epoch),
+                save_path=os.path.join(self.model_save_path, "epoch_%d.png" % offset_epoch),
+                show=self.show,
+                figsize=(12, 12),
+            )
+            self.save_checkpoint(offset_epoch)
+
+    def save_checkpoint(self, epoch):
+        model_path = os.path.join(self.model_save_path, "model_" + str(epoch) + ".h5")
+        if self.checkpoint_format == "delta" and self.base_epoch is not None and epoch - self.base_epoch < self.base_interval:
+            base_path = os.path.join(self.model_save_path, "model_" + str(self.base_epoch) + ".h5")
+            save_delta_checkpoint(self.model, model_path, base_path)
+        else:
+            self.model.save_weights(model_path)
+            self.base_epoch = epoch
+        if self.generator_snapshots:
+            save_generator_snapshot(self.model, os.path.join(self.model_save_path, "generators_" + str(epoch) + "_fp16.h5"))
+
+
+class DiscriminatorUpdateTimer(keras.callbacks.Callback):
+    """Estimates the training time saved by skipped discriminator updates.
+    Step times are fitted against the number of discriminators each step
+    updated, read from the `D_X_update` and `D_Y_update` trackers of a
+    scheduled `CycleGan`. The cost of one update times the skipped updates is
+    logged as `D_saved_s` every epoch and printed at the end of training.
+    """
+
+    def on_train_begin(self, logs=None):
+        self.durations = []
+        self.updates = []
+        self.traced = False
+
+    def on_epoch_begin(self, epoch, logs=None):
+        # fit() resets the trackers of the model before every epoch
+        self.update_total = self.read_update_total()
+
+    def read_update_total(self):
+        # The logs hold the update rates of the epoch so far, the trackers count the updates
+        return float(self.model.disc_X_update_tracker.total.numpy() + self.model.disc_Y_update_tracker.total.numpy())
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self.start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        duration = time.perf_counter() - self.start
+        logs = logs or {}
+        updates = 2.0
+        if "D_X_update" in logs:
+            update_total = self.read_update_total()
+            updates = update_total - self.update_total
+            self.update_total = update_total
+        if not self.traced:
+            # The first step traces the train function
+            self.traced = True
+            return
+        self.durations.append(duration)
+        self.updates.append(updates)
+
+    def summary(self):
+        updates = np.array(self.updates)
+        durations = np.array(self.durations)
+        skipped = 2 * len(updates) - updates.sum()
+        update_s = None
+        if len(np.unique(updates)) > 1:
+            # Slope of the step time over the number of updates
+            update_s = max(float(np.polyfit(updates, durations, 1)[0]), 0.0)
+        return {
+            "steps": len(updates),
+            "skipped_updates": int(skipped),
+            "train_s": float(durations.sum()),
+            "update_s": update_s,
+            "saved_s": None if update_s is None else update_s * skipped,
+        }
+
+    def on_epoch_end(self, epoch, logs=None):
+        summary = self.summary()
+        if logs is not None and summary["saved_s"] is not None:
+            logs["D_saved_s"] = summary["saved_s"]
+
+    def on_train_end(self, logs=None):
+        summary = self.summary()
+        if summary["saved_s"] is None:
+            print("Skipped %d of %d discriminator updates" % (summary["skipped_updates"], 2 * summary["steps"]))
+            return
+        print(
+            "Skipped %d of %d discriminator updates (%.1f ms each), saving about %.1f s of %.1f s"
+            % (
+                summary["skipped_updates"],
+                2 * summary["steps"],
+                summary["update_s"] * 1000.0,
+                summary["saved_s"],
+                summary["train_s"] + summary["saved_s"],
+            )
+        )
+
+
+class MemoryProfiler(keras.callbacks.Callback):
+    """Records the peak memory of every training step.
+    The peak RSS and allocator bytes of each step are appended to `log_path`
+    as JSON lines, logged as `peak_rss_mb` and `peak_allocator_mb` every
+    epoch, and the largest peaks are printed at the end of training. The
+    allocator is only measured on GPUs, `peak_allocator_mb` is not logged
+    elsewhere.
+    """
+
+    def __init__(self, log_path=None, device=None):
+        super(MemoryProfiler, self).__init__()
+        self.log_path = log_path
+        self.meter = MemoryMeter(device)
+
+    def on_train_begin(self, logs=None):
+        self.epoch = 0
+        self.peaks = {"peak_rss": 0, "peak_allocator": None}
+        self.epoch_peaks = dict(self.peaks)
+        self.log_file = open(self.log_path, "a") if self.log_path else None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch = epoch + 1
+        self.epoch_peaks = {"peak_rss": 0, "peak_allocator": None}
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self.meter.reset()
+        self.start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        memory = dict(self.meter.read(), seconds=time.perf_counter() - self.start)
+        for key in self.peaks:
+            if memory[key] is None:
+                continue
+            self.peaks[key] = max(self.peaks[key] or 0, memory[key])
+            self.epoch_peaks[key] = max(self.epoch_peaks[key] or 0, memory[key])
+        if self.log_file is not None:
+            self.log_file.write(json.dumps(dict(memory, epoch=self.epoch, step=batch)) + "\n")
+
+    def on_epoch_end(self, epoch, logs=None):
+        if logs is not None:
+            logs["peak_rss_mb"] = self.epoch_peaks["peak_rss"] / MB
+            if self.epoch_peaks["peak_allocator"] is not None:
+                logs["peak_allocator_mb"] = self.epoch_peaks["peak_allocator"] / MB
+        if self.log_file is not None:
+            self.log_file.flush()
+
+    def on_train_end(self, logs=None):
+        if self.log_file is not None:
+            self.log_file.close()
+        allocator = "allocator unavailable"
+        if self.peaks["peak_allocator"] is not None:
+            allocator = "%.1f MB allocator" % (self.peaks["peak_allocator"] / MB)
+        print("Peak memory of a training step: %.1f MB RSS, %s on %s" % (self.peaks["peak_rss"] / MB, allocator, self.meter.device))
@@ -0,0 +1,932 @@
+"""
+## Command line interface
+Every command imports TensorFlow and builds networks only once it runs, and
+only builds the networks it needs, so `python -m cyclegan --help` is instant
+and a one-direction translation never builds the discriminators or the other
+generator.
+
+Usage:
+    python -m cyclegan translate --model_path model_27.h5 --direction A2B --output_dir out img.jpg
+    python -m cyclegan preview --model_path model_27.h5 --input_path trainA --output_path trainB
+    python -m cyclegan train --input_path trainA --output_path trainB --model_save_path results
+"""
+import argparse
+import os
+import sys
+
+from cyclegan.backends import BACKENDS, DEFAULT_BACKEND
+from cyclegan.variants import DEFAULT_VARIANT, GENERATOR_VARIANTS
+
+
+def add_size_argument(parser, name, default, help):
+    parser.add_argument(name, type=int, nargs=2, default=default, metavar=("HEIGHT", "WIDTH"), help=help)
+
+
+def add_bucket_argument(parser):
+    parser.add_argument(
+        "--bucket", type=int, default=64, help="Images translated at their original size are padded to multiples of this size"
+    )
+
+
+def add_backend_argument(parser):
+    parser.add_argument(
+        "--backend", choices=BACKENDS, default=DEFAULT_BACKEND, help="How H5 generators are run (see the benchmark command)"
+    )
+
+
+def add_compile_cache_argument(parser):
+    parser.add_argument(
+        "--compile_cache_dir",
+        default=os.path.join(os.path.expanduser("~"), ".cache", "cyclegan", "compiled"),
+        help="Folder where traced generator graphs are kept across runs (empty to disable)",
+    )
+
+
+def translate(args):
+    from cyclegan.data import read_image, write_image
+
+    # Generators are fully convolutional, so only resize if asked to
+    input_img_size = None if args.size is None else (*args.size, 3)
+    predict, _ = load_list_predict(args, args.direction, input_img_size)
+    os.makedirs(args.output_dir, exist_ok=True)
+    for path in args.images:
+        img = read_image(path, input_img_size)
+        prediction = predict([img[0]])[0]
+        output_file = os.path.join(args.output_dir, os.path.splitext(os.path.basename(path))[0] + ".png")
+        write_image(prediction, output_file)
+        print(path, "->", output_file)
+
+
+def preview(args):
+    directions = ["A2B", "B2A"] if args.direction == "both" else [args.direction]
+    check_dataset_arguments(args, directions)
+
+    from cyclegan.data import load_datasets, sample_dataset, test_pipeline
+    from cyclegan.models import load_generator
+    from cyclegan.plotting import plot_translations
+
+    input_img_size = (*args.size, 3)
+    if args.dataset_name is not None:
+        # TensorFlow Datasets decode lazily, so only the shuffle buffer is decoded
+        _, _, test_src, test_dst = load_datasets(True, args.dataset_name)
+    for direction in directions:
+        if args.dataset_name is not None:
+            dataset = (test_src if direction == "A2B" else test_dst).shuffle(4 * args.num_img, seed=args.seed)
+            dataset = test_pipeline(dataset.take(args.num_img), batch_size=1, input_img_size=input_img_size)
+        else:
+            # Pick random file paths first and decode only those
+            folder = args.input_path if direction == "A2B" else args.output_path
+            dataset = sample_dataset(folder, args.num_img, input_img_size, args.seed)
+        plot_translations(
+            load_generator(args.model_path, direction, input_img_size),
+            dataset,
+            num_img=args.num_img,
+            save_path=os.path.join(args.results_save_path, "generated_sample_%s.png" % direction),
+            show=args.show,
+        )
+
+
+def train(args):
+    check_dataset_arguments(args)
+
+    import tensorflow as tf
+
+    from cyclegan.callbacks import DiscriminatorUpdateTimer, GANMonitor, MemoryProfiler
+    from cyclegan.data import load_datasets, test_pipeline, train_pipeline, validation_pipeline
+    from cyclegan.models import build_cycle_gan
+    from cyclegan.shards import has_test_split, is_shard_dir
+    from cyclegan.variants import generator_config
+
+    input_img_size = (*args.input_img_size, 3)
+    train_src, train_dst, test_src, test_dst = load_datasets(
+        args.dataset_name is not None, args.dataset_name, args.input_path, args.output_path, args.validation_split
+    )
+    # Shard folders are streamed, each epoch reads the shards in a new order through the shuffle buffer
+    cache = not is_shard_dir(args.input_path)
+    validation_freq = args.validation_freq
+    if validation_freq and not cache and not (has_test_split(args.input_path) and has_test_split(args.output_path)):
+        # Their test sets would be the training images
+        print("Skipping validation: write test shards with shard --validation_split to validate on held-out images")
+        validation_freq = 0
+    train_src = train_pipeline(train_src, args.batch_size, args.dataset_dimensions, input_img_size, args.crops_per_image, cache)
+    train_dst = train_pipeline(train_dst, args.batch_size, args.dataset_dimensions, input_img_size, args.crops_per_image, cache)
+    validation_data = validation_pipeline(test_src, test_dst, args.validation_batch_size, input_img_size, cache)
+    test_src = test_pipeline(test_src, args.batch_size, input_img_size, cache)
+
+    cycle_gan_model = build_cycle_gan(
+        input_img_size,
+        generator_config(args.generator, args.width_multiplier),
+        disc_update_interval=args.disc_update_interval,
+        disc_loss_threshold=args.disc_loss_threshold,
+    )
+    # If pretraining mode is enabled then load weights from pretrained model before starting the training process
+    if args.pretrained_model_path:
+        cycle_gan_model.built = True
+        cycle_gan_model.load_weights(args.pretrained_model_path)
+
+    os.makedirs(args.model_save_path, exist_ok=True)
+    plotter = GANMonitor(
+        test_src,
+        args.model_save_path,
+        interval=args.interval,
+        show=False,
+        checkpoint_format=args.checkpoint_format,
+        base_interval=args.base_interval,
+        generator_snapshots=args.generator_snapshots,
+    )
+    callbacks = [plotter]
+    if args.disc_update_interval > 1 or args.disc_loss_threshold:
+        callbacks.append(DiscriminatorUpdateTimer())
+    if args.profile_memory:
+        callbacks.append(MemoryProfiler(os.path.join(args.model_save_path, "memory.jsonl")))
+    cycle_gan_model.fit(
+        tf.data.Dataset.zip((train_src, train_dst)),
+        epochs=args.epochs,
+        callbacks=callbacks,
+        validation_data=validation_data if validation_freq else None,
+        validation_freq=validation_freq or 1,
+    )
+
+
+def profile(args):
+    from cyclegan.memory import activation_report, default_memory_device, format_activation_report, format_memory_profile, profile_memory
+    from cyclegan.models import build_cycle_gan, read_generator_config
+    from cyclegan.variants import generator_config
+
+    input_img_size = (*args.input_img_size, 3)
+    # Memory does not depend on the weights, only on the architecture
+    config = read_generator_config(args.model_path) if args.model_path else generator_config(args.generator, args.width_multiplier)
+    device = default_memory_device()
+    size = "%dx%d" % tuple(args.input_img_size)
+    modes = ["inference", "train"] if args.mode == "both" else [args.mode]
+    for mode in modes:
+        results = profile_memory(mode, args.batch_sizes, input_img_size, config, args.steps, not args.in_process)
+        title = "Training steps at %s" % size if mode == "train" else "Inference with gen_G at %s" % size
+        print(format_memory_profile(results, title, args.memory_budget_mb, device))
+        print()
+    if "train" in modes:
+        print(format_activation_report(activation_report(build_cycle_gan(input_img_size, config), max(args.batch_sizes)), args.top_layers))
+
+
+def sweep(args):
+    from cyclegan.sweep import format_sweep_results, is_ranking_metric, prepare_dataset_cache, run_sweep, sweep_trials
+
+    # Checked before the dataset cache is prepared
+    if not is_ranking_metric(args.metric):
+        args.parser.error("--metric must be a validation loss starting with val_, e.g. val_cycle_l1")
+
+    space = {
+        "lambda_cycle": args.lambda_cycle,
+        "lambda_identity": args.lambda_identity,
+        "learning_rate": args.learning_rate,
+        "generator": args.generator,
+        "width_multiplier": args.width_multiplier,
+    }
+    trials = sweep_trials(space, args.num_trials, args.seed)
+    input_img_size = (*args.input_img_size, 3)
+    dataset_dir = prepare_dataset_cache(
+        args.input_path,
+        args.output_path,
+        args.dataset_cache_dir or os.path.join(args.sweep_dir, "dataset"),
+        args.dataset_dimensions,
+        input_img_size,
+        args.validation_split,
+    )
+    settings = {
+        "batch_size": args.batch_size,
+        "crops_per_image": args.crops_per_image,
+        "dataset_dimensions": args.dataset_dimensions,
+        "input_img_size": input_img_size,
+        "validation_batch_size": args.validation_batch_size,
+    }
+    print("Sweeping %d trials" % len(trials))
+    results = run_sweep(
+        trials,
+        dataset_dir,
+        args.sweep_dir,
+        settings,
+        args.min_epochs,
+        args.max_epochs,
+        args.reduction_factor,
+        args.metric,
+        args.num_workers,
+        args.threads_per_trial,
+    )
+    print(format_sweep_results(results, args.metric))
+
+
+def distill(args):
+    import tensorflow as tf
+
+    from cyclegan.comparison import compare_generators, format_comparison
+    from cyclegan.data import image_folder_dataset, test_pipeline, train_pipeline
+    from cyclegan.distill import distill_generator
+    from cyclegan.models import save_network_weights
+    from cyclegan.variants import generator_config
+
+    input_img_size = (*args.input_img_size, 3)
+    source_folder, target_folder = domain_folders(args, args.direction)
+    # The student learns from the teacher's translations of the source domain
+    source = image_folder_dataset(source_folder)
+    dataset = source.concatenate(image_folder_dataset(target_folder)) if args.both_domains else source
+
+    config = generator_config(args.student, args.width_multiplier)
+    teacher, student = distill_generator(
+        args.teacher_model_path,
+        config,
+        train_pipeline(dataset, args.batch_size, args.dataset_dimensions, input_img_size, cache=False),
+        direction=args.direction,
+        input_img_size=input_img_size,
+        epochs=args.epochs,
+        learning_rate=args.learning_rate,
+        lambda_pixel=args.lambda_pixel,
+        lambda_feature=args.lambda_feature,
+    )
+    save_network_weights([student], args.student_model_path, config)
+    print("Saved student generator to", args.student_model_path)
+
+    report = compare_generators(
+        tf.function(lambda img: teacher(img, training=False)),
+        tf.function(lambda img: student(img, training=False)),
+        test_pipeline(source.take(args.num_eval), batch_size=1, input_img_size=input_img_size),
+    )
+    print(format_comparison(report, "teacher", "student"))
+
+
+def domain_folders(args, direction):
+    # Source and target domain folders of a translation direction
+    if direction == "A2B":
+        return args.input_path, args.output_path
+    return args.output_path, args.input_path
+
+
+def quantize(args):
+    import tensorflow as tf
+
+    from cyclegan.comparison import compare_generators, format_comparison
+    from cyclegan.data import image_folder_dataset, test_pipeline
+    from cyclegan.models import load_generator
+    from cyclegan.quantize import TFLiteGenerator, export_int8_generator
+
+    input_img_size = (*args.size, 3)
+    directions = ["A2B", "B2A"] if args.direction == "both" else [args.direction]
+    check_dataset_arguments(args, directions)
+    for direction in directions:
+        source_folder, _ = domain_folders(args, direction)
+        generator = load_generator(args.model_path, direction, input_img_size)
+        export_path = os.path.join(args.export_dir, generator.name + "_int8.tflite")
+        export_int8_generator(
+            generator,
+            source_folder,
+            export_path,
+            input_img_size,
+            num_samples=args.num_calibration,
+            allow_float_fallback=args.allow_float_fallback,
+        )
+
+        # Compare the int8 model with the float model on CPU
+        report = compare_generators(
+            tf.function(lambda img: generator(img, training=False)),
+            TFLiteGenerator(export_path, num_threads=args.num_threads),
+            test_pipeline(image_folder_dataset(source_folder).take(args.num_eval), batch_size=1, input_img_size=input_img_size),
+        )
+        float_size = sum(weight.numpy().nbytes for weight in generator.weights)
+        print(direction, "->", export_path)
+        print(format_comparison(report, "float32", "int8"))
+        print("%-12s %10.2f MB -> %.2f MB" % ("size", float_size / 2 ** 20, os.path.getsize(export_path) / 2 ** 20))
+
+
+def prune(args):
+    import math
+
+    import tensorflow as tf
+
+    from cyclegan.comparison import compare_generators, format_comparison
+    from cyclegan.data import count_images, image_folder_dataset, test_pipeline, train_pipeline
+    from cyclegan.models import build_cycle_gan, load_generator, read_generator_config, save_network_weights
+    from cyclegan.prune import ChannelPruning, prune_generator
+    from cyclegan.shards import is_shard_dir
+
+    input_img_size = (*args.input_img_size, 3)
+    config = read_generator_config(args.model_path)
+    cycle_gan_model = build_cycle_gan(input_img_size, config)
+    cycle_gan_model.built = True
+    cycle_gan_model.load_weights(args.model_path)
+
+    # Shard folders are streamed instead of cached
+    src, dst = image_folder_dataset(args.input_path, 0), image_folder_dataset(args.output_path, 1)
+    train_src = train_pipeline(src, args.batch_size, args.dataset_dimensions, input_img_size, cache=not is_shard_dir(args.input_path))
+    train_dst = train_pipeline(dst, args.batch_size, args.dataset_dimensions, input_img_size, cache=not is_shard_dir(args.output_path))
+    dataset = tf.data.Dataset.zip((train_src, train_dst))
+
+    # Reach the target sparsity after `pruning_epochs` and fine-tune at that sparsity for the remaining epochs
+    steps_per_epoch = args.steps_per_epoch or int(tf.data.experimental.cardinality(dataset))
+    if steps_per_epoch < 0:
+        # Streamed shards have no known length, count their images in the index instead
+        steps_per_epoch = math.ceil(min(count_images(args.input_path), count_images(args.output_path)) / args.batch_size)
+    pruning = ChannelPruning(
+        args.target_sparsity,
+        end_step=steps_per_epoch * min(args.pruning_epochs, args.epochs),
+        frequency=args.frequency,
+    )
+    cycle_gan_model.fit(dataset, epochs=args.epochs, callbacks=[pruning])
+
+    gen_G, pruned_config = prune_generator(cycle_gan_model.gen_G, config)
+    gen_F, _ = prune_generator(cycle_gan_model.gen_F, config)
+    save_network_weights([gen_G, gen_F], args.pruned_model_path, pruned_config)
+    print("Saved pruned generators to", args.pruned_model_path)
+    print("Residual block widths:", pruned_config["residual_filters"])
+
+    dense = load_generator(args.model_path, "A2B", input_img_size)
+    report = compare_generators(
+        tf.function(lambda img: dense(img, training=False)),
+        tf.function(lambda img: gen_G(img, training=False)),
+        test_pipeline(image_folder_dataset(args.input_path).take(args.num_eval), batch_size=1, input_img_size=input_img_size),
+    )
+    print(format_comparison(report, "dense", "pruned"))
+    print("%-12s %10s -> %s" % ("parameters", "{:,}".format(dense.count_params()), "{:,}".format(gen_G.count_params())))
+
+
+def export(args):
+    from cyclegan.export import export_generator
+
+    directions = ["A2B", "B2A"] if args.direction == "both" else [args.direction]
+    for direction in directions:
+        print(direction, "->", export_generator(args.model_path, args.export_dir, direction))
+
+
+def shard(args):
+    from cyclegan.shards import write_shards
+
+    index = write_shards(args.input_dir, args.output_dir, args.shard_size_mb, args.validation_split, args.seed)
+    for split, shards in index["splits"].items():
+        print("%s: %d images in %d shards" % (split, sum(len(shard["members"]) for shard in shards), len(shards)))
+
+
+def load_list_predict(args, direction, input_img_size):
+    """Loads one generator as a callable mapping a list of normalized images to their translations.
+    Returns:
+        The callable and the generator it runs.
+    """
+    from cyclegan.translator import load_translation_fn
+
+    return load_translation_fn(
+        direction, args.model_path, args.export_dir, input_img_size, args.bucket, args.backend, args.compile_cache_dir
+    )
+
+
+def add_cache_arguments(parser):
+    parser.add_argument(
+        "--memory_cache_mb", type=float, default=256, help="Capacity of the in-memory result cache, 0 disables it"
+    )
+    parser.add_argument("--cache_dir", help="Folder of the on-disk result cache (default: no disk cache)")
+    parser.add_argument("--disk_cache_mb", type=float, default=1024, help="Capacity of the on-disk result cache")
+
+
+def make_cache(args):
+    from cyclegan.cache import ResultCache
+
+    if not args.memory_cache_mb and args.cache_dir is None:
+        return None
+    return ResultCache(int(args.memory_cache_mb * 2 ** 20), args.cache_dir, int(args.disk_cache_mb * 2 ** 20))
+
+
+def make_key_fn(generator, direction, resolution, output_format):
+    from cyclegan.cache import cache_key, weights_fingerprint
+
+    fingerprint = weights_fingerprint(generator)
+    return lambda data: cache_key(data, fingerprint, direction, resolution, output_format)
+
+
+def batch(args):
+    from cyclegan.batch import format_summary, translate_directory
+    from cyclegan.cache import resolution_key
+
+    input_img_size = None if args.size is None else (*args.size, 3)
+    predict, generator = load_list_predict(args, args.direction, input_img_size)
+    cache = make_cache(args)
+    resolution = resolution_key(input_img_size, args.bucket) + ("-keep" if args.keep_size else "")
+    summary = translate_directory(
+        predict,
+        args.input_dir,
+        args.output_dir,
+        batch_size=args.batch_size,
+        input_img_size=input_img_size,
+        keep_size=args.keep_size,
+        num_decoders=args.num_decoders,
+        num_writers=args.num_writers,
+        queue_size=args.queue_size,
+        output_format=args.format,
+        resume=not args.overwrite,
+        cache=cache,
+        key_fn=make_key_fn(generator, args.direction, resolution, args.format) if cache is not None else None,
+    )
+    print(format_summary(summary))
+    if cache is not None:
+        print("cache:", cache.snapshot())
+
+
+def tile(args):
+    from cyclegan.tiling import open_source, translate_tiled
+    from cyclegan.translator import load_translation_fn
+
+    # Opened first, images too large to decode are rejected before the model is loaded
+    max_decode_bytes = args.max_decode_mb * 2 ** 20 if args.max_decode_mb else None
+    source = open_source(args.image, args.scratch_dir, max_decode_bytes)
+    # Tiles are all the same size, so a bucket of 4 only pads the last, smaller tiles of small images
+    predict, _ = load_translation_fn(
+        args.direction,
+        args.model_path,
+        args.export_dir,
+        bucket=4,
+        backend=args.backend,
+        compile_cache_dir=args.compile_cache_dir,
+    )
+    summary = translate_tiled(
+        predict,
+        source,
+        args.output,
+        tile_size=args.tile_size,
+        overlap=args.overlap,
+        batch_size=args.batch_size,
+    )
+    print(
+        "Translated %dx%d image as %d tiles in %.1f s (%.2f tiles/sec) -> %s"
+        % (summary["width"], summary["height"], summary["tiles"], summary["seconds"], summary["tiles_per_second"], args.output)
+    )
+
+
+def serve(args):
+    from cyclegan.cache import cache_key, resolution_key
+    from cyclegan.compile_cache import warm_up
+    from cyclegan.service import serve
+
+    directions = ["A2B", "B2A"] if args.direction == "both" else [args.direction]
+    warmup_sizes = args.warmup_size or []
+    # Traced functions take any batch size, XLA compiles every batch size the micro-batches can have
+    warmup_batch_sizes = args.warmup_batch_sizes or (
+        list(range(1, args.max_batch_size + 1)) if args.backend == "xla" else [1]
+    )
+    warm_up_s = 0.0
+    cache = make_cache(args)
+    generators = {}
+    input_img_sizes = {}
+    key_fns = {}
+    reports = {"cache": cache.snapshot} if cache is not None else {}
+    if args.registry:
+        from cyclegan.registry import ModelRegistry, read_registry
+
+        registry = ModelRegistry(
+            read_registry(args.registry), args.max_models_mb, args.bucket, args.backend, args.compile_cache_dir
+        )
+        warm_up_s = registry.preload(args.preload or None, directions, warmup_sizes, warmup_batch_sizes)
+        reports["registry"] = registry.snapshot
+
+        def registry_key_fn(name, direction):
+            resolution = resolution_key(registry.input_img_size(name), args.bucket)
+            return lambda data: cache_key(data, registry.fingerprint(name, direction), direction, resolution)
+
+        for name in registry.names:
+            for direction in directions:
+                route = "%s/%s" % (name, direction)
+                generators[route] = registry.translation_fn(name, direction)
+                input_img_sizes[route] = registry.input_img_size(name)
+                key_fns[route] = registry_key_fn(name, direction)
+    else:
+        input_img_size = None if args.size is None else (*args.size, 3)
+        for direction in directions:
+            generators[direction], generator = load_list_predict(args, direction, input_img_size)
+            input_img_sizes[direction] = input_img_size
+            sizes = warmup_sizes if input_img_size is None else [input_img_size[:2]]
+            warm_up_s += warm_up(generators[direction], sizes, warmup_batch_sizes)
+            if cache is not None:
+                key_fns[direction] = make_key_fn(generator, direction, resolution_key(input_img_size, args.bucket), "png")
+    if warm_up_s:
+        print("Warmed up in %.1f s" % warm_up_s)
+    serve(
+        generators,
+        host=args.host,
+        port=args.port,
+        max_batch_size=args.max_batch_size,
+        max_latency_ms=args.max_latency_ms,
+        input_img_sizes=input_img_sizes,
+        cache=cache,
+        key_fns=key_fns,
+        reports=reports,
+    )
+
+
+def sequence(args):
+    from cyclegan.sequence import format_sequence_summary, translate_sequence
+
+    input_img_size = None if args.size is None else (*args.size, 3)
+    predict, _ = load_list_predict(args, args.direction, input_img_size)
+    summary = translate_sequence(
+        predict,
+        args.input_dir,
+        args.output_dir,
+        threshold=args.threshold,
+        batch_size=args.batch_size,
+        input_img_size=input_img_size,
+        output_format=args.format,
+        num_writers=args.num_writers,
+    )
+    print(format_sequence_summary(summary))
+
+
+def benchmark(args):
+    import tensorflow as tf
+
+    from cyclegan.backends import benchmark_backends, format_backend_results
+    from cyclegan.data import list_image_paths, read_image
+    from cyclegan.models import load_generator
+
+    input_img_size = (*args.size, 3)
+    generator = load_generator(args.model_path, args.direction, input_img_size)
+    num_images = args.batch_size * args.num_batches
+    if args.input_path:
+        images = [read_image(path, input_img_size)[0] for path in list_image_paths(args.input_path)[:num_images]]
+    else:
+        images = list(tf.random.uniform((num_images, *input_img_size), -1.0, 1.0, seed=0))
+    batches = [tf.stack(images[i : i + args.batch_size]) for i in range(0, len(images), args.batch_size)]
+    results = benchmark_backends(generator, args.backends, batches, args.repeats, input_img_size)
+    print(format_backend_results(results))
+
+
+def evaluate(args):
+    import time
+
+    # Check the folders before the feature extractor and the model are loaded
+    folders = {"--reference_path": args.reference_path, "--generated_dir": args.generated_dir}
+    if not args.generated_dir:
+        if not args.input_path:
+            args.parser.error("--input_path is required with --model_path or --export_dir")
+        folders["--input_path"] = args.input_path
+    for option, folder in folders.items():
+        if folder and not os.path.isdir(folder):
+            args.parser.error("%s %s is not a folder" % (option, folder))
+
+    from cyclegan.evaluation import compare_statistics, folder_statistics, load_feature_extractor, translated_statistics
+
+    input_img_size = (*args.size, 3)
+    extractor = load_feature_extractor(args.feature_extractor, args.inception_weights)
+    start = time.perf_counter()
+    reference, cached = folder_statistics(
+        args.reference_path, extractor, args.batch_size, input_img_size, args.kid_samples, args.stats_cache_dir
+    )
+    reference_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if args.generated_dir:
+        candidate, _ = folder_statistics(args.generated_dir, extractor, args.batch_size, input_img_size, args.kid_samples)
+    else:
+        predict, _ = load_list_predict(args, args.direction, input_img_size)
+        candidate = translated_statistics(predict, args.input_path, extractor, args.batch_size, input_img_size, args.kid_samples)
+    candidate_s = time.perf_counter() - start
+
+    result = compare_statistics(reference, candidate, args.kid_subsets, args.kid_subset_size)
+    print("reference  %6d images in %.1f s%s" % (result["reference_images"], reference_s, " (cached)" if cached else ""))
+    print("translated %6d images in %.1f s" % (result["candidate_images"], candidate_s))
+    print("FID %.3f" % result["fid"])
+    print("KID %.5f +- %.5f" % (result["kid"], result["kid_std"]))
+
+
+def add_dataset_arguments(parser):
+    # Either a TensorFlow Dataset or the domain folders, see check_dataset_arguments
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input_path", help="Folder or shard folder containing the input (A) domain images")
+    source.add_argument("--dataset_name", help="TensorFlow Dataset to use instead of the folders (e.g. cycle_gan/horse2zebra)")
+    parser.add_argument("--output_path", help="Folder or shard folder containing the output (B) domain images")
+    parser.set_defaults(parser=parser)
+
+
+def check_dataset_arguments(args, directions=("A2B", "B2A")):
+    # The folders of the domains translated from are needed unless a TensorFlow Dataset is used
+    if args.dataset_name is not None:
+        if args.output_path:
+            args.parser.error("--output_path cannot be combined with --dataset_name")
+        return
+    if "B2A" in directions and not args.output_path:
+        args.parser.error("--output_path is required with --input_path")
+
+
+def add_domain_folder_arguments(parser):
+    # Commands that stream the domain folders, TensorFlow Datasets are not supported
+    parser.add_argument("--input_path", required=True, help="Folder or shard folder containing the input (A) domain images")
+    parser.add_argument("--output_path", required=True, help="Folder or shard folder containing the output (B) domain images")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cyclegan", description="Unpaired image to image translation with Cycle GANs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_translate = subparsers.add_parser("translate", help="Translate image files with one generator")
+    parser_translate.add_argument("images", nargs="+", help="Image files to translate")
+    model_source = parser_translate.add_mutually_exclusive_group(required=True)
+    model_source.add_argument("--model_path", help="H5 model saved during training")
+    model_source.add_argument("--export_dir", help="Directory of generators exported with the export command")
+    parser_translate.add_argument("--direction", choices=["A2B", "B2A"], default="A2B")
+    parser_translate.add_argument("--output_dir", required=True, help="Folder where translated images are saved")
+    add_size_argument(parser_translate, "--size", None, "Size the images are resized to (default: their original size)")
+    add_bucket_argument(parser_translate)
+    add_backend_argument(parser_translate)
+    add_compile_cache_argument(parser_translate)
+    parser_translate.set_defaults(func=translate)
+
+    parser_preview = subparsers.add_parser("preview", help="Plot sample translations of a trained model")
+    add_dataset_arguments(parser_preview)
+    parser_preview.add_argument("--model_path", required=True, help="H5 model saved during training")
+    parser_preview.add_argument("--direction", choices=["A2B", "B2A", "both"], default="both")
+    parser_preview.add_argument("--results_save_path", default=".", help="Folder where generated results are saved")
+    parser_preview.add_argument("--num_img", type=int, default=4)
+    parser_preview.add_argument("--seed", type=int, help="Seed of the random sample (default: a new sample every run)")
+    parser_preview.add_argument("--show", action="store_true", help="Also display the figures")
+    add_size_argument(parser_preview, "--size", [256, 256], "Size the images are resized to")
+    parser_preview.set_defaults(func=preview)
+
+    parser_train = subparsers.add_parser("train", help="Train a Cycle GAN")
+    add_dataset_arguments(parser_train)
+    parser_train.add_argument("--model_save_path", required=True, help="Folder where models and samples are saved")
+    parser_train.add_argument("--batch_size", type=int, default=1)
+    parser_train.add_argument("--epochs", type=int, default=100)
+    parser_train.add_argument("--interval", type=int, default=1, help="Epochs between saving the model")
+    parser_train.add_argument("--pretrained_model_path", help="H5 model to continue training from")
+    parser_train.add_argument(
+        "--checkpoint_format",
+        choices=["full", "delta"],
+        default="full",
+        help="delta saves compressed differences from a full base checkpoint",
+    )
+    parser_train.add_argument("--base_interval", type=int, default=10, help="Epochs between full base checkpoints with delta")
+    parser_train.add_argument(
+        "--generator_snapshots", action="store_true", help="Also save float16 generator-only snapshots for sampling"
+    )
+    parser_train.add_argument("--generator", choices=sorted(GENERATOR_VARIANTS), default=DEFAULT_VARIANT, help="Generator variant")
+    parser_train.add_argument("--width_multiplier", type=float, default=1.0, help="Scales the filters of the generator variant")
+    parser_train.add_argument(
+        "--validation_split", type=float, default=0.1, help="Fraction of the dataset folders held out for validation"
+    )
+    parser_train.add_argument(
+        "--disc_update_interval", type=int, default=1, help="Generator steps between discriminator updates"
+    )
+    parser_train.add_argument(
+        "--disc_loss_threshold", type=float, default=0.0, help="Skip a discriminator update while its loss is below this"
+    )
+    parser_train.add_argument("--validation_freq", type=int, default=5, help="Epochs between validation passes, 0 disables them")
+    parser_train.add_argument("--validation_batch_size", type=int, default=16, help="Images per validation batch")
+    add_size_argument(parser_train, "--dataset_dimensions", [256, 256], "Size the dataset is resized to")
+    add_size_argument(parser_train, "--input_img_size", [256, 256], "Size of the random training crops")
+    parser_train.add_argument("--crops_per_image", type=int, default=1, help="Random crops taken from every decoded image")
+    parser_train.add_argument(
+        "--profile_memory", action="store_true", help="Log the peak memory of every step to memory.jsonl in --model_save_path"
+    )
+    parser_train.set_defaults(func=train)
+
+    parser_profile = subparsers.add_parser("profile", help="Measure the peak memory of training and inference per batch size")
+    parser_profile.add_argument("--model_path", help="H5 model whose generator configuration is profiled")
+    parser_profile.add_argument("--generator", choices=sorted(GENERATOR_VARIANTS), default=DEFAULT_VARIANT, help="Generator variant")
+    parser_profile.add_argument("--width_multiplier", type=float, default=1.0, help="Scales the filters of the generator variant")
+    parser_profile.add_argument("--mode", choices=["train", "inference", "both"], default="both")
+    parser_profile.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 2], help="Batch sizes measured, two or more fit a line")
+    parser_profile.add_argument("--steps", type=int, default=3, help="Measured steps per batch size")
+    parser_profile.add_argument("--memory_budget_mb", type=float, help="Predict the largest batch size within this memory")
+    parser_profile.add_argument("--top_layers", type=int, default=10, help="Largest layer outputs listed")
+    parser_profile.add_argument(
+        "--in_process", action="store_true", help="Measure every batch size in this process instead of a new one"
+    )
+    add_size_argument(parser_profile, "--input_img_size", [256, 256], "Size of the profiled images")
+    parser_profile.set_defaults(func=profile)
+
+    parser_sweep = subparsers.add_parser("sweep", help="Train short trials of many hyperparameters in parallel")
+    parser_sweep.add_argument("--input_path", required=True, help="Folder containing the input (A) domain images")
+    parser_sweep.add_argument("--output_path", required=True, help="Folder containing the output (B) domain images")
+    parser_sweep.add_argument("--sweep_dir", required=True, help="Folder of the trial checkpoints and results")
+    parser_sweep.add_argument("--dataset_cache_dir", help="Folder of the preprocessed dataset (default: inside --sweep_dir)")
+    parser_sweep.add_argument("--lambda_cycle", type=float, nargs="+", default=[10.0])
+    parser_sweep.add_argument("--lambda_identity", type=float, nargs="+", default=[0.5])
+    parser_sweep.add_argument("--learning_rate", type=float, nargs="+", default=[2e-4])
+    parser_sweep.add_argument("--generator", choices=sorted(GENERATOR_VARIANTS), nargs="+", default=[DEFAULT_VARIANT])
+    parser_sweep.add_argument("--width_multiplier", type=float, nargs="+", default=[1.0])
+    parser_sweep.add_argument("--num_trials", type=int, help="Random grid points to try instead of the whole grid")
+    parser_sweep.add_argument("--seed", type=int, default=0)
+    parser_sweep.add_argument("--min_epochs", type=int, default=1, help="Epochs every trial trains before the first cut")
+    parser_sweep.add_argument("--max_epochs", type=int, default=9, help="Epochs the best trials train in total")
+    parser_sweep.add_argument("--reduction_factor", type=int, default=3, help="Only 1 in this many trials continues after each cut")
+    parser_sweep.add_argument("--metric", default="val_cycle_l1", help="Validation loss (val_...) trials are ranked by, lower is better")
+    parser_sweep.add_argument("--num_workers", type=int, help="Trials trained at the same time")
+    parser_sweep.add_argument("--threads_per_trial", type=int, default=4, help="CPU cores pinned to every trial")
+    parser_sweep.add_argument("--batch_size", type=int, default=1)
+    parser_sweep.add_argument("--validation_split", type=float, default=0.1)
+    parser_sweep.add_argument("--validation_batch_size", type=int, default=16)
+    add_size_argument(parser_sweep, "--dataset_dimensions", [256, 256], "Size the dataset is resized to")
+    add_size_argument(parser_sweep, "--input_img_size", [256, 256], "Size of the random training crops")
+    parser_sweep.add_argument("--crops_per_image", type=int, default=1, help="Random crops taken from every decoded image")
+    parser_sweep.set_defaults(func=sweep, parser=parser_sweep)
+
+    parser_distill = subparsers.add_parser("distill", help="Distill a trained generator into a smaller student generator")
+    add_domain_folder_arguments(parser_distill)
+    parser_distill.add_argument("--teacher_model_path", required=True, help="H5 model saved during training")
+    parser_distill.add_argument("--student_model_path", required=True, help="H5 file the student generator is saved to")
+    parser_distill.add_argument("--direction", choices=["A2B", "B2A"], default="A2B")
+    parser_distill.add_argument("--student", choices=sorted(GENERATOR_VARIANTS), default="mobile", help="Student generator variant")
+    parser_distill.add_argument("--width_multiplier", type=float, default=1.0, help="Scales the filters of the student variant")
+    parser_distill.add_argument("--both_domains", action="store_true", help="Also learn the teacher's outputs on the target domain")
+    parser_distill.add_argument("--batch_size", type=int, default=1)
+    parser_distill.add_argument("--epochs", type=int, default=10)
+    parser_distill.add_argument("--learning_rate", type=float, default=2e-4)
+    parser_distill.add_argument("--lambda_pixel", type=float, default=10.0, help="Weight of the pixel matching loss")
+    parser_distill.add_argument("--lambda_feature", type=float, default=1.0, help="Weight of the feature matching loss")
+    parser_distill.add_argument("--num_eval", type=int, default=16, help="Images used to compare the student with the teacher")
+    add_size_argument(parser_distill, "--dataset_dimensions", [256, 256], "Size the dataset is resized to")
+    add_size_argument(parser_distill, "--input_img_size", [256, 256], "Size of the random training crops")
+    parser_distill.set_defaults(func=distill)
+
+    parser_quantize = subparsers.add_parser("quantize", help="Export int8 TFLite generators and compare them with the float models")
+    add_domain_folder_arguments(parser_quantize)
+    parser_quantize.add_argument("--model_path", required=True, help="H5 model saved during training")
+    parser_quantize.add_argument("--export_dir", required=True, help="Folder the TFLite models are written to")
+    parser_quantize.add_argument("--direction", choices=["A2B", "B2A", "both"], default="both")
+    parser_quantize.add_argument("--num_calibration", type=int, default=100, help="Source domain images used to calibrate")
+    parser_quantize.add_argument("--num_eval", type=int, default=16, help="Images used to compare the int8 and float models")
+    parser_quantize.add_argument("--num_threads", type=int, default=None, help="CPU threads of the TFLite interpreter")
+    parser_quantize.add_argument("--allow_float_fallback", action="store_true", help="Keep ops without int8 kernels in float32")
+    add_size_argument(parser_quantize, "--size", [256, 256], "Input size of the exported models")
+    parser_quantize.set_defaults(func=quantize)
+
+    parser_prune = subparsers.add_parser("prune", help="Fine-tune with channel pruning and export smaller generators")
+    add_domain_folder_arguments(parser_prune)
+    parser_prune.add_argument("--model_path", required=True, help="H5 model saved during training")
+    parser_prune.add_argument("--pruned_model_path", required=True, help="H5 file the pruned generators are saved to")
+    parser_prune.add_argument("--target_sparsity", type=float, default=0.5, help="Fraction of residual block channels to remove")
+    parser_prune.add_argument("--epochs", type=int, default=10, help="Total fine-tuning epochs")
+    parser_prune.add_argument("--pruning_epochs", type=int, default=5, help="Epochs until the target sparsity is reached")
+    parser_prune.add_argument("--frequency", type=int, default=100, help="Steps between pruning updates")
+    parser_prune.add_argument("--steps_per_epoch", type=int, help="Training steps per epoch (default: counted from the folders)")
+    parser_prune.add_argument("--batch_size", type=int, default=1)
+    parser_prune.add_argument("--num_eval", type=int, default=16, help="Images used to compare the pruned and dense models")
+    add_size_argument(parser_prune, "--dataset_dimensions", [256, 256], "Size the dataset is resized to")
+    add_size_argument(parser_prune, "--input_img_size", [256, 256], "Size of the random training crops")
+    parser_prune.set_defaults(func=prune)
+
+    parser_export = subparsers.add_parser("export", help="Export generators as standalone SavedModels")
+    parser_export.add_argument("--model_path", required=True, help="H5 model saved during training")
+    parser_export.add_argument("--export_dir", required=True, help="Directory the SavedModels are written to")
+    parser_export.add_argument("--direction", choices=["A2B", "B2A", "both"], default="both")
+    parser_export.set_defaults(func=export)
+
+    parser_shard = subparsers.add_parser("shard", help="Pack an image folder into tar shards for sequential reading")
+    parser_shard.add_argument("--input_dir", required=True, help="Folder of images to pack, searched recursively")
+    parser_shard.add_argument("--output_dir", required=True, help="Folder the shards and their index are written to")
+    parser_shard.add_argument("--shard_size_mb", type=float, default=256, help="Size at which a new shard is started")
+    parser_shard.add_argument(
+        "--validation_split", type=float, default=0.1, help="Fraction of the images written to test shards, which train validates on"
+    )
+    parser_shard.add_argument("--seed", type=int, default=0, help="Seed of the order of the images in the shards")
+    parser_shard.set_defaults(func=shard)
+
+    parser_batch = subparsers.add_parser("batch", help="Translate every image of a directory to disk")
+    model_source = parser_batch.add_mutually_exclusive_group(required=True)
+    model_source.add_argument("--model_path", help="H5 model saved during training")
+    model_source.add_argument("--export_dir", help="Directory of generators exported with the export command")
+    parser_batch.add_argument("--input_dir", required=True, help="Folder of images to translate, searched recursively")
+    parser_batch.add_argument("--output_dir", required=True, help="Folder the translations are written to")
+    parser_batch.add_argument("--direction", choices=["A2B", "B2A"], default="A2B")
+    parser_batch.add_argument("--batch_size", type=int, default=8)
+    parser_batch.add_argument("--keep_size", action="store_true", help="Resize translations made with --size back to the input size")
+    parser_batch.add_argument("--num_decoders", type=int, default=4, help="Threads decoding images")
+    parser_batch.add_argument("--num_writers", type=int, default=4, help="Threads encoding and writing images")
+    parser_batch.add_argument("--queue_size", type=int, default=64, help="Capacity of the queues between the stages")
+    parser_batch.add_argument("--format", choices=["png", "jpg"], default="png")
+    parser_batch.add_argument("--overwrite", action="store_true", help="Translate images whose output already exists")
+    add_size_argument(parser_batch, "--size", None, "Size the images are translated at (default: their original size)")
+    add_bucket_argument(parser_batch)
+    add_backend_argument(parser_batch)
+    add_compile_cache_argument(parser_batch)
+    add_cache_arguments(parser_batch)
+    parser_batch.set_defaults(func=batch)
+
+    parser_tile = subparsers.add_parser("tile", help="Translate one very large image tile by tile")
+    parser_tile.add_argument(
+        "image", help="Image file to translate. Only .npy uint8 arrays are memory mapped, other formats must fit in memory"
+    )
+    model_source = parser_tile.add_mutually_exclusive_group(required=True)
+    model_source.add_argument("--model_path", help="H5 model saved during training")
+    model_source.add_argument("--export_dir", help="Directory of generators exported with the export command")
+    parser_tile.add_argument("--output", required=True, help=".png or .npy file the translation is written to")
+    parser_tile.add_argument("--direction", choices=["A2B", "B2A"], default="A2B")
+    parser_tile.add_argument("--tile_size", type=int, default=512, help="Height and width of the tiles")
+    parser_tile.add_argument("--overlap", type=int, default=64, help="Pixels shared by neighbouring tiles")
+    parser_tile.add_argument("--batch_size", type=int, default=4, help="Tiles per generator call")
+    parser_tile.add_argument("--scratch_dir", help="Folder for the decoded copy of non .npy images (default: system temp)")
+    parser_tile.add_argument(
+        "--max_decode_mb", type=float, help="Largest decoded size of non .npy images (default: the available memory)"
+    )
+    add_backend_argument(parser_tile)
+    add_compile_cache_argument(parser_tile)
+    parser_tile.set_defaults(func=tile)
+
+    parser_serve = subparsers.add_parser("serve", help="Serve the generators over HTTP with micro-batching")
+    model_source = parser_serve.add_mutually_exclusive_group(required=True)
+    model_source.add_argument("--model_path", help="H5 model saved during training")
+    model_source.add_argument("--export_dir", help="Directory of generators exported with the export command")
+    model_source.add_argument("--registry", help="JSON file mapping model names to checkpoints, served side by side")
+    parser_serve.add_argument(
+        "--max_models_mb", type=float, default=2048, help="Weight memory of the generators kept loaded with --registry"
+    )
+    parser_serve.add_argument(
+        "--preload", nargs="+", help="Registry models to load at startup (default: the entries marked preload)"
+    )
+    parser_serve.add_argument("--direction", choices=["A2B", "B2A", "both"], default="both")
+    parser_serve.add_argument("--host", default="127.0.0.1")
+    parser_serve.add_argument("--port", type=int, default=8000)
+    parser_serve.add_argument("--max_batch_size", type=int, default=8, help="Largest number of images per generator call")
+    parser_serve.add_argument(
+        "--max_latency_ms", type=float, default=20.0, help="Longest time a request waits for others to join its batch"
+    )
+    add_size_argument(
+        parser_serve, "--size", None, "Size the images are translated at (default: their original size, or the registry size)"
+    )
+    add_bucket_argument(parser_serve)
+    add_backend_argument(parser_serve)
+    add_compile_cache_argument(parser_serve)
+    add_cache_arguments(parser_serve)
+    parser_serve.add_argument(
+        "--warmup_size",
+        type=int,
+        nargs=2,
+        action="append",
+        metavar=("HEIGHT", "WIDTH"),
+        help="Image size to translate once before serving, repeatable (--size is always warmed up)",
+    )
+    parser_serve.add_argument(
+        "--warmup_batch_sizes",
+        type=int,
+        nargs="+",
+        help="Batch sizes to warm up (default: 1, or every batch size up to --max_batch_size with --backend xla)",
+    )
+    parser_serve.set_defaults(func=serve)
+
+    parser_sequence = subparsers.add_parser("sequence", help="Translate ordered video frames, reusing unchanged ones")
+    model_source = parser_sequence.add_mutually_exclusive_group(required=True)
+    model_source.add_argument("--model_path", help="H5 model saved during training")
+    model_source.add_argument("--export_dir", help="Directory of generators exported with the export command")
+    parser_sequence.add_argument("--input_dir", required=True, help="Folder of frames, ordered by file name")
+    parser_sequence.add_argument("--output_dir", required=True, help="Folder the translated frames are written to")
+    parser_sequence.add_argument("--direction", choices=["A2B", "B2A"], default="A2B")
+    parser_sequence.add_argument(
+        "--threshold",
+        type=float,
+        default=0.01,
+        help="Mean absolute difference (0-1) to the last translated frame below which its translation is reused",
+    )
+    parser_sequence.add_argument("--batch_size", type=int, default=8, help="Changed frames per generator call")
+    parser_sequence.add_argument("--num_writers", type=int, default=4, help="Threads encoding and writing frames")
+    parser_sequence.add_argument("--format", choices=["png", "jpg"], default="png")
+    add_size_argument(parser_sequence, "--size", None, "Size the frames are translated at (default: their original size)")
+    add_bucket_argument(parser_sequence)
+    add_backend_argument(parser_sequence)
+    add_compile_cache_argument(parser_sequence)
+    parser_sequence.set_defaults(func=sequence)
+
+    parser_evaluate = subparsers.add_parser("evaluate", help="Compute FID and KID of translations against real images")
+    model_source = parser_evaluate.add_mutually_exclusive_group(required=True)
+    model_source.add_argument("--model_path", help="H5 model saved during training")
+    model_source.add_argument("--export_dir", help="Directory of generators exported with the export command")
+    model_source.add_argument("--generated_dir", help="Folder of images translated beforehand, e.g. by the batch command")
+    parser_evaluate.add_argument("--input_path", help="Source domain images to translate with the model")
+    parser_evaluate.add_argument("--reference_path", required=True, help="Real images of the target domain")
+    parser_evaluate.add_argument("--direction", choices=["A2B", "B2A"], default="A2B")
+    extractor = parser_evaluate.add_mutually_exclusive_group(required=True)
+    extractor.add_argument("--inception_weights", help="Local InceptionV3 weights file without the top layers")
+    extractor.add_argument("--feature_extractor", help="Keras model file mapping images in [-1, 1] to features")
+    parser_evaluate.add_argument("--batch_size", type=int, default=64)
+    parser_evaluate.add_argument("--kid_samples", type=int, default=2000, help="Features sampled per side for KID")
+    parser_evaluate.add_argument("--kid_subsets", type=int, default=100)
+    parser_evaluate.add_argument("--kid_subset_size", type=int, default=1000)
+    parser_evaluate.add_argument(
+        "--stats_cache_dir",
+        default=os.path.join(os.path.expanduser("~"), ".cache", "cyclegan", "fid"),
+        help="Folder caching the reference statistics",
+    )
+    add_size_argument(parser_evaluate, "--size", [256, 256], "Size the images are translated and compared at")
+    parser_evaluate.set_defaults(func=evaluate, bucket=64, parser=parser_evaluate)
+    add_backend_argument(parser_evaluate)
+    add_compile_cache_argument(parser_evaluate)
+
+    parser_benchmark = subparsers.add_parser("benchmark", help="Compare the latency of the inference backends")
+    parser_benchmark.add_argument("--model_path", required=True, help="H5 model saved during training")
+    parser_benchmark.add_argument("--direction", choices=["A2B", "B2A"], default="A2B")
+    parser_benchmark.add_argument("--backends", nargs="+", choices=BACKENDS, default=BACKENDS)
+    parser_benchmark.add_argument("--input_path", help="Folder of images to translate (default: random images)")
+    parser_benchmark.add_argument("--batch_size", type=int, default=1)
+    parser_benchmark.add_argument("--num_batches", type=int, default=4, help="Distinct batches run per pass")
+    parser_benchmark.add_argument("--repeats", type=int, default=20, help="Timed passes over the batches per backend")
+    add_size_argument(parser_benchmark, "--size", [256, 256], "Size the images are translated at")
+    parser_benchmark.set_defaults(func=benchmark)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(sys.argv[1:] if argv is None else argv)
+    args.func(args)
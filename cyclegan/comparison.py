@@ -0,0 +1,74 @@
+"""
+## Side by side comparison of two generators
+Reports the latency of a reference and a candidate generator (e.g. a teacher
+and its distilled, quantized or pruned student) and how far the candidate's
+translations diverge from the reference ones.
+"""
+import time
+
+import numpy as np
+import tensorflow as tf
+
+
+def time_generator(predict, img, repeats=10):
+    """Median latency in milliseconds of `predict(img)`, after one warm-up call."""
+    np.asarray(predict(img))
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        np.asarray(predict(img))
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings) * 1000.0)
+
+
+def output_divergence(reference_output, candidate_output):
+    """L1 distance and PSNR (dB) between two batches of images in the range [-1, 1]."""
+    reference_output = tf.convert_to_tensor(reference_output, tf.float32)
+    candidate_output = tf.convert_to_tensor(candidate_output, tf.float32)
+    l1 = tf.reduce_mean(tf.abs(reference_output - candidate_output))
+    psnr = tf.image.psnr((reference_output + 1.0) / 2.0, (candidate_output + 1.0) / 2.0, max_val=1.0)
+    return float(l1), float(tf.reduce_mean(psnr))
+
+
+def compare_generators(reference, candidate, dataset, repeats=10):
+    """Compares two generators on a batched dataset of normalized images.
+    Args:
+        reference: Callable mapping a normalized image batch to translations.
+        candidate: Callable with the same signature as `reference`.
+        dataset: Batched dataset of normalized images.
+        repeats(int): Number of timed calls per generator.
+    Returns:
+        A dictionary with the latency of both generators, the speedup of the
+        candidate and the mean L1 and PSNR of its outputs against the reference.
+    """
+    l1_values = []
+    psnr_values = []
+    first_batch = None
+    for img in dataset:
+        if first_batch is None:
+            first_batch = img
+        l1, psnr = output_divergence(reference(img), candidate(img))
+        l1_values.append(l1)
+        psnr_values.append(psnr)
+
+    reference_ms = time_generator(reference, first_batch, repeats)
+    candidate_ms = time_generator(candidate, first_batch, repeats)
+    return {
+        "reference_ms": reference_ms,
+        "candidate_ms": candidate_ms,
+        "speedup": reference_ms / candidate_ms,
+        "l1": float(np.mean(l1_values)),
+        "psnr": float(np.mean(psnr_values)),
+    }
+
+
+def format_comparison(report, reference_name="reference", candidate_name="candidate"):
+    return "\n".join(
+        [
+            "%-12s %10.2f ms" % (reference_name, report["reference_ms"]),
+            "%-12s %10.2f ms" % (candidate_name, report["candidate_ms"]),
+            "%-12s %10.2fx" % ("speedup", report["speedup"]),
+            "%-12s %10.4f" % ("L1", report["l1"]),
+            "%-12s %10.2f dB" % ("PSNR", report["psnr"]),
+        ]
+    )
@@ -0,0 +1,129 @@
+"""
+## Persistent cache of traced generator graphs
+Tracing a generator into a `tf.function` takes seconds (plus building the
+Keras model and importing tensorflow_addons), and every new process used to
+pay for it again. The traced graph is saved once as a SavedModel in a cache
+folder, keyed by everything the graph depends on:
+
+* the generator configuration (not the weights, which are loaded separately)
+* the input signature and whether the function is compiled by XLA
+* the TensorFlow version
+
+Later processes restore the graph and assign the weights of the checkpoint
+read straight from the H5 file, so the Keras model is never built. The
+`function` and `xla` backends are cached; XLA still compiles a restored graph
+once per input shape in every process.
+
+`warm_up` runs dummy images through a translation callable, so that a
+restarted service has done its tracing and compiling before the first request.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import tensorflow as tf
+
+from cyclegan.models import GENERATOR_NAMES, build_generator, load_network_weights, read_generator_config, read_network_weights
+
+# Bump when the cached graphs change, so old entries are not restored
+CACHE_VERSION = 1
+
+
+def default_compile_cache_dir():
+    return os.path.join(os.path.expanduser("~"), ".cache", "cyclegan", "compiled")
+
+
+def compile_cache_key(generator_config, input_img_size=None, backend="function"):
+    """Hashes what a traced generator graph depends on. Both directions share a key."""
+    signature = [None, None, None, 3] if input_img_size is None else [None, *input_img_size[:2], 3]
+    key = [CACHE_VERSION, tf.__version__, dict(generator_config), signature, backend == "xla"]
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf8")).hexdigest()[:32]
+
+
+class GeneratorGraph(tf.Module):
+    """Traces a Keras generator for a fixed input signature.
+    Only the generator variables and the traced function are saved.
+    """
+
+    def __init__(self, generator, input_img_size=None, jit_compile=False):
+        super(GeneratorGraph, self).__init__(name=generator.name)
+        self.generator_variables = list(generator.variables)
+        shape = [None, None, None, 3] if input_img_size is None else [None, *input_img_size[:2], 3]
+
+        @tf.function(input_signature=[tf.TensorSpec(shape, tf.float32, name="images")], jit_compile=jit_compile)
+        def translate(images):
+            return generator(images, training=False)
+
+        self.translate = translate
+
+
+class CachedGenerator:
+    """Translates normalized image batches with a cached generator graph.
+    Has the `module.generator_variables` of an `ExportedGenerator`, so the
+    result cache and the registry treat both the same way.
+    """
+
+    def __init__(self, module, path, hit):
+        self.module = module
+        self.path = path
+        self.hit = hit
+
+    def __call__(self, img, training=False):
+        return self.module.translate(tf.convert_to_tensor(img, tf.float32))
+
+
+def load_cached_generator(model_path, direction="A2B", input_img_size=None, backend="function", cache_dir=None):
+    """Loads one generator of an H5 file as a traced graph, from the cache if possible.
+    Args:
+        model_path(str): H5 model saved during training.
+        direction(str): Translation direction ("A2B" or "B2A").
+        input_img_size(tuple): Fixed input size, or None for any size.
+        backend(str): `function` or `xla`.
+        cache_dir(str): Folder of the cache, by default `~/.cache/cyclegan/compiled`.
+    Returns:
+        A `CachedGenerator`.
+    """
+    if backend not in ("function", "xla"):
+        raise ValueError("Only the function and xla backends are cached, got %r" % backend)
+    cache_dir = cache_dir or default_compile_cache_dir()
+    generator_config = read_generator_config(model_path)
+    path = os.path.join(cache_dir, compile_cache_key(generator_config, input_img_size, backend))
+
+    if os.path.exists(path):
+        module = tf.saved_model.load(path)
+        for variable, value in zip(module.generator_variables, read_network_weights(model_path, GENERATOR_NAMES[direction])):
+            variable.assign(value)
+        return CachedGenerator(module, path, hit=True)
+
+    generator = build_generator(direction, input_img_size or (None, None, 3), generator_config)
+    load_network_weights(generator, model_path)
+    module = GeneratorGraph(generator, input_img_size, jit_compile=backend == "xla")
+    # Saved next to the final folder and renamed, so other processes never restore half an entry
+    temporary_path = "%s.tmp%d" % (path, os.getpid())
+    tf.saved_model.save(module, temporary_path)
+    try:
+        os.replace(temporary_path, path)
+    except OSError:
+        # Another process saved the same entry first
+        shutil.rmtree(temporary_path, ignore_errors=True)
+    return CachedGenerator(module, path, hit=False)
+
+
+def warm_up(predict, image_sizes, batch_sizes=(1,)):
+    """Translates zero images of every size and batch size once.
+    Args:
+        predict: Callable mapping a list of normalized images to their translations.
+        image_sizes(list): `(height, width)` of the images expected later.
+        batch_sizes(list): Batch sizes expected later. Traced functions accept
+        any batch size, XLA compiles one program per batch size.
+    Returns:
+        The seconds the warm-up took.
+    """
+    start = time.perf_counter()
+    for height, width in image_sizes:
+        img = tf.zeros((height, width, 3))
+        for batch_size in batch_sizes:
+            predict([img] * batch_size)
+    return time.perf_counter() - start
@@ -0,0 +1,282 @@
+"""
+## Image loading and preprocessing pipelines
+"""
+import os
+import random
+
+import numpy as np
+import tensorflow as tf
+
+autotune = tf.data.AUTOTUNE
+
+
+def list_image_paths(folder):
+    """Returns the sorted file paths of all JPG and PNG images below `folder`."""
+    paths = []
+    for r, d, f in os.walk(folder):
+        for file in f:
+            if file.lower().endswith((".jpg", ".jpeg", ".png")):
+                paths.append(os.path.join(r, file))
+    return sorted(paths)
+
+
+def count_images(folder):
+    """Number of images of a folder, or of the training split of a shard folder, without decoding them."""
+    from cyclegan.shards import is_shard_dir, read_index
+
+    if is_shard_dir(folder):
+        return sum(len(shard["members"]) for shard in read_index(folder)["splits"].get("train", []))
+    return len(list_image_paths(folder))
+
+
+def normalize_img(img):
+    img = tf.cast(img, dtype=tf.float32)
+    # Map values in the range [-1, 1]
+    return (img / 127.5) - 1.0
+
+
+def denormalize_img(img):
+    # Map values in the range [-1, 1] back to [0, 255]
+    return tf.cast(tf.clip_by_value(img * 127.5 + 127.5, 0.0, 255.0), tf.uint8)
+
+
+def preprocess_train_image(img, label, dataset_dimensions=(256, 256), input_img_size=(256, 256, 3)):
+    # Random flip
+    img = tf.image.random_flip_left_right(img)
+    # Resize to the original size first
+    img = tf.image.resize(img, [*dataset_dimensions])
+    # Random crop to the training input size
+    img = tf.image.random_crop(img, size=[*input_img_size])
+    # Normalize the pixel values in the range [-1, 1]
+    img = normalize_img(img)
+    return img
+
+
+def preprocess_test_image(img, label, input_img_size=(256, 256, 3)):
+    # Only resizing and normalization for the test images.
+    img = tf.image.resize(img, [input_img_size[0], input_img_size[1]])
+    img = normalize_img(img)
+    return img
+
+
+def load_domain(folder, label):
+    """Loads every RGB image below `folder` into memory.
+    Args:
+        folder(str): Folder containing the images of one domain.
+        label(int): Label to attach to every image of the domain.
+    Returns:
+        The images and their labels as NumPy arrays.
+    """
+    from PIL import Image
+
+    images = []
+    labels = []
+    for path in list_image_paths(folder):
+        # Remove PNG alpha layer
+        x = np.array(Image.open(path))[..., :3]
+
+        # If image does not have 3 RGB channels then don't add it to the dataset
+        if len(x.shape) == 3 and x.shape[2] == 3:
+            images.append(x)
+            labels.append(label)
+        else:
+            print(path, x.shape)
+    return np.array(images), np.array(labels)
+
+
+def load_data(input_path, output_path):
+    """Loads the input (label 0) and output (label 1) domain folders.
+    Returns:
+        x_train and y_train arrays for both datasets.
+    """
+    src_x, src_y = load_domain(input_path, 0)
+    dst_x, dst_y = load_domain(output_path, 1)
+    return src_x, src_y, dst_x, dst_y
+
+
+def split_holdout(x, y, validation_split, seed=0):
+    """Splits arrays into a training part and a random held-out part of `validation_split` of them."""
+    indices = np.random.default_rng(seed).permutation(len(x))
+    num_holdout = max(1, int(round(len(x) * validation_split)))
+    holdout, train = indices[:num_holdout], indices[num_holdout:]
+    return x[train], y[train], x[holdout], y[holdout]
+
+
+def load_datasets(preprocessed_dataset=False, dataset_name=None, input_path=None, output_path=None, validation_split=None):
+    """Loads the raw `(image, label)` datasets of both domains.
+    Args:
+        preprocessed_dataset(bool): Load `dataset_name` with tensorflow-datasets
+        instead of reading `input_path` and `output_path`.
+        validation_split(float): Fraction of every folder held out from
+        training as its test set. Without it, the test sets are the
+        training images minus the last one. TensorFlow Datasets always use
+        their own test splits.
+        `input_path` and `output_path` can also be shard folders written by
+        `cyclegan.shards.write_shards`, which are streamed instead of loaded
+        into memory, and whose held-out split was chosen when writing them.
+        Without `test` shards, their test sets are the training images, see
+        `cyclegan.shards.has_test_split`.
+    Returns:
+        train_src, train_dst, test_src and test_dst datasets.
+    """
+    # If using a preprocessed TensorFlow Dataset
+    if preprocessed_dataset:
+        import tensorflow_datasets as tfds
+
+        tfds.disable_progress_bar()
+        dataset, _ = tfds.load(dataset_name, with_info=True, as_supervised=True)
+        return dataset["trainA"], dataset["trainB"], dataset["testA"], dataset["testB"]
+
+    from cyclegan.shards import is_shard_dir, shard_datasets
+
+    if is_shard_dir(input_path):
+        return shard_datasets(input_path, output_path)
+
+    # Load the dataset into NumPy arrays
+    src_X, src_Y, dst_X, dst_Y = load_data(input_path, output_path)
+
+    if validation_split:
+        src_X, src_Y, test_src_X, test_src_Y = split_holdout(src_X, src_Y, validation_split)
+        dst_X, dst_Y, test_dst_X, test_dst_Y = split_holdout(dst_X, dst_Y, validation_split)
+    else:
+        test_src_X, test_src_Y = src_X[0:(len(src_X) - 1)], src_Y[0:(len(src_Y) - 1)]
+        test_dst_X, test_dst_Y = dst_X[0:(len(dst_X) - 1)], dst_Y[0:(len(dst_Y) - 1)]
+
+    # Load the NumPy arrays into TensorFlow Dataset objects
+    train_src = tf.data.Dataset.from_tensor_slices((src_X, src_Y))
+    train_dst = tf.data.Dataset.from_tensor_slices((dst_X, dst_Y))
+    test_src = tf.data.Dataset.from_tensor_slices((test_src_X, test_src_Y))
+    test_dst = tf.data.Dataset.from_tensor_slices((test_dst_X, test_dst_Y))
+    return train_src, train_dst, test_src, test_dst
+
+
+def random_crops(img, input_img_size=(256, 256, 3), crops_per_image=1):
+    # Independent random flips and crops of one resized image, normalized in the range [-1, 1]
+    crops = [
+        tf.image.random_crop(tf.image.random_flip_left_right(img), size=[*input_img_size])
+        for _ in range(crops_per_image)
+    ]
+    return normalize_img(tf.stack(crops))
+
+
+def train_pipeline(
+    dataset, batch_size=1, dataset_dimensions=(256, 256), input_img_size=(256, 256, 3), crops_per_image=1, cache=True
+):
+    """Preprocesses and batches the raw `(image, label)` training dataset of one domain.
+    Args:
+        crops_per_image(int): Random crops taken from every resized image. With
+        more than one, the resized images are cached as uint8 and their crops
+        are drawn again every epoch, and an epoch covers every image this many
+        times for the cost of one decode and resize.
+        cache(bool): Keep the preprocessed images in memory after the first
+        epoch. Datasets streamed from disk pass False, so only the shuffle
+        buffer is held in memory and every epoch decodes the images again.
+    """
+    if crops_per_image == 1:
+        # Apply the preprocessing operations to the training data
+        def preprocess(img, label):
+            return preprocess_train_image(img, label, dataset_dimensions, input_img_size)
+
+        dataset = dataset.map(preprocess, num_parallel_calls=autotune)
+        if cache:
+            dataset = dataset.cache()
+        return dataset.shuffle(256).batch(batch_size)
+
+    def resize(img, label):
+        img = tf.image.resize(img, [*dataset_dimensions])
+        return tf.cast(tf.clip_by_value(tf.round(img), 0.0, 255.0), tf.uint8)
+
+    def crop(img):
+        return random_crops(img, input_img_size, crops_per_image)
+
+    dataset = dataset.map(resize, num_parallel_calls=autotune)
+    if cache:
+        dataset = dataset.cache()
+    # The crops of one image are spread over the batches by the shuffle buffer
+    return dataset.map(crop, num_parallel_calls=autotune).unbatch().shuffle(256).batch(batch_size)
+
+
+def test_pipeline(dataset, batch_size=1, input_img_size=(256, 256, 3), cache=True):
+    # Apply the preprocessing operations to the test data, caching them unless streamed from disk
+    def preprocess(img, label):
+        return preprocess_test_image(img, label, input_img_size)
+
+    dataset = dataset.map(preprocess, num_parallel_calls=autotune)
+    if cache:
+        dataset = dataset.cache()
+    return dataset.shuffle(256).batch(batch_size)
+
+
+def validation_pipeline(test_src, test_dst, batch_size=16, input_img_size=(256, 256, 3), cache=True):
+    # Pair the held-out images before batching, the domains may hold out different numbers of them
+    src = test_pipeline(test_src, 1, input_img_size, cache).unbatch()
+    dst = test_pipeline(test_dst, 1, input_img_size, cache).unbatch()
+    return tf.data.Dataset.zip((src, dst)).batch(batch_size)
+
+
+def decode_image_file(path):
+    # Decode a JPG or PNG file into a uint8 RGB image, dropping any alpha layer
+    return tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+
+
+def image_folder_dataset(folder, label=0):
+    """Streams `(image, label)` pairs from a folder, decoding each image on the fly.
+    Unlike `load_data`, the images are never all held in memory at once.
+    Shard folders are streamed shard by shard.
+    """
+    from cyclegan.shards import is_shard_dir, shard_dataset
+
+    if is_shard_dir(folder):
+        return shard_dataset(folder, label)
+    paths = tf.data.Dataset.from_tensor_slices(list_image_paths(folder))
+    return paths.map(lambda path: (decode_image_file(path), label), num_parallel_calls=autotune)
+
+
+def sample_image_paths(folder, num_samples, seed=None):
+    """Picks `num_samples` random image paths below `folder` without decoding any image."""
+    paths = list_image_paths(folder)
+    return random.Random(seed).sample(paths, min(num_samples, len(paths)))
+
+
+def sample_dataset(folder, num_samples=4, input_img_size=(256, 256, 3), seed=None):
+    """Decodes only `num_samples` random images of `folder`.
+    Unlike `load_datasets`, the time taken does not depend on the size of the folder.
+    Returns:
+        A dataset of normalized batches of one image each, as `plot_translations` expects.
+    """
+    from cyclegan.shards import is_shard_dir, read_members, sample_members
+
+    if is_shard_dir(folder):
+        # One seek per sample, the rest of the shards is never read
+        data = read_members(folder, sample_members(folder, num_samples, seed))
+        decode = lambda data: tf.io.decode_image(data, channels=3, expand_animations=False)
+    else:
+        data = sample_image_paths(folder, num_samples, seed)
+        decode = decode_image_file
+    if not data:
+        raise ValueError("No JPG or PNG images found below %s" % folder)
+    dataset = tf.data.Dataset.from_tensor_slices(data)
+    return dataset.map(lambda item: preprocess_test_image(decode(item), 0, input_img_size)).batch(1)
+
+
+def read_image(path, input_img_size=None):
+    """Decodes one image file into a normalized `[1, height, width, 3]` batch.
+    Args:
+        path(str): JPG or PNG file to decode.
+        input_img_size(tuple): Size to resize the image to. Keeps the
+        original size if not given.
+    """
+    img = decode_image_file(path)
+    if input_img_size is not None:
+        img = tf.image.resize(img, [input_img_size[0], input_img_size[1]])
+    return normalize_img(img)[tf.newaxis]
+
+
+def write_image(img, path):
+    """Encodes one normalized `[height, width, 3]` image to a PNG or JPG file."""
+    img = denormalize_img(img)
+    if path.lower().endswith((".jpg", ".jpeg")):
+        data = tf.io.encode_jpeg(img, quality=95)
+    else:
+        data = tf.io.encode_png(img)
+    tf.io.write_file(path, data)
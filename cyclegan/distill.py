@@ -0,0 +1,102 @@
+"""
+## Distill a trained generator into a smaller student generator
+The teacher is a generator loaded from a trained `CycleGan` checkpoint. The
+student is any generator variant and learns to reproduce the teacher's
+translations (pixel matching) and its residual trunk features (feature
+matching), so no adversarial training is needed.
+"""
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow.keras import layers
+
+from cyclegan.models import build_generator, load_generator
+
+
+def with_features(generator, name=None):
+    """Wraps a generator to output its residual trunk features and its translation."""
+    residual_outputs = [layer for layer in generator.layers if isinstance(layer, layers.Add)]
+    if not residual_outputs:
+        raise ValueError("Feature matching needs a generator with at least one residual block")
+    return keras.Model(generator.input, [residual_outputs[-1].output, generator.output], name=name)
+
+
+class Distiller(keras.Model):
+    """Trains `student` to match the outputs and trunk features of `teacher`.
+    Args:
+        teacher: Trained generator, kept frozen.
+        student: Generator to train, usually a smaller variant.
+        lambda_pixel(float): Weight of the L1 loss between both translations.
+        lambda_feature(float): Weight of the MSE loss between the teacher's
+        trunk features and the student's, projected by a 1x1 convolution
+        to the teacher's number of channels.
+    """
+
+    def __init__(self, teacher, student, lambda_pixel=10.0, lambda_feature=1.0):
+        super(Distiller, self).__init__()
+        teacher.trainable = False
+        self.teacher = with_features(teacher, name="teacher_features")
+        self.student = student
+        self.student_features = with_features(student, name="student_features")
+        self.projection = layers.Conv2D(self.teacher.outputs[0].shape[-1], (1, 1), name="feature_projection")
+        self.lambda_pixel = lambda_pixel
+        self.lambda_feature = lambda_feature
+
+    def compile(self, optimizer, pixel_loss_fn=None, feature_loss_fn=None):
+        super(Distiller, self).compile(optimizer=optimizer)
+        self.pixel_loss_fn = pixel_loss_fn or keras.losses.MeanAbsoluteError()
+        self.feature_loss_fn = feature_loss_fn or keras.losses.MeanSquaredError()
+
+    def train_step(self, real):
+        # Teacher targets need no gradients
+        teacher_features, teacher_output = self.teacher(real, training=False)
+
+        with tf.GradientTape() as tape:
+            student_features, student_output = self.student_features(real, training=True)
+
+            # Pixel matching on the translated images
+            pixel_loss = self.pixel_loss_fn(teacher_output, student_output) * self.lambda_pixel
+            # Feature matching on the residual trunk
+            feature_loss = (
+                self.feature_loss_fn(teacher_features, self.projection(student_features))
+                * self.lambda_feature
+            )
+            total_loss = pixel_loss + feature_loss
+
+        variables = self.student.trainable_variables + self.projection.trainable_variables
+        grads = tape.gradient(total_loss, variables)
+        self.optimizer.apply_gradients(zip(grads, variables))
+
+        return {
+            "loss": total_loss,
+            "pixel_loss": pixel_loss,
+            "feature_loss": feature_loss,
+        }
+
+
+def distill_generator(
+    teacher_model_path,
+    student_config,
+    dataset,
+    direction="A2B",
+    input_img_size=(256, 256, 3),
+    epochs=10,
+    learning_rate=2e-4,
+    lambda_pixel=10.0,
+    lambda_feature=1.0,
+    callbacks=None,
+):
+    """Loads a teacher generator from a CycleGAN H5 file and distills it into a new student.
+    Args:
+        teacher_model_path(str): H5 model saved during training.
+        student_config(dict): Generator configuration of the student.
+        dataset: Batched dataset of normalized source domain images.
+    Returns:
+        The teacher and the trained student generator.
+    """
+    teacher = load_generator(teacher_model_path, direction, input_img_size)
+    student = build_generator(direction, input_img_size, student_config)
+
+    distiller = Distiller(teacher, student, lambda_pixel=lambda_pixel, lambda_feature=lambda_feature)
+    distiller.compile(keras.optimizers.Adam(learning_rate=learning_rate, beta_1=0.5))
+    distiller.fit(dataset, epochs=epochs, callbacks=callbacks)
+    return teacher, student
@@ -0,0 +1,236 @@
+"""
+## Streaming FID and KID evaluation
+Measures how close translations are to the real images of the target domain
+in the feature space of a feature extractor (by default InceptionV3, loaded
+from a local weights file, or any Keras model):
+
+* FID: Frechet distance between Gaussians fitted to the real and translated
+  features. Means and covariances are accumulated batch by batch, so the
+  features are never all held in memory.
+* KID: unbiased squared MMD with a cubic polynomial kernel, averaged over
+  random subsets. It needs the features themselves, so it is computed on a
+  bounded reservoir sample of them.
+
+The statistics of a reference folder are cached on disk, keyed by a
+manifest of its files (names, sizes and modification times) and by the
+feature extractor, so repeated evaluations only process the translations.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+from cyclegan.cache import weights_fingerprint
+from cyclegan.data import autotune, list_image_paths, normalize_img
+from cyclegan.shards import is_shard_dir, shard_files_dataset, shard_paths
+
+INCEPTION_INPUT_SIZE = (299, 299)
+
+
+class FeatureExtractor:
+    """Maps normalized images in the range [-1, 1] to feature vectors.
+    Args:
+        model: Keras model taking `[batch, height, width, 3]` images in the
+        range [-1, 1]. Spatial outputs are averaged into vectors.
+        input_size(tuple): Size images are resized to before the model.
+    """
+
+    def __init__(self, model, input_size):
+        self.model = model
+        self.input_size = tuple(input_size)
+        self.fingerprint = weights_fingerprint(model)
+
+        @tf.function(input_signature=[tf.TensorSpec([None, None, None, 3], tf.float32)])
+        def extract(images):
+            features = model(tf.image.resize(images, self.input_size), training=False)
+            if len(features.shape) == 4:
+                features = tf.reduce_mean(features, axis=[1, 2])
+            return features
+
+        self.extract = extract
+
+    def __call__(self, images):
+        return self.extract(tf.convert_to_tensor(images, tf.float32)).numpy().astype(np.float64)
+
+
+def load_feature_extractor(model_path=None, inception_weights=None):
+    """Loads a user supplied Keras model, or InceptionV3 pool features from a local weights file."""
+    if model_path is not None:
+        model = keras.models.load_model(model_path, compile=False)
+        return FeatureExtractor(model, model.input_shape[1:3])
+    if inception_weights is None:
+        raise ValueError("Pass a feature extractor model or a local InceptionV3 (no top) weights file")
+    # InceptionV3 expects inputs in [-1, 1], exactly the normalized image range
+    model = keras.applications.InceptionV3(include_top=False, pooling="avg", weights=inception_weights)
+    return FeatureExtractor(model, INCEPTION_INPUT_SIZE)
+
+
+class RunningStatistics:
+    """Accumulates the mean and covariance of feature batches, plus a reservoir sample of the features.
+    Args:
+        max_samples(int): Size of the reservoir sample kept for KID.
+    """
+
+    def __init__(self, max_samples=2000, seed=0):
+        self.count = 0
+        self.mean = None
+        self.m2 = None
+        self.max_samples = max_samples
+        self.samples = []
+        self.random = np.random.default_rng(seed)
+
+    def update(self, features):
+        # Chan et al. parallel update, stable for many batches of float64 features
+        batch_count = len(features)
+        batch_mean = features.mean(axis=0)
+        centered = features - batch_mean
+        if self.count == 0:
+            self.mean = batch_mean
+            self.m2 = centered.T @ centered
+        else:
+            total = self.count + batch_count
+            delta = batch_mean - self.mean
+            self.mean = self.mean + delta * batch_count / total
+            self.m2 += centered.T @ centered + np.outer(delta, delta) * self.count * batch_count / total
+        for feature in features:
+            # Reservoir sampling keeps every feature with the same probability
+            self.count += 1
+            if len(self.samples) < self.max_samples:
+                self.samples.append(feature.astype(np.float32))
+            else:
+                index = self.random.integers(self.count)
+                if index < self.max_samples:
+                    self.samples[index] = feature.astype(np.float32)
+
+    @property
+    def covariance(self):
+        return self.m2 / max(self.count - 1, 1)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temporary_file = path + ".tmp.npz"
+        np.savez(temporary_file, count=self.count, mean=self.mean, m2=self.m2, samples=np.array(self.samples))
+        os.replace(temporary_file, path)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        statistics = cls(max_samples=len(data["samples"]))
+        statistics.count = int(data["count"])
+        statistics.mean = data["mean"]
+        statistics.m2 = data["m2"]
+        statistics.samples = list(data["samples"])
+        return statistics
+
+
+def frechet_distance(mean1, covariance1, mean2, covariance2):
+    """FID between two Gaussians, using only symmetric eigendecompositions."""
+    # Tr(sqrt(C1 C2)) = Tr(sqrt(sqrt(C1) C2 sqrt(C1))), and the latter is symmetric
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance1)
+    sqrt_covariance1 = (eigenvectors * np.sqrt(np.clip(eigenvalues, 0, None))) @ eigenvectors.T
+    product_eigenvalues = np.linalg.eigvalsh(sqrt_covariance1 @ covariance2 @ sqrt_covariance1)
+    trace_sqrt = np.sqrt(np.clip(product_eigenvalues, 0, None)).sum()
+    difference = mean1 - mean2
+    return float(difference @ difference + np.trace(covariance1) + np.trace(covariance2) - 2.0 * trace_sqrt)
+
+
+def kernel_inception_distance(features1, features2, num_subsets=100, subset_size=1000, seed=0):
+    """Mean and standard deviation of the unbiased MMD^2 over random subsets."""
+    features1 = np.asarray(features1, np.float64)
+    features2 = np.asarray(features2, np.float64)
+    subset_size = min(subset_size, len(features1), len(features2))
+    if subset_size < 2:
+        raise ValueError("KID needs at least 2 images on each side")
+    dimensions = features1.shape[1]
+    random = np.random.default_rng(seed)
+    values = []
+    for _ in range(num_subsets):
+        x = features1[random.choice(len(features1), subset_size, replace=False)]
+        y = features2[random.choice(len(features2), subset_size, replace=False)]
+        k_xx = (x @ x.T / dimensions + 1) ** 3
+        k_yy = (y @ y.T / dimensions + 1) ** 3
+        k_xy = (x @ y.T / dimensions + 1) ** 3
+        m = subset_size
+        mmd = (
+            (k_xx.sum() - np.trace(k_xx)) / (m * (m - 1))
+            + (k_yy.sum() - np.trace(k_yy)) / (m * (m - 1))
+            - 2.0 * k_xy.mean()
+        )
+        values.append(mmd)
+    return float(np.mean(values)), float(np.std(values))
+
+
+def image_batches(folder, batch_size=64, input_img_size=None):
+    """Streams normalized image batches of a folder or shard folder, decoding in parallel."""
+
+    def decode(data):
+        img = tf.io.decode_image(data, channels=3, expand_animations=False)
+        img.set_shape([None, None, 3])
+        if input_img_size is not None:
+            img = tf.image.resize(img, input_img_size[:2])
+        return normalize_img(img)
+
+    if is_shard_dir(folder):
+        dataset = shard_files_dataset(folder, shuffle=False).map(lambda name, data: data)
+    else:
+        dataset = tf.data.Dataset.from_tensor_slices(list_image_paths(folder)).map(tf.io.read_file)
+    dataset = dataset.map(decode, num_parallel_calls=autotune)
+    if input_img_size is None:
+        # Images of different sizes cannot share a batch
+        return dataset.batch(1).prefetch(autotune)
+    return dataset.batch(batch_size).prefetch(autotune)
+
+
+def folder_manifest_key(folder, extractor, input_img_size, max_samples):
+    """Hashes the file list of `folder` with the settings its statistics depend on."""
+    digest = hashlib.sha256()
+    # The tar files of a shard folder stand for the images they hold
+    for path in shard_paths(folder) if is_shard_dir(folder) else list_image_paths(folder):
+        stat = os.stat(path)
+        digest.update(("%s\0%d\0%d\n" % (os.path.relpath(path, folder), stat.st_size, stat.st_mtime_ns)).encode("utf8"))
+    digest.update(json.dumps([extractor.fingerprint, input_img_size and list(input_img_size), max_samples]).encode("utf8"))
+    return digest.hexdigest()
+
+
+def folder_statistics(folder, extractor, batch_size=64, input_img_size=None, max_samples=2000, cache_dir=None):
+    """Feature statistics of the images of `folder`, read from `cache_dir` if the folder is unchanged.
+    Returns:
+        The statistics and whether they came from the cache.
+    """
+    cache_file = None
+    if cache_dir is not None:
+        cache_file = os.path.join(cache_dir, folder_manifest_key(folder, extractor, input_img_size, max_samples) + ".npz")
+        if os.path.exists(cache_file):
+            return RunningStatistics.load(cache_file), True
+    statistics = RunningStatistics(max_samples)
+    for images in image_batches(folder, batch_size, input_img_size):
+        statistics.update(extractor(images))
+    if cache_file is not None:
+        statistics.save(cache_file)
+    return statistics, False
+
+
+def translated_statistics(predict, folder, extractor, batch_size=64, input_img_size=(256, 256, 3), max_samples=2000):
+    """Feature statistics of the translations of the images of `folder`.
+    Args:
+        predict: Callable mapping a list of normalized images to their translations.
+    """
+    statistics = RunningStatistics(max_samples)
+    for images in image_batches(folder, batch_size, input_img_size):
+        translations = tf.stack(list(predict(list(images))))
+        statistics.update(extractor(translations))
+    return statistics
+
+
+def compare_statistics(reference, candidate, num_subsets=100, subset_size=1000):
+    kid, kid_std = kernel_inception_distance(reference.samples, candidate.samples, num_subsets, subset_size)
+    return {
+        "fid": frechet_distance(reference.mean, reference.covariance, candidate.mean, candidate.covariance),
+        "kid": kid,
+        "kid_std": kid_std,
+        "reference_images": reference.count,
+        "candidate_images": candidate.count,
+    }
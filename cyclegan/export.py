@@ -0,0 +1,103 @@
+"""
+## Generator-only SavedModel export
+Every generator is exported as its own SavedModel, so inference restores only
+the direction it needs, without the other generator, the discriminators or
+any optimizer state:
+```
+export_dir/
+    generator_G/    A2B SavedModel
+    generator_F/    B2A SavedModel
+```
+Each SavedModel has two signatures, both accepting any batch and spatial size:
+
+* `serving_default`: uint8 `images` in, uint8 `images` out
+* `translate`: normalized float32 `images` in the range [-1, 1] in and out
+
+Loading a SavedModel restores the traced graphs only, so neither the model
+building code nor tensorflow_addons is needed.
+"""
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from cyclegan.data import denormalize_img, normalize_img
+from cyclegan.models import GENERATOR_NAMES, build_generator
+from cyclegan.translator import pad_to_multiple
+
+METADATA_FILE = "cyclegan.json"
+
+
+class GeneratorModule(tf.Module):
+    """Wraps a generator built with `None` spatial dimensions for export.
+    Only the generator variables and the traced signatures are saved, not the
+    Keras model itself, which keeps restoring the SavedModel cheap.
+    """
+
+    def __init__(self, generator):
+        super(GeneratorModule, self).__init__(name=generator.name)
+        self.generator_variables = list(generator.variables)
+
+        @tf.function(input_signature=[tf.TensorSpec([None, None, None, 3], tf.float32, name="images")])
+        def translate(images):
+            height, width = tf.shape(images)[1], tf.shape(images)[2]
+            translated = generator(pad_to_multiple(images), training=False)
+            # Crop the padding back off
+            return {"images": translated[:, :height, :width, :]}
+
+        @tf.function(input_signature=[tf.TensorSpec([None, None, None, 3], tf.uint8, name="images")])
+        def serve(images):
+            translated = translate(normalize_img(images))["images"]
+            return {"images": denormalize_img(translated)}
+
+        self.translate = translate
+        self.serve = serve
+
+
+def export_generator(model_path, export_dir, direction="A2B", generator_config=None):
+    """Exports one generator of a CycleGAN H5 file as a standalone SavedModel.
+    Returns:
+        The directory of the exported SavedModel.
+    """
+    from cyclegan.models import load_network_weights, read_generator_config
+
+    if generator_config is None:
+        generator_config = read_generator_config(model_path)
+    # Weights do not depend on the input size, so the exported generator accepts any size
+    generator = build_generator(direction, (None, None, 3), generator_config)
+    load_network_weights(generator, model_path)
+
+    module = GeneratorModule(generator)
+    path = os.path.join(export_dir, generator.name)
+    tf.saved_model.save(module, path, signatures={"serving_default": module.serve, "translate": module.translate})
+    with open(os.path.join(path, METADATA_FILE), "w") as f:
+        json.dump({"direction": direction, "generator_config": dict(generator_config)}, f)
+    return path
+
+
+class ExportedGenerator:
+    """Translates images with a generator restored from a SavedModel export.
+    Args:
+        export_dir(str): Directory passed to `export_generator`.
+        direction(str): Translation direction to restore ("A2B" or "B2A").
+    """
+
+    def __init__(self, export_dir, direction="A2B"):
+        self.path = os.path.join(export_dir, GENERATOR_NAMES[direction])
+        self.direction = direction
+        self.module = tf.saved_model.load(self.path)
+        with open(os.path.join(self.path, METADATA_FILE)) as f:
+            self.metadata = json.load(f)
+
+    def __call__(self, img, training=False):
+        # Normalized float32 batch in, normalized float32 batch out, like the Keras generator
+        return self.module.translate(tf.convert_to_tensor(img, tf.float32))["images"]
+
+    def translate_uint8(self, images):
+        """uint8 `[batch, height, width, 3]` images in, uint8 images of the same size out."""
+        return self.module.serve(tf.convert_to_tensor(np.asarray(images, dtype=np.uint8)))["images"].numpy()
+
+
+def load_exported_generator(export_dir, direction="A2B"):
+    return ExportedGenerator(export_dir, direction)
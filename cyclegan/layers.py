@@ -0,0 +1,129 @@
+"""
+## Custom layers used in the CycleGAN generators
+"""
+import tensorflow as tf
+from tensorflow.keras import layers
+
+
+def _reflection_paddings(padding):
+    padding_width, padding_height = padding
+    return [
+        [0, 0],
+        [padding_height, padding_height],
+        [padding_width, padding_width],
+        [0, 0],
+    ]
+
+
+class ReflectionPadding2D(layers.Layer):
+    """Implements Reflection Padding as a layer.
+    Args:
+        padding(tuple): Amount of padding for the
+        spatial dimensions.
+    Returns:
+        A padded tensor with the same type as the input tensor.
+    """
+
+    def __init__(self, padding=(1, 1), **kwargs):
+        self.padding = tuple(padding)
+        super(ReflectionPadding2D, self).__init__(**kwargs)
+
+    def call(self, input_tensor, mask=None):
+        return tf.pad(input_tensor, _reflection_paddings(self.padding), mode="REFLECT")
+
+    def get_config(self):
+        config = super(ReflectionPadding2D, self).get_config()
+        config.update({"padding": self.padding})
+        return config
+
+
+def reflection_conv2d(x, kernel, strides=(1, 1), padding=(1, 1)):
+    """Reflection padded `valid` convolution of `x` with `kernel`.
+
+    The padded copy of `x` is only alive for the duration of the forward
+    convolution. The backward pass rebuilds it from `x` instead of having the
+    tape hold on to it, so training keeps one padded activation less per layer.
+    """
+    paddings = tf.constant(_reflection_paddings(padding), dtype=tf.int32)
+    conv_strides = [1, strides[0], strides[1], 1]
+
+    @tf.custom_gradient
+    def _reflection_conv2d(x, kernel):
+        x_padded = tf.pad(x, paddings, mode="REFLECT")
+        y = tf.nn.conv2d(x_padded, kernel, strides=conv_strides, padding="VALID")
+
+        def grad(dy):
+            # Rebuild the padded input rather than keeping it from the forward pass
+            x_padded = tf.pad(x, paddings, mode="REFLECT")
+            dx_padded = tf.raw_ops.Conv2DBackpropInput(
+                input_sizes=tf.shape(x_padded),
+                filter=kernel,
+                out_backprop=dy,
+                strides=conv_strides,
+                padding="VALID",
+            )
+            dkernel = tf.raw_ops.Conv2DBackpropFilter(
+                input=x_padded,
+                filter_sizes=tf.shape(kernel),
+                out_backprop=dy,
+                strides=conv_strides,
+                padding="VALID",
+            )
+            # Fold the gradient of the reflected border back onto the input
+            dx = tf.raw_ops.MirrorPadGrad(input=dx_padded, paddings=paddings, mode="REFLECT")
+            return dx, dkernel
+
+        return y, grad
+
+    # Pass the kernel as a tensor so the gradient reaches the variable through
+    # the regular read op instead of the custom gradient's variable handling
+    return _reflection_conv2d(x, tf.convert_to_tensor(kernel))
+
+
+class ReflectionConv2D(layers.Conv2D):
+    """Fuses `ReflectionPadding2D` and a `valid` `Conv2D` into one layer.
+    Args:
+        filters(int): Number of output channels.
+        kernel_size(tuple): Size of the convolution window.
+        reflection_padding(tuple): Amount of padding for the spatial
+        dimensions. Defaults to half the kernel size, which keeps the
+        spatial size unchanged for unit strides.
+    Returns:
+        The same tensor as `Conv2D(padding="valid")(ReflectionPadding2D()(x))`.
+        The kernel and bias are created exactly like `Conv2D`, so weights
+        saved from the unfused layers load into this layer unchanged.
+    """
+
+    def __init__(self, filters, kernel_size, reflection_padding=None, **kwargs):
+        kwargs["padding"] = "valid"
+        super(ReflectionConv2D, self).__init__(filters, kernel_size, **kwargs)
+        if reflection_padding is None:
+            reflection_padding = (self.kernel_size[1] // 2, self.kernel_size[0] // 2)
+        self.reflection_padding = tuple(reflection_padding)
+        if self.dilation_rate != (1, 1) or self.groups != 1:
+            raise ValueError("ReflectionConv2D only supports dilation_rate=1 and groups=1")
+
+    def call(self, inputs):
+        outputs = reflection_conv2d(
+            inputs, self.kernel, strides=self.strides, padding=self.reflection_padding
+        )
+        if self.use_bias:
+            outputs = tf.nn.bias_add(outputs, self.bias)
+        if self.activation is not None:
+            return self.activation(outputs)
+        return outputs
+
+    def compute_output_shape(self, input_shape):
+        input_shape = tf.TensorShape(input_shape).as_list()
+        padding_width, padding_height = self.reflection_padding
+        if input_shape[1] is not None:
+            input_shape[1] += 2 * padding_height
+        if input_shape[2] is not None:
+            input_shape[2] += 2 * padding_width
+        return super(ReflectionConv2D, self).compute_output_shape(input_shape)
+
+    def get_config(self):
+        config = super(ReflectionConv2D, self).get_config()
+        config.pop("padding")
+        config.update({"reflection_padding": self.reflection_padding})
+        return config
@@ -0,0 +1,314 @@
+"""
+## Memory profiling
+Raising `input_img_size` or `batch_size` runs out of memory quickly, because
+a training step keeps the activations of six generator passes and four
+discriminator passes alive for the backward pass. This module measures and
+explains where the memory goes:
+
+* `MemoryMeter` reads the resident set size of the process (RSS) and, on a
+  GPU, the bytes held by the TensorFlow allocator, and resets both peaks.
+* `activation_report` estimates the activation memory of every layer of
+  `gen_G`, `gen_F`, `disc_X` and `disc_Y` from their output shapes, per pass
+  of `CycleGan.train_step`.
+* `profile_memory` measures the peak memory of training steps or inference
+  calls at several batch sizes, each in a new process. A line fitted through
+  the peaks gives the fixed and per-image memory, and predicts the largest
+  batch size that fits a memory budget (`max_batch_size`).
+
+On Linux the peak RSS is reset through `/proc/self/clear_refs`. Elsewhere it is
+the peak of the whole process so far. TensorFlow only keeps allocator
+statistics for GPUs, on the CPU the allocator values are None and the memory
+is fitted on the RSS alone.
+"""
+import math
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+MB = 2.0 ** 20
+
+# Forward passes of `CycleGan.train_step`, all kept alive for the backward pass
+TRAIN_PASSES = {
+    "gen_G": ["real_x -> fake_y", "fake_x -> cycled_y", "real_y -> same_y"],
+    "gen_F": ["real_y -> fake_x", "fake_y -> cycled_x", "real_x -> same_x"],
+    "disc_X": ["real_x", "fake_x"],
+    "disc_Y": ["real_y", "fake_y"],
+}
+
+
+def default_memory_device():
+    # The accelerator holds the activations if there is one
+    return "GPU:0" if tf.config.list_logical_devices("GPU") else "CPU:0"
+
+
+def _read_status_bytes(field):
+    # VmRSS and VmHWM of /proc/self/status are in kB
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class MemoryMeter:
+    """Reads the current and peak memory of the process and of the TensorFlow allocator."""
+
+    def __init__(self, device=None):
+        self.device = device or default_memory_device()
+        # Allocator statistics are only available on GPU devices
+        self.allocator_available = self.device.upper().startswith("GPU")
+
+    def _allocator_call(self, fn):
+        if not self.allocator_available:
+            return None
+        try:
+            return fn(self.device)
+        except (AttributeError, ValueError, tf.errors.OpError):
+            # Older TensorFlow versions or devices without statistics
+            self.allocator_available = False
+            return None
+
+    def reset(self):
+        """Starts new peaks at the current memory."""
+        self._allocator_call(tf.config.experimental.reset_memory_stats)
+        try:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+        except OSError:
+            pass
+
+    def read(self):
+        """Returns the `rss`, `peak_rss`, `allocator` and `peak_allocator` bytes.
+        The allocator bytes are None when the device has no allocator statistics.
+        """
+        info = self._allocator_call(tf.config.experimental.get_memory_info) or {"current": None, "peak": None}
+        peak_rss = _read_status_bytes("VmHWM")
+        if peak_rss is None:
+            import resource
+
+            # Kilobytes on Linux, bytes on macOS, and never reset
+            peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+        return {
+            "rss": _read_status_bytes("VmRSS") or peak_rss,
+            "peak_rss": peak_rss,
+            "allocator": info["current"],
+            "peak_allocator": info["peak"],
+        }
+
+
+def layer_activation_bytes(network, dtype_size=4):
+    """Returns the `(name, type, bytes)` of the output of every layer for one image.
+    The network must be built for a fixed input size.
+    """
+    sizes = []
+    for layer in network.layers:
+        if isinstance(layer, keras.layers.InputLayer):
+            continue
+        elements = sum(int(np.prod(output.shape[1:])) for output in tf.nest.flatten(layer.output))
+        sizes.append((layer.name, type(layer).__name__, elements * dtype_size))
+    return sizes
+
+
+def activation_report(model, batch_size=1, passes=None):
+    """Estimates the activation memory of a training step, network by network and layer by layer.
+    Args:
+        model: `CycleGan` built for a fixed input size.
+        batch_size(int): Images per batch.
+        passes(dict): Passes of every network kept for the backward pass, by default `TRAIN_PASSES`.
+    Returns:
+        A dictionary with the `networks` and their passes, the `layers` sorted
+        from the largest, the total `activation_bytes`, and the `state_bytes`
+        of the weights, gradients and Adam slots.
+    """
+    passes = passes or TRAIN_PASSES
+    networks = {}
+    layers = []
+    for attribute, network_passes in passes.items():
+        network = getattr(model, attribute)
+        sizes = layer_activation_bytes(network)
+        pass_bytes = sum(size for _, _, size in sizes) * batch_size
+        networks[attribute] = {
+            "name": network.name,
+            "passes": network_passes,
+            "pass_bytes": pass_bytes,
+            "bytes": pass_bytes * len(network_passes),
+            # Weights, gradients and the two Adam slots
+            "state_bytes": network.count_params() * 4 * 4,
+        }
+        for name, kind, size in sizes:
+            layers.append({"network": attribute, "layer": name, "type": kind, "bytes": size * batch_size * len(network_passes)})
+    layers.sort(key=lambda layer: -layer["bytes"])
+    return {
+        "batch_size": batch_size,
+        "networks": networks,
+        "layers": layers,
+        "activation_bytes": sum(network["bytes"] for network in networks.values()),
+        "state_bytes": sum(network["state_bytes"] for network in networks.values()),
+    }
+
+
+def measure_steps(step_fn, batch, steps=3, meter=None):
+    """Runs `step_fn` on a batch once to trace it, then measures the memory of `steps` more calls."""
+    meter = meter or MemoryMeter()
+    tf.nest.map_structure(np.asarray, step_fn(batch))
+    step_memory = []
+    for _ in range(steps):
+        meter.reset()
+        start = time.perf_counter()
+        # Reading the outputs waits for the step to finish on accelerators
+        tf.nest.map_structure(np.asarray, step_fn(batch))
+        step_memory.append(dict(meter.read(), seconds=time.perf_counter() - start))
+    return step_memory
+
+
+def profile_batch_size(mode, batch_size, input_img_size=(256, 256, 3), generator_config=None, steps=3):
+    """Measures the memory of training steps (`train`) or `gen_G` inference calls (`inference`) at one batch size.
+    Returns:
+        The memory of every step, their mean time and their largest peaks.
+    """
+    from cyclegan.models import build_cycle_gan
+
+    cycle_gan_model = build_cycle_gan(input_img_size, generator_config)
+    images = tf.random.uniform((batch_size, *input_img_size), -1.0, 1.0, seed=0)
+    if mode == "train":
+        step_memory = measure_steps(tf.function(cycle_gan_model.train_step), (images, images), steps)
+    else:
+        step_memory = measure_steps(tf.function(lambda img: cycle_gan_model.gen_G(img, training=False)), images, steps)
+    return {
+        "batch_size": batch_size,
+        "steps": step_memory,
+        "seconds": float(np.mean([step["seconds"] for step in step_memory])),
+        "peak_rss": max(step["peak_rss"] for step in step_memory),
+        "peak_allocator": max_or_none(step["peak_allocator"] for step in step_memory),
+    }
+
+
+def profile_memory(mode, batch_sizes, input_img_size=(256, 256, 3), generator_config=None, steps=3, isolate=True):
+    """Measures the peak memory of training steps or inference calls at several batch sizes.
+    Args:
+        mode(str): `train` or `inference`.
+        batch_sizes(list): Batch sizes to measure.
+        steps(int): Measured steps per batch size, after one step that traces the function.
+        isolate(bool): Measure every batch size in a new process. Memory freed
+        by a previous batch size stays in the process and inflates later peaks.
+    Returns:
+        The results of `profile_batch_size`, smallest batch size first.
+    """
+    results = []
+    for batch_size in sorted(batch_sizes):
+        if not isolate:
+            results.append(profile_batch_size(mode, batch_size, input_img_size, generator_config, steps))
+            continue
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results.append(pool.submit(profile_batch_size, mode, batch_size, input_img_size, generator_config, steps).result())
+    return results
+
+
+def max_or_none(values):
+    # Largest value, or None if any is missing
+    values = list(values)
+    return None if None in values else max(values)
+
+
+def fit_memory(results, key="peak_rss"):
+    """Fits `fixed + per_image * batch_size` through the peaks of `profile_memory`.
+    Returns:
+        The fixed and per-image bytes, or None with fewer than two batch sizes
+        or without the `key` values, e.g. the allocator peaks on the CPU.
+    """
+    if len(results) < 2 or any(result[key] is None for result in results):
+        return None
+    per_image, fixed = np.polyfit([result["batch_size"] for result in results], [result[key] for result in results], 1)
+    return {"fixed": float(fixed), "per_image": max(float(per_image), 1.0)}
+
+
+def max_batch_size(fit, budget_bytes):
+    """Largest batch size whose fitted peak memory stays within `budget_bytes`."""
+    return max(int(math.floor((budget_bytes - fit["fixed"]) / fit["per_image"])), 0)
+
+
+def budget_metric(results, device="CPU:0"):
+    """Peak the budget is compared with: the allocator on accelerators that measure it, otherwise the RSS."""
+    if device.upper().startswith("CPU") or fit_memory(results, "peak_allocator") is None:
+        return "peak_rss"
+    return "peak_allocator"
+
+
+def budget_fit(results, device="CPU:0"):
+    """Fits the memory a budget is compared with, see `budget_metric`.
+    Activations live in accelerator memory, which the allocator measures. On
+    the CPU the whole process shares the budget, so the peak RSS is fitted.
+    Where the allocator is measured too, the RSS grows at least as fast as it:
+    freed memory the process keeps can hide the growth of small batches.
+    """
+    rss_fit = fit_memory(results, "peak_rss")
+    allocator_fit = fit_memory(results, "peak_allocator")
+    if budget_metric(results, device) == "peak_allocator":
+        return allocator_fit
+    if rss_fit is None or allocator_fit is None:
+        return rss_fit
+    return {"fixed": rss_fit["fixed"], "per_image": max(rss_fit["per_image"], allocator_fit["per_image"])}
+
+
+def format_mb(value, width=0):
+    # Memory in MB, or n/a when it was not measured
+    return ("%*s" % (width, "n/a")) if value is None else ("%*.1f" % (width, value / MB))
+
+
+def format_memory_profile(results, title, budget_mb=None, device="CPU:0"):
+    lines = [title, "%6s %10s %14s %18s" % ("batch", "step ms", "peak RSS MB", "peak allocator MB")]
+    for result in results:
+        peaks = (format_mb(result["peak_rss"], 14), format_mb(result["peak_allocator"], 18))
+        lines.append("%6d %10.1f %s %s" % (result["batch_size"], result["seconds"] * 1000.0, *peaks))
+    rss_fit = fit_memory(results, "peak_rss")
+    allocator_fit = fit_memory(results, "peak_allocator")
+    if rss_fit is None:
+        lines.append("Profile two or more batch sizes to fit the memory per image")
+        return "\n".join(lines)
+    if allocator_fit is None:
+        lines.append(
+            "Per image: %.1f MB RSS. Fixed: %.1f MB RSS. Allocator statistics are unavailable on %s"
+            % (rss_fit["per_image"] / MB, rss_fit["fixed"] / MB, device)
+        )
+    else:
+        lines.append(
+            "Per image: %.1f MB RSS, %.1f MB allocator. Fixed: %.1f MB RSS, %.1f MB allocator"
+            % (rss_fit["per_image"] / MB, allocator_fit["per_image"] / MB, rss_fit["fixed"] / MB, allocator_fit["fixed"] / MB)
+        )
+    if budget_mb is not None:
+        metric = "peak RSS" if budget_metric(results, device) == "peak_rss" else "peak allocator"
+        lines.append(
+            "Largest batch size within %.0f MB: %d (by %s on %s)"
+            % (budget_mb, max_batch_size(budget_fit(results, device), budget_mb * MB), metric, device)
+        )
+    return "\n".join(lines)
+
+
+def format_activation_report(report, top_layers=10):
+    lines = [
+        "Estimated activations of one training step, batch size %d" % report["batch_size"],
+        "%-8s %-54s %12s %10s %10s" % ("network", "passes", "per pass MB", "total MB", "state MB"),
+    ]
+    for attribute, network in report["networks"].items():
+        sizes = (network["pass_bytes"] / MB, network["bytes"] / MB, network["state_bytes"] / MB)
+        lines.append("%-8s %-54s %12.1f %10.1f %10.1f" % (attribute, ", ".join(network["passes"]), *sizes))
+    lines.append(
+        "Activations %.1f MB, weights, gradients and Adam slots %.1f MB"
+        % (report["activation_bytes"] / MB, report["state_bytes"] / MB)
+    )
+    lines.append("Largest layer outputs, over all passes:")
+    for layer in report["layers"][:top_layers]:
+        share = 100.0 * layer["bytes"] / report["activation_bytes"]
+        lines.append(
+            "  %-8s %-32s %-24s %10.1f MB %5.1f%%" % (layer["network"], layer["layer"], layer["type"], layer["bytes"] / MB, share)
+        )
+    return "\n".join(lines)
+
@@ -0,0 +1,710 @@
+"""
+## Building blocks, networks and the CycleGAN model
+"""
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow.keras import layers
+
+from cyclegan.layers import ReflectionConv2D, ReflectionPadding2D
+from cyclegan.variants import DEFAULT_VARIANT, GENERATOR_VARIANTS
+
+# Weights initializer for the layers.
+kernel_init = keras.initializers.RandomNormal(mean=0.0, stddev=0.02)
+
+# Gamma initializer for instance normalization.
+gamma_init = keras.initializers.RandomNormal(mean=0.0, stddev=0.02)
+
+# Names of the networks inside a saved `CycleGan`, keyed by translation direction
+GENERATOR_NAMES = {"A2B": "generator_G", "B2A": "generator_F"}
+DISCRIMINATOR_NAMES = {"A": "discriminator_X", "B": "discriminator_Y"}
+
+
+def instance_norm(gamma_initializer=gamma_init):
+    # tensorflow_addons is slow to import, so it is only loaded once a network is built
+    import tensorflow_addons as tfa
+
+    return tfa.layers.InstanceNormalization(gamma_initializer=gamma_initializer)
+
+
+"""
+## Building blocks used in the CycleGAN generators and discriminators
+"""
+
+
+def residual_block(
+    x,
+    activation,
+    kernel_initializer=kernel_init,
+    kernel_size=(3, 3),
+    strides=(1, 1),
+    gamma_initializer=gamma_init,
+    use_bias=False,
+    inner_filters=None,
+):
+    dim = x.shape[-1]
+    input_tensor = x
+
+    # Reflection padding is fused into the convolution
+    # The first convolution may be narrower than the block, e.g. after channel pruning
+    x = ReflectionConv2D(
+        inner_filters or dim,
+        kernel_size,
+        strides=strides,
+        kernel_initializer=kernel_initializer,
+        use_bias=use_bias,
+    )(input_tensor)
+    x = instance_norm(gamma_initializer)(x)
+    x = activation(x)
+
+    x = ReflectionConv2D(
+        dim,
+        kernel_size,
+        strides=strides,
+        kernel_initializer=kernel_initializer,
+        use_bias=use_bias,
+    )(x)
+    x = instance_norm(gamma_initializer)(x)
+    x = layers.add([input_tensor, x])
+    return x
+
+
+def separable_residual_block(
+    x,
+    activation,
+    kernel_initializer=kernel_init,
+    kernel_size=(3, 3),
+    gamma_initializer=gamma_init,
+    use_bias=False,
+):
+    # Residual block with each convolution split into a depthwise and a pointwise convolution
+    dim = x.shape[-1]
+    input_tensor = x
+    padding = (kernel_size[1] // 2, kernel_size[0] // 2)
+
+    x = ReflectionPadding2D(padding=padding)(input_tensor)
+    x = layers.DepthwiseConv2D(kernel_size, depthwise_initializer=kernel_initializer, use_bias=use_bias)(x)
+    x = layers.Conv2D(dim, (1, 1), kernel_initializer=kernel_initializer, use_bias=use_bias)(x)
+    x = instance_norm(gamma_initializer)(x)
+    x = activation(x)
+
+    x = ReflectionPadding2D(padding=padding)(x)
+    x = layers.DepthwiseConv2D(kernel_size, depthwise_initializer=kernel_initializer, use_bias=use_bias)(x)
+    x = layers.Conv2D(dim, (1, 1), kernel_initializer=kernel_initializer, use_bias=use_bias)(x)
+    x = instance_norm(gamma_initializer)(x)
+    x = layers.add([input_tensor, x])
+    return x
+
+
+def downsample(
+    x,
+    filters,
+    activation,
+    kernel_initializer=kernel_init,
+    kernel_size=(3, 3),
+    strides=(2, 2),
+    padding="same",
+    gamma_initializer=gamma_init,
+    use_bias=False,
+):
+    x = layers.Conv2D(
+        filters,
+        kernel_size,
+        strides=strides,
+        kernel_initializer=kernel_initializer,
+        padding=padding,
+        use_bias=use_bias,
+    )(x)
+    x = instance_norm(gamma_initializer)(x)
+    if activation:
+        x = activation(x)
+    return x
+
+
+def upsample(
+    x,
+    filters,
+    activation,
+    kernel_size=(3, 3),
+    strides=(2, 2),
+    padding="same",
+    kernel_initializer=kernel_init,
+    gamma_initializer=gamma_init,
+    use_bias=False,
+):
+    x = layers.Conv2DTranspose(
+        filters,
+        kernel_size,
+        strides=strides,
+        padding=padding,
+        kernel_initializer=kernel_initializer,
+        use_bias=use_bias,
+    )(x)
+    x = instance_norm(gamma_initializer)(x)
+    if activation:
+        x = activation(x)
+    return x
+
+
+"""
+## Build the generators
+The generator consists of downsampling blocks: nine residual blocks
+and upsampling blocks. The structure of the generator is the following:
+```
+c7s1-64 ==> Conv block with `relu` activation, filter size of 7
+d128 ====|
+         |-> 2 downsampling blocks
+d256 ====|
+R256 ====|
+R256     |
+R256     |
+R256     |
+R256     |-> 9 residual blocks
+R256     |
+R256     |
+R256     |
+R256 ====|
+u128 ====|
+         |-> 2 upsampling blocks
+u64  ====|
+c7s1-3 => Last conv block with `tanh` activation, filter size of 7.
+```
+The number of filters, the number of residual blocks and whether the residual
+blocks are depthwise separable are configurable, see `cyclegan.variants`.
+`residual_filters` sets the width of the first convolution of every residual
+block, which channel pruning reduces.
+"""
+
+
+def get_resnet_generator(
+    filters=64,
+    num_downsampling_blocks=2,
+    num_residual_blocks=9,
+    num_upsample_blocks=2,
+    gamma_initializer=gamma_init,
+    separable=False,
+    residual_filters=None,
+    input_img_size=(256, 256, 3),
+    name=None,
+):
+    if residual_filters is not None and (separable or len(residual_filters) != num_residual_blocks):
+        raise ValueError("residual_filters needs one entry per standard residual block")
+
+    img_input = layers.Input(shape=input_img_size, name=name + "_img_input")
+    x = ReflectionConv2D(filters, (7, 7), kernel_initializer=kernel_init, use_bias=False)(
+        img_input
+    )
+    x = instance_norm(gamma_initializer)(x)
+    x = layers.Activation("relu")(x)
+
+    # Downsampling
+    for _ in range(num_downsampling_blocks):
+        filters *= 2
+        x = downsample(x, filters=filters, activation=layers.Activation("relu"))
+
+    # Residual blocks
+    for i in range(num_residual_blocks):
+        if separable:
+            x = separable_residual_block(x, activation=layers.Activation("relu"))
+        else:
+            inner_filters = None if residual_filters is None else residual_filters[i]
+            x = residual_block(x, activation=layers.Activation("relu"), inner_filters=inner_filters)
+
+    # Upsampling
+    for _ in range(num_upsample_blocks):
+        filters //= 2
+        x = upsample(x, filters, activation=layers.Activation("relu"))
+
+    # Final block
+    x = ReflectionConv2D(3, (7, 7))(x)
+    x = layers.Activation("tanh")(x)
+
+    model = keras.models.Model(img_input, x, name=name)
+    return model
+
+
+"""
+## Build the discriminators
+The discriminators implement the following architecture:
+`C64->C128->C256->C512`
+"""
+
+
+def get_discriminator(
+    filters=64, kernel_initializer=kernel_init, num_downsampling=3, input_img_size=(256, 256, 3), name=None
+):
+    img_input = layers.Input(shape=input_img_size, name=name + "_img_input")
+    x = layers.Conv2D(
+        filters,
+        (4, 4),
+        strides=(2, 2),
+        padding="same",
+        kernel_initializer=kernel_initializer,
+    )(img_input)
+    x = layers.LeakyReLU(0.2)(x)
+
+    num_filters = filters
+    for num_downsample_block in range(num_downsampling):
+        num_filters *= 2
+        if num_downsample_block < num_downsampling - 1:
+            x = downsample(
+                x,
+                filters=num_filters,
+                activation=layers.LeakyReLU(0.2),
+                kernel_size=(4, 4),
+                strides=(2, 2),
+            )
+        else:
+            x = downsample(
+                x,
+                filters=num_filters,
+                activation=layers.LeakyReLU(0.2),
+                kernel_size=(4, 4),
+                strides=(1, 1),
+            )
+
+    x = layers.Conv2D(
+        1, (4, 4), strides=(1, 1), padding="same", kernel_initializer=kernel_initializer
+    )(x)
+
+    model = keras.models.Model(inputs=img_input, outputs=x, name=name)
+    return model
+
+
+"""
+## Build the CycleGAN model
+We will override the `train_step()` method of the `Model` class
+for training via `fit()`.
+"""
+
+
+# Losses of `CycleGan.test_step`, averaged over every held-out image
+VALIDATION_LOSSES = ["G_loss", "F_loss", "D_X_loss", "D_Y_loss", "adversarial_loss", "cycle_loss", "identity_loss"]
+
+
+class CycleGan(keras.Model):
+    def __init__(
+        self,
+        generator_G,
+        generator_F,
+        discriminator_X,
+        discriminator_Y,
+        lambda_cycle=10.0,
+        lambda_identity=0.5,
+        generator_config=None,
+    ):
+        super(CycleGan, self).__init__()
+        self.gen_G = generator_G
+        self.gen_F = generator_F
+        self.disc_X = discriminator_X
+        self.disc_Y = discriminator_Y
+        self.lambda_cycle = lambda_cycle
+        self.lambda_identity = lambda_identity
+        self.generator_config = generator_config
+        # Share of the steps each discriminator was updated in, averaged over the epoch
+        self.disc_X_update_tracker = keras.metrics.Mean(name="D_X_update")
+        self.disc_Y_update_tracker = keras.metrics.Mean(name="D_Y_update")
+        self.validation_trackers = [keras.metrics.Mean(name=name) for name in VALIDATION_LOSSES]
+
+    @property
+    def metrics(self):
+        # Listed so that fit() and evaluate() reset the trackers at the start of every epoch and evaluation
+        return [self.disc_X_update_tracker, self.disc_Y_update_tracker, *self.validation_trackers]
+
+    def compile(
+        self,
+        gen_G_optimizer,
+        gen_F_optimizer,
+        disc_X_optimizer,
+        disc_Y_optimizer,
+        gen_loss_fn,
+        disc_loss_fn,
+        disc_update_interval=1,
+        disc_loss_threshold=0.0,
+    ):
+        """Sets the optimizers, the losses and the discriminator update schedule.
+        Args:
+            disc_update_interval(int): Update the discriminators only every
+            this many generator steps.
+            disc_loss_threshold(float): Skip the update of a discriminator
+            while its loss is below this value, i.e. while it dominates.
+        """
+        super(CycleGan, self).compile()
+        self.gen_G_optimizer = gen_G_optimizer
+        self.gen_F_optimizer = gen_F_optimizer
+        self.disc_X_optimizer = disc_X_optimizer
+        self.disc_Y_optimizer = disc_Y_optimizer
+        self.generator_loss_fn = gen_loss_fn
+        self.discriminator_loss_fn = disc_loss_fn
+        self.cycle_loss_fn = keras.losses.MeanAbsoluteError()
+        self.identity_loss_fn = keras.losses.MeanAbsoluteError()
+        self.disc_update_interval = disc_update_interval
+        self.disc_loss_threshold = disc_loss_threshold
+
+    def save_weights(self, filepath, *args, **kwargs):
+        super(CycleGan, self).save_weights(filepath, *args, **kwargs)
+        # Store the generator architecture with the weights so loaders can rebuild it
+        if self.generator_config is not None and str(filepath).endswith(".h5"):
+            write_generator_config(filepath, self.generator_config)
+
+    def load_weights(self, filepath, *args, **kwargs):
+        # Delta checkpoints are rebuilt from their base network by network
+        if str(filepath).endswith(".h5") and is_delta_checkpoint(filepath):
+            for network in (self.gen_G, self.gen_F, self.disc_X, self.disc_Y):
+                load_network_weights(network, filepath)
+            return None
+        return super(CycleGan, self).load_weights(filepath, *args, **kwargs)
+
+    def train_step(self, batch_data):
+        # Get batch dataset for current training step
+        real_x, real_y = batch_data
+
+        # For CycleGAN, we need to calculate different
+        # kinds of losses for the generators and discriminators.
+        # We will perform the following steps here:
+        #
+        # 1. Pass real images through the generators and get the generated images
+        # 2. Pass the generated images back to the generators to check if we
+        #    we can predict the original image from the generated image.
+        # 3. Do an identity mapping of the real images using the generators.
+        # 4. Pass the generated images in 1) to the corresponding discriminators.
+        # 5. Calculate the generators total loss (adverserial + cycle + identity)
+        # 6. Calculate the discriminators loss
+        # 7. Update the weights of the generators
+        # 8. Update the weights of the discriminators
+        # 9. Return the losses in a dictionary
+
+        with tf.GradientTape(persistent=True) as tape:
+            # Generate a set of fake src -> dst style images
+            fake_y = self.gen_G(real_x, training=True)
+            # Generate a set of fake dst -> src style images
+            fake_x = self.gen_F(real_y, training=True)
+
+            # Cycle src -> dst -> src
+            cycled_x = self.gen_F(fake_y, training=True)
+            # Cycle dst -> src -> dst
+            cycled_y = self.gen_G(fake_x, training=True)
+
+            # Identity mapping
+            same_x = self.gen_F(real_x, training=True)
+            same_y = self.gen_G(real_y, training=True)
+
+            # Discriminator output
+            disc_real_x = self.disc_X(real_x, training=True)
+            disc_fake_x = self.disc_X(fake_x, training=True)
+
+            disc_real_y = self.disc_Y(real_y, training=True)
+            disc_fake_y = self.disc_Y(fake_y, training=True)
+
+            # Generator adverserial loss
+            gen_G_loss = self.generator_loss_fn(disc_fake_y)
+            gen_F_loss = self.generator_loss_fn(disc_fake_x)
+
+            # Generator cycle loss
+            cycle_loss_G = self.cycle_loss_fn(real_y, cycled_y) * self.lambda_cycle
+            cycle_loss_F = self.cycle_loss_fn(real_x, cycled_x) * self.lambda_cycle
+
+            # Generator identity loss
+            id_loss_G = (
+                self.identity_loss_fn(real_y, same_y)
+                * self.lambda_cycle
+                * self.lambda_identity
+            )
+            id_loss_F = (
+                self.identity_loss_fn(real_x, same_x)
+                * self.lambda_cycle
+                * self.lambda_identity
+            )
+
+            # Total generator loss
+            total_loss_G = gen_G_loss + cycle_loss_G + id_loss_G
+            total_loss_F = gen_F_loss + cycle_loss_F + id_loss_F
+
+            # Discriminator loss
+            disc_X_loss = self.discriminator_loss_fn(disc_real_x, disc_fake_x)
+            disc_Y_loss = self.discriminator_loss_fn(disc_real_y, disc_fake_y)
+
+        # Get the gradients for the generators
+        grads_G = tape.gradient(total_loss_G, self.gen_G.trainable_variables)
+        grads_F = tape.gradient(total_loss_F, self.gen_F.trainable_variables)
+
+        # Number of generator updates so far, read before this step's update
+        step = tf.identity(self.gen_G_optimizer.iterations)
+
+        # Update the weights of the generators
+        self.gen_G_optimizer.apply_gradients(
+            zip(grads_G, self.gen_G.trainable_variables)
+        )
+        self.gen_F_optimizer.apply_gradients(
+            zip(grads_F, self.gen_F.trainable_variables)
+        )
+
+        # Get the gradients for the discriminators and update their weights
+        disc_X_update = self.update_discriminator(tape, disc_X_loss, self.disc_X, self.disc_X_optimizer, step)
+        disc_Y_update = self.update_discriminator(tape, disc_Y_loss, self.disc_Y, self.disc_Y_optimizer, step)
+
+        losses = {
+            "G_loss": total_loss_G,
+            "F_loss": total_loss_F,
+            "D_X_loss": disc_X_loss,
+            "D_Y_loss": disc_Y_loss,
+        }
+        if disc_X_update is not None:
+            # Update rates of the epoch so far, not of the last step
+            self.disc_X_update_tracker.update_state(disc_X_update)
+            self.disc_Y_update_tracker.update_state(disc_Y_update)
+            losses["D_X_update"] = self.disc_X_update_tracker.result()
+            losses["D_Y_update"] = self.disc_Y_update_tracker.result()
+        return losses
+
+    def update_discriminator(self, tape, loss, discriminator, optimizer, step):
+        """Updates a discriminator unless its schedule skips this step.
+        Returns:
+            None without a schedule, otherwise 1.0 if the discriminator was updated and 0.0 if not.
+        """
+        if self.disc_update_interval == 1 and not self.disc_loss_threshold:
+            grads = tape.gradient(loss, discriminator.trainable_variables)
+            optimizer.apply_gradients(zip(grads, discriminator.trainable_variables))
+            return None
+
+        def update():
+            # The gradients are only computed in this branch, skipped steps never run the backward pass
+            grads = tape.gradient(loss, discriminator.trainable_variables)
+            optimizer.apply_gradients(zip(grads, discriminator.trainable_variables))
+            return tf.constant(1.0)
+
+        scheduled = tf.logical_and(
+            tf.equal(step % self.disc_update_interval, 0),
+            loss >= self.disc_loss_threshold,
+        )
+        return tf.cond(scheduled, update, lambda: tf.constant(0.0))
+
+    def test_step(self, batch_data):
+        # Same losses as train_step, without tapes or optimizers. Instance normalization
+        # is per image, so the calls sharing a network are concatenated into one batch:
+        #
+        # 1. gen_G(real_x, real_y) -> fake_y, same_y and gen_F(real_y, real_x) -> fake_x, same_x
+        # 2. gen_F(fake_y) -> cycled_x and gen_G(fake_x) -> cycled_y
+        # 3. disc_X(real_x, fake_x) and disc_Y(real_y, fake_y)
+        real_x, real_y = batch_data
+        batch_size = tf.shape(real_x)[0]
+
+        fake_y, same_y = tf.split(self.gen_G(tf.concat([real_x, real_y], 0), training=False), [batch_size, -1])
+        fake_x, same_x = tf.split(self.gen_F(tf.concat([real_y, real_x], 0), training=False), [batch_size, -1])
+
+        cycled_x = self.gen_F(fake_y, training=False)
+        cycled_y = self.gen_G(fake_x, training=False)
+
+        disc_real_x, disc_fake_x = tf.split(self.disc_X(tf.concat([real_x, fake_x], 0), training=False), 2)
+        disc_real_y, disc_fake_y = tf.split(self.disc_Y(tf.concat([real_y, fake_y], 0), training=False), 2)
+
+        gen_G_loss = self.generator_loss_fn(disc_fake_y)
+        gen_F_loss = self.generator_loss_fn(disc_fake_x)
+        cycle_loss_G = self.cycle_loss_fn(real_y, cycled_y) * self.lambda_cycle
+        cycle_loss_F = self.cycle_loss_fn(real_x, cycled_x) * self.lambda_cycle
+        id_loss_G = self.identity_loss_fn(real_y, same_y) * self.lambda_cycle * self.lambda_identity
+        id_loss_F = self.identity_loss_fn(real_x, same_x) * self.lambda_cycle * self.lambda_identity
+
+        losses = {
+            "G_loss": gen_G_loss + cycle_loss_G + id_loss_G,
+            "F_loss": gen_F_loss + cycle_loss_F + id_loss_F,
+            "D_X_loss": self.discriminator_loss_fn(disc_real_x, disc_fake_x),
+            "D_Y_loss": self.discriminator_loss_fn(disc_real_y, disc_fake_y),
+            "adversarial_loss": gen_G_loss + gen_F_loss,
+            "cycle_loss": cycle_loss_G + cycle_loss_F,
+            "identity_loss": id_loss_G + id_loss_F,
+        }
+        # Weighted by the images of the batch, so a smaller last batch counts for its size
+        for tracker in self.validation_trackers:
+            tracker.update_state(losses[tracker.name], sample_weight=tf.cast(batch_size, tf.float32))
+        return {tracker.name: tracker.result() for tracker in self.validation_trackers}
+
+
+# Loss function for evaluating adversarial loss
+adv_loss_fn = keras.losses.MeanSquaredError()
+
+# Define the loss function for the generators
+def generator_loss_fn(fake):
+    fake_loss = adv_loss_fn(tf.ones_like(fake), fake)
+    return fake_loss
+
+# Define the loss function for the discriminators
+def discriminator_loss_fn(real, fake):
+    real_loss = adv_loss_fn(tf.ones_like(real), real)
+    fake_loss = adv_loss_fn(tf.zeros_like(fake), fake)
+    return (real_loss + fake_loss) * 0.5
+
+
+"""
+## Builders that only construct the networks a command needs
+"""
+
+
+def build_generator(direction="A2B", input_img_size=(256, 256, 3), config=None):
+    """Builds the generator translating in `direction` ("A2B" or "B2A").
+    Args:
+        config(dict): Generator configuration from `cyclegan.variants.generator_config`.
+        Defaults to the original ResNet generator.
+    """
+    if config is None:
+        config = GENERATOR_VARIANTS[DEFAULT_VARIANT]
+    return get_resnet_generator(input_img_size=input_img_size, name=GENERATOR_NAMES[direction], **config)
+
+
+def build_cycle_gan(
+    input_img_size=(256, 256, 3),
+    generator_config=None,
+    lambda_cycle=10.0,
+    lambda_identity=0.5,
+    learning_rate=2e-4,
+    beta_1=0.5,
+    disc_update_interval=1,
+    disc_loss_threshold=0.0,
+):
+    """Builds and compiles the full CycleGAN with both generators and discriminators.
+    `disc_update_interval` and `disc_loss_threshold` schedule the discriminator
+    updates, see `CycleGan.compile`.
+    """
+    if generator_config is None:
+        generator_config = dict(GENERATOR_VARIANTS[DEFAULT_VARIANT])
+    cycle_gan_model = CycleGan(
+        generator_G=build_generator("A2B", input_img_size, generator_config),
+        generator_F=build_generator("B2A", input_img_size, generator_config),
+        discriminator_X=get_discriminator(input_img_size=input_img_size, name=DISCRIMINATOR_NAMES["A"]),
+        discriminator_Y=get_discriminator(input_img_size=input_img_size, name=DISCRIMINATOR_NAMES["B"]),
+        lambda_cycle=lambda_cycle,
+        lambda_identity=lambda_identity,
+        generator_config=generator_config,
+    )
+    cycle_gan_model.compile(
+        gen_G_optimizer=keras.optimizers.Adam(learning_rate=learning_rate, beta_1=beta_1),
+        gen_F_optimizer=keras.optimizers.Adam(learning_rate=learning_rate, beta_1=beta_1),
+        disc_X_optimizer=keras.optimizers.Adam(learning_rate=learning_rate, beta_1=beta_1),
+        disc_Y_optimizer=keras.optimizers.Adam(learning_rate=learning_rate, beta_1=beta_1),
+        gen_loss_fn=generator_loss_fn,
+        disc_loss_fn=discriminator_loss_fn,
+        disc_update_interval=disc_update_interval,
+        disc_loss_threshold=disc_loss_threshold,
+    )
+    return cycle_gan_model
+
+
+def _read_hdf5_attribute(group, name):
+    # Keras splits attributes larger than the HDF5 header limit into name0, name1, ...
+    if name in group.attrs:
+        values = list(group.attrs[name])
+    else:
+        values = []
+        chunk_id = 0
+        while "%s%d" % (name, chunk_id) in group.attrs:
+            values.extend(group.attrs["%s%d" % (name, chunk_id)])
+            chunk_id += 1
+    return [v.decode("utf8") if isinstance(v, bytes) else v for v in values]
+
+
+def write_generator_config(model_path, config):
+    """Stores the generator configuration as an attribute of an H5 weights file."""
+    import h5py
+
+    with h5py.File(model_path, "a") as f:
+        # Keras wraps dictionaries assigned to model attributes, so copy it first
+        f.attrs["generator_config"] = json.dumps(dict(config))
+
+
+def read_generator_config(model_path):
+    """Returns the generator configuration stored in an H5 weights file.
+    Files saved before configurations were stored hold the original ResNet generator.
+    """
+    import h5py
+
+    with h5py.File(model_path, "r") as f:
+        config = f.attrs.get("generator_config")
+    if config is None:
+        return dict(GENERATOR_VARIANTS[DEFAULT_VARIANT])
+    if isinstance(config, bytes):
+        config = config.decode("utf8")
+    return json.loads(config)
+
+
+def read_weight_names(group):
+    """Returns the weight names of one network group of an H5 weights file."""
+    return _read_hdf5_attribute(group, "weight_names")
+
+
+def xor_weights(value, base):
+    """Bitwise XOR of the raw bytes of two weight arrays of the same shape and item size.
+    A weight that barely moved keeps its sign, exponent and high mantissa bits,
+    so the XOR against its base is mostly zero bytes and compresses well, and
+    XORing the result with the base again restores the weight exactly.
+    """
+    bits = np.dtype("u%d" % base.dtype.itemsize)
+    return np.bitwise_xor(value.view(bits), base.view(bits))
+
+
+def is_delta_checkpoint(model_path):
+    import h5py
+
+    with h5py.File(model_path, "r") as f:
+        return "delta_base" in f.attrs
+
+
+def read_network_weights(model_path, name):
+    """Reads the weights of the network `name` from an H5 file, in the order of its `weights`.
+    Delta checkpoints (see `cyclegan.snapshots`) are combined with their base,
+    and float16 snapshots are cast back to float32.
+    """
+    import h5py
+
+    with h5py.File(model_path, "r") as f:
+        group = f[name]
+        values = [np.asarray(group[weight_name]) for weight_name in read_weight_names(group)]
+        base_file = f.attrs.get("delta_base")
+    if base_file is not None:
+        if isinstance(base_file, bytes):
+            base_file = base_file.decode("utf8")
+        base_values = read_network_weights(os.path.join(os.path.dirname(os.path.abspath(model_path)), base_file), name)
+        values = [xor_weights(delta, base).view(base.dtype) for delta, base in zip(values, base_values)]
+    return [value.astype(np.float32) if value.dtype == np.float16 else value for value in values]
+
+
+def load_network_weights(network, model_path):
+    """Loads the weights of one network from an H5 file written by `CycleGan.save_weights`.
+    The network must carry the name it was saved under (e.g. `generator_G`),
+    the other networks stored in the file are never read.
+    """
+    network.set_weights(read_network_weights(model_path, network.name))
+    return network
+
+
+def save_network_weights(networks, model_path, generator_config=None, dtype=None, compression=None):
+    """Saves networks in the same H5 layout as `CycleGan.save_weights`.
+    Used to save standalone generators (e.g. a distilled student), which then
+    load with `load_network_weights` and `load_generator` like any other model.
+    Args:
+        dtype: Casts the weights (e.g. to `np.float16` for compact snapshots).
+        compression(str): H5 compression filter of the weights (e.g. "gzip").
+    """
+    import h5py
+
+    with h5py.File(model_path, "w") as f:
+        f.attrs["layer_names"] = [network.name.encode("utf8") for network in networks]
+        for network in networks:
+            group = f.create_group(network.name)
+            group.attrs["weight_names"] = [weight.name.encode("utf8") for weight in network.weights]
+            for weight, value in zip(network.weights, network.get_weights()):
+                if dtype is not None:
+                    value = value.astype(dtype)
+                group.create_dataset(weight.name, data=value, compression=compression, shuffle=compression is not None)
+        if generator_config is not None:
+            f.attrs["generator_config"] = json.dumps(dict(generator_config))
+
+
+def load_generator(model_path, direction="A2B", input_img_size=(256, 256, 3)):
+    """Builds a single generator and loads its weights from a CycleGAN H5 file.
+    The architecture is rebuilt from the generator configuration stored in the file.
+    """
+    config = read_generator_config(model_path)
+    return load_network_weights(build_generator(direction, input_img_size, config), model_path)
@@ -0,0 +1,53 @@
+"""
+## Plotting helpers for datasets and translated samples
+"""
+import numpy as np
+
+
+def plot_translations(generator, dataset, num_img=4, title=None, save_path=None, show=True, figsize=(10, 15)):
+    """Plots input images next to their translation by `generator`.
+    Args:
+        generator: Generator used to translate the images.
+        dataset: Batched dataset of normalized images; the first image of
+        each of the first `num_img` batches is plotted.
+        save_path(str): Optional file path to save the figure to.
+    """
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(num_img, 2, figsize=figsize, squeeze=False)
+    if title is not None:
+        fig.suptitle(title, fontsize=30)
+    for i, img in enumerate(dataset.take(num_img)):
+        prediction = generator(img, training=False)[0].numpy()
+        prediction = (prediction * 127.5 + 127.5).astype(np.uint8)
+        img = (img[0] * 127.5 + 127.5).numpy().astype(np.uint8)
+
+        ax[i, 0].imshow(img)
+        ax[i, 1].imshow(prediction)
+        ax[i, 0].set_title("Input Image")
+        ax[i, 1].set_title("Translated Image")
+        ax[i, 0].axis("off")
+        ax[i, 1].axis("off")
+
+    plt.tight_layout()
+    if show:
+        plt.show()
+    # Save figure to .png image in specified folder
+    if save_path is not None:
+        fig.savefig(save_path)
+    plt.close(fig)
+
+
+def plot_samples(src_dataset, dst_dataset, num_img=4, show=True, figsize=(10, 15)):
+    """Plots the first image of `num_img` batches of both domains side by side."""
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(num_img, 2, figsize=figsize, squeeze=False)
+    for i, samples in enumerate(zip(src_dataset.take(num_img), dst_dataset.take(num_img))):
+        source_style = (((samples[0][0] * 127.5) + 127.5).numpy()).astype(np.uint8)
+        destination_style = (((samples[1][0] * 127.5) + 127.5).numpy()).astype(np.uint8)
+        ax[i, 0].imshow(source_style)
+        ax[i, 1].imshow(destination_style)
+    if show:
+        plt.show()
+    plt.close(fig)
@@ -0,0 +1,142 @@
+"""
+## Channel pruning of the generator residual blocks
+The residual blocks dominate the generator FLOPs. Inside every block the
+channels between the first and the second convolution can be removed without
+touching the residual stream:
+```
+x ==> conv1 (dim -> inner) => norm1 => relu => conv2 (inner -> dim) => norm2 => + x
+```
+While a `CycleGan` keeps training, `ChannelPruning` gradually zeroes the least
+important inner channels (their conv1 filters, norm1 gamma/beta and conv2
+inputs) until the target sparsity is reached. A zeroed channel outputs exactly
+zero, so `prune_generator` can then build a physically narrower generator that
+computes the same translation.
+"""
+import numpy as np
+from tensorflow import keras
+from tensorflow.keras import layers
+
+from cyclegan.layers import ReflectionConv2D
+from cyclegan.models import get_resnet_generator
+
+
+def residual_block_layers(generator):
+    """Returns the `(conv1, norm1, conv2)` layers of every standard residual block."""
+    blocks = []
+    generator_layers = generator.layers
+    for i, layer in enumerate(generator_layers):
+        if not isinstance(layer, layers.Add):
+            continue
+        conv1, norm1, _, conv2, _ = generator_layers[i - 5:i]
+        if not (isinstance(conv1, ReflectionConv2D) and isinstance(conv2, ReflectionConv2D)):
+            raise ValueError("Channel pruning only supports standard (not separable) residual blocks")
+        blocks.append((conv1, norm1, conv2))
+    return blocks
+
+
+def channel_importance(conv1, norm1):
+    # L1 norm of every conv1 filter, scaled by how much the normalization keeps of it
+    return np.abs(conv1.kernel.numpy()).sum(axis=(0, 1, 2)) * np.abs(norm1.gamma.numpy())
+
+
+def apply_channel_mask(conv1, norm1, conv2, mask):
+    """Zeroes the inner channels of a residual block where `mask` is 0."""
+    conv1.kernel.assign(conv1.kernel * mask[np.newaxis, np.newaxis, np.newaxis, :])
+    norm1.gamma.assign(norm1.gamma * mask)
+    norm1.beta.assign(norm1.beta * mask)
+    conv2.kernel.assign(conv2.kernel * mask[np.newaxis, np.newaxis, :, np.newaxis])
+
+
+def pruning_schedule(step, target_sparsity, begin_step, end_step):
+    # Polynomial schedule: prune quickly while the network has redundant channels, slowly near the target
+    if step <= begin_step:
+        return 0.0
+    progress = min(1.0, (step - begin_step) / max(1, end_step - begin_step))
+    return target_sparsity * (1.0 - (1.0 - progress) ** 3)
+
+
+class ChannelPruning(keras.callbacks.Callback):
+    """Gradually prunes the inner residual block channels of both generators during `fit()`.
+    Args:
+        target_sparsity(float): Fraction of inner channels removed from every block.
+        end_step(int): Training step at which the target sparsity is reached.
+        begin_step(int): Training step at which pruning starts.
+        frequency(int): Number of steps between recomputing the masks. The
+        masks are applied after every step, since the optimizer keeps updating
+        the pruned weights.
+    """
+
+    def __init__(self, target_sparsity, end_step, begin_step=0, frequency=100):
+        super(ChannelPruning, self).__init__()
+        self.target_sparsity = target_sparsity
+        self.begin_step = begin_step
+        self.end_step = end_step
+        self.frequency = frequency
+        self.step = 0
+        self.masks = {}
+
+    def blocks(self):
+        return residual_block_layers(self.model.gen_G) + residual_block_layers(self.model.gen_F)
+
+    def update_masks(self):
+        sparsity = pruning_schedule(self.step, self.target_sparsity, self.begin_step, self.end_step)
+        for conv1, norm1, conv2 in self.blocks():
+            channels = conv1.filters
+            importance = channel_importance(conv1, norm1)
+            # Channels pruned once stay pruned
+            mask = self.masks.get(conv1.name, np.ones(channels, dtype=np.float32))
+            importance[mask == 0] = -1.0
+            num_pruned = int(round(sparsity * channels))
+            mask = np.ones(channels, dtype=np.float32)
+            mask[np.argsort(importance)[:num_pruned]] = 0.0
+            self.masks[conv1.name] = mask
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.step += 1
+        if self.step % self.frequency == 0 or self.step == self.end_step:
+            self.update_masks()
+        if self.masks:
+            for conv1, norm1, conv2 in self.blocks():
+                apply_channel_mask(conv1, norm1, conv2, self.masks[conv1.name])
+
+    def on_epoch_end(self, epoch, logs=None):
+        if logs is not None:
+            logs["sparsity"] = pruning_schedule(self.step, self.target_sparsity, self.begin_step, self.end_step)
+
+
+def kept_channels(conv1, norm1):
+    # Channels whose filter or normalization still produces a non-zero output
+    alive = (np.abs(conv1.kernel.numpy()).sum(axis=(0, 1, 2)) > 0) & (
+        (np.abs(norm1.gamma.numpy()) > 0) | (np.abs(norm1.beta.numpy()) > 0)
+    )
+    return np.flatnonzero(alive)
+
+
+def prune_generator(generator, config):
+    """Builds a narrower copy of a channel pruned generator.
+    Args:
+        generator: Generator whose pruned channels have been zeroed.
+        config(dict): Generator configuration the generator was built with.
+    Returns:
+        The pruned generator and its generator configuration, which records
+        the remaining width of every residual block.
+    """
+    blocks = residual_block_layers(generator)
+    kept = [kept_channels(conv1, norm1) for conv1, norm1, _ in blocks]
+    # Keep at least one channel so every block stays a valid convolution
+    kept = [indices if len(indices) else np.array([0]) for indices in kept]
+
+    pruned_config = dict(config)
+    pruned_config["residual_filters"] = [int(len(indices)) for indices in kept]
+    pruned = get_resnet_generator(input_img_size=generator.input_shape[1:], name=generator.name, **pruned_config)
+
+    sliced = {}
+    for (conv1, norm1, conv2), indices in zip(blocks, kept):
+        sliced[conv1.name] = [conv1.kernel.numpy()[..., indices]]
+        sliced[norm1.name] = [norm1.gamma.numpy()[indices], norm1.beta.numpy()[indices]]
+        sliced[conv2.name] = [conv2.kernel.numpy()[:, :, indices, :]]
+
+    # Both generators share the same topology, so layers match by position
+    for layer, pruned_layer in zip(generator.layers, pruned.layers):
+        pruned_layer.set_weights(sliced.get(layer.name, layer.get_weights()))
+    return pruned, pruned_config
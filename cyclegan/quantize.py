@@ -0,0 +1,93 @@
+"""
+## Post-training int8 quantization of the generators
+Converts a generator to an int8 TFLite model. The activation ranges are
+calibrated on a random sample of images from the generator's source domain
+folder. The model keeps float32 inputs and outputs in the range [-1, 1], so it
+is a drop-in replacement for the Keras generator.
+"""
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from cyclegan.data import read_image, sample_image_paths
+
+
+def calibration_dataset(folder, input_img_size=(256, 256, 3), num_samples=100, seed=0):
+    """Returns a representative dataset callable drawing `num_samples` random images of `folder`."""
+    paths = sample_image_paths(folder, num_samples, seed)
+
+    def representative_dataset():
+        for path in paths:
+            yield [read_image(path, input_img_size).numpy()]
+
+    return representative_dataset
+
+
+def convert_to_int8_tflite(generator, representative_dataset, allow_float_fallback=False):
+    """Converts a Keras generator to an int8 TFLite flatbuffer.
+    Args:
+        generator: Keras generator with a fixed input size.
+        representative_dataset: Callable yielding calibration batches.
+        allow_float_fallback(bool): Keep ops without an int8 kernel in
+        float32 instead of failing the conversion.
+    Returns:
+        The serialized TFLite model.
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model(generator)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    if allow_float_fallback:
+        converter.target_spec.supported_ops.append(tf.lite.OpsSet.TFLITE_BUILTINS)
+    return converter.convert()
+
+
+class TFLiteGenerator:
+    """Runs a TFLite generator with the same call signature as the Keras one.
+    Args:
+        model_path(str): TFLite file to load.
+        num_threads(int): Number of CPU threads used by the interpreter.
+        model_content(bytes): Serialized TFLite model, used instead of `model_path`.
+    """
+
+    def __init__(self, model_path=None, num_threads=None, model_content=None):
+        self.interpreter = tf.lite.Interpreter(model_path=model_path, model_content=model_content, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self.input_details = self.interpreter.get_input_details()[0]
+        self.output_details = self.interpreter.get_output_details()[0]
+        self.batch_size = self.input_details["shape"][0]
+
+    def __call__(self, img, training=False):
+        img = np.asarray(img, dtype=np.float32)
+        if img.shape[0] != self.batch_size:
+            self.interpreter.resize_tensor_input(self.input_details["index"], img.shape)
+            self.interpreter.allocate_tensors()
+            self.batch_size = img.shape[0]
+
+        # Quantize the input if the model expects integer inputs
+        scale, zero_point = self.input_details["quantization"]
+        if self.input_details["dtype"] != np.float32:
+            img = np.round(img / scale + zero_point).astype(self.input_details["dtype"])
+        self.interpreter.set_tensor(self.input_details["index"], img)
+        self.interpreter.invoke()
+        output = self.interpreter.get_tensor(self.output_details["index"])
+
+        # Dequantize the output if the model produces integer outputs
+        scale, zero_point = self.output_details["quantization"]
+        if self.output_details["dtype"] != np.float32:
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output
+
+
+def export_int8_generator(generator, folder, export_path, input_img_size=(256, 256, 3), num_samples=100, allow_float_fallback=False):
+    """Calibrates on `folder`, converts `generator` to int8 and writes it to `export_path`."""
+    tflite_model = convert_to_int8_tflite(
+        generator,
+        calibration_dataset(folder, input_img_size, num_samples),
+        allow_float_fallback=allow_float_fallback,
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(export_path)), exist_ok=True)
+    with open(export_path, "wb") as f:
+        f.write(tflite_model)
+    return export_path
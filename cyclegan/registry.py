@@ -0,0 +1,168 @@
+"""
+## Registry of trained models
+Maps model names to checkpoints, so one process can translate with many
+trained pairs without restarts. The registry is a JSON file; relative paths
+are resolved against its folder:
+```
+{
+    "horse2zebra": {"model_path": "horse2zebra/model_27.h5"},
+    "maps": {"export_dir": "export/maps", "size": [512, 512], "preload": true}
+}
+```
+Generators are loaded on first use and kept resident while their weights fit
+in `max_memory_mb`. Loading one more evicts the least recently used
+generators, and generators marked `preload` are loaded up front so their
+first request is not slowed down by loading.
+"""
+import collections
+import gc
+import json
+import os
+import threading
+import time
+
+from cyclegan.backends import DEFAULT_BACKEND
+from cyclegan.cache import weights_fingerprint
+from cyclegan.translator import load_translation_fn
+
+
+def read_registry(path):
+    """Reads a registry file into a dict of entries with absolute paths."""
+    with open(path) as f:
+        entries = json.load(f)
+    folder = os.path.dirname(os.path.abspath(path))
+    for name, entry in entries.items():
+        if ("model_path" in entry) == ("export_dir" in entry):
+            raise ValueError("Registry entry %r needs exactly one of model_path and export_dir" % name)
+        for key in ("model_path", "export_dir"):
+            if key in entry:
+                entry[key] = os.path.join(folder, entry[key])
+    return entries
+
+
+def generator_memory_bytes(generator):
+    # Weights only: activations are transient and depend on the batch and image size
+    variables = generator.module.generator_variables if hasattr(generator, "module") else generator.variables
+    return sum(variable.numpy().nbytes for variable in variables)
+
+
+class ModelRegistry:
+    """Loads the generators of named checkpoints on demand and keeps an LRU set of them resident.
+    Args:
+        entries(dict): Maps model names to entries with a `model_path` or an
+        `export_dir`, and optionally a translation `size` and `preload`.
+        max_memory_mb(float): Budget for the weights of resident generators.
+        bucket(int): Shape bucket size of native resolution translations.
+        backend(str): Backend of `cyclegan.backends` running H5 generators.
+        compile_cache_dir(str): Folder of the traced graphs kept across processes.
+    """
+
+    def __init__(self, entries, max_memory_mb=2048, bucket=64, backend=DEFAULT_BACKEND, compile_cache_dir=None):
+        self.entries = entries
+        self.max_memory = max_memory_mb * 2 ** 20
+        self.bucket = bucket
+        self.backend = backend
+        self.compile_cache_dir = compile_cache_dir
+        self.lock = threading.Lock()
+        self.resident = collections.OrderedDict()
+        self.memory = 0
+        self.fingerprints = {}
+        self.load_locks = collections.defaultdict(threading.Lock)
+        self.stats = {"hits": 0, "loads": 0, "evictions": 0, "load_seconds": 0.0}
+
+    @property
+    def names(self):
+        return sorted(self.entries)
+
+    def input_img_size(self, name):
+        size = self.entries[name].get("size")
+        return None if size is None else (*size, 3)
+
+    def get(self, name, direction):
+        """Returns the translation callable of one generator, loading it if needed."""
+        if name not in self.entries:
+            raise KeyError("Unknown model %r, available: %s" % (name, ", ".join(self.names)))
+        key = (name, direction)
+        with self.lock:
+            if key in self.resident:
+                self.resident.move_to_end(key)
+                self.stats["hits"] += 1
+                return self.resident[key][0]
+        # Concurrent requests for the same generator wait for a single load
+        with self.load_locks[key]:
+            with self.lock:
+                if key in self.resident:
+                    self.resident.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return self.resident[key][0]
+            return self.load(name, direction)
+
+    def load(self, name, direction):
+        entry = self.entries[name]
+        start = time.perf_counter()
+        predict, generator = load_translation_fn(
+            direction,
+            entry.get("model_path"),
+            entry.get("export_dir"),
+            self.input_img_size(name),
+            self.bucket,
+            # Exported generators always run their SavedModel signatures
+            DEFAULT_BACKEND if "export_dir" in entry else self.backend,
+            self.compile_cache_dir,
+        )
+        size = generator_memory_bytes(generator)
+        fingerprint = weights_fingerprint(generator)
+        with self.lock:
+            self.fingerprints[(name, direction)] = fingerprint
+            # Evict cold generators, but always keep the one just loaded
+            while self.resident and self.memory + size > self.max_memory:
+                _, (_, evicted_size) = self.resident.popitem(last=False)
+                self.memory -= evicted_size
+                self.stats["evictions"] += 1
+            self.resident[(name, direction)] = (predict, size)
+            self.memory += size
+            self.stats["loads"] += 1
+            self.stats["load_seconds"] += time.perf_counter() - start
+        del generator
+        gc.collect()
+        return predict
+
+    def fingerprint(self, name, direction):
+        """Returns the weights fingerprint of one generator, loading it if it never was."""
+        if (name, direction) not in self.fingerprints:
+            self.get(name, direction)
+        return self.fingerprints[(name, direction)]
+
+    def preload(self, names=None, directions=("A2B", "B2A"), image_sizes=(), batch_sizes=(1,)):
+        """Loads the generators of `names`, by default of every entry marked `preload`.
+        Args:
+            image_sizes(list): `(height, width)` sizes every generator is warmed
+            up with, see `cyclegan.compile_cache.warm_up`. Entries with a
+            `size` are warmed up at that size.
+        Returns:
+            The seconds spent warming up.
+        """
+        from cyclegan.compile_cache import warm_up
+
+        if names is None:
+            names = [name for name in self.names if self.entries[name].get("preload")]
+        warm_up_s = 0.0
+        for name in names:
+            input_img_size = self.input_img_size(name)
+            sizes = image_sizes if input_img_size is None else [input_img_size[:2]]
+            for direction in directions:
+                warm_up_s += warm_up(self.get(name, direction), sizes, batch_sizes)
+        return warm_up_s
+
+    def translation_fn(self, name, direction):
+        # Looks the generator up on every call, so it can be evicted and reloaded in between
+        return lambda images: self.get(name, direction)(images)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(
+                self.stats,
+                resident=["%s/%s" % key for key in self.resident],
+                memory_mb=self.memory / 2 ** 20,
+                max_memory_mb=self.max_memory / 2 ** 20,
+            )
@@ -0,0 +1,189 @@
+"""
+## Frame sequence translation with change detection
+Translates an ordered folder of video frames. Consecutive frames are often
+near-identical, so every frame is compared with the last translated frame
+(the key frame) on a small grayscale thumbnail:
+```
+mean |thumbnail(frame) - thumbnail(key frame)| < threshold  ==>  reuse the key frame translation
+                                                 otherwise  ==>  new key frame, translated in a batch
+```
+Comparing with the key frame rather than the previous frame keeps slow
+drift (a pan, a fade) from accumulating: once the difference adds up past
+the threshold, a new key frame is translated.
+"""
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import tensorflow as tf
+
+from cyclegan.batch import encode_translation, output_path_for, write_file_atomically
+from cyclegan.data import autotune, list_image_paths, normalize_img
+
+
+def natural_sort_key(path):
+    # frame_2.png sorts before frame_10.png
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", path)]
+
+
+def frame_dataset(paths, input_img_size=None, thumbnail_size=64):
+    """Streams `(path, image, thumbnail)` triples in order, decoding frames in parallel.
+    The thumbnail is a `[thumbnail_size, thumbnail_size, 1]` grayscale image in [0, 1].
+    Frames that cannot be read or decoded are left out.
+    """
+
+    def decode(path):
+        img = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+        img.set_shape([None, None, 3])
+        thumbnail = tf.image.rgb_to_grayscale(tf.image.resize(img, [thumbnail_size, thumbnail_size])) / 255.0
+        if input_img_size is not None:
+            img = tf.image.resize(img, input_img_size[:2])
+        return path, normalize_img(img), thumbnail
+
+    dataset = tf.data.Dataset.from_tensor_slices(paths).map(decode, num_parallel_calls=autotune)
+    # Dataset.ignore_errors replaced the experimental transformation in newer TensorFlow versions
+    if hasattr(dataset, "ignore_errors"):
+        return dataset.ignore_errors().prefetch(autotune)
+    return dataset.apply(tf.data.experimental.ignore_errors()).prefetch(autotune)
+
+
+def decode_error(path):
+    # Decode a skipped frame again to report why it failed
+    try:
+        tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+    except (tf.errors.OpError, ValueError) as e:
+        return str(e)
+    return "could not be decoded"
+
+
+def translate_sequence(
+    predict,
+    input_dir,
+    output_dir,
+    threshold=0.01,
+    batch_size=8,
+    input_img_size=None,
+    output_format="png",
+    num_writers=4,
+):
+    """Translates the frames below `input_dir`, reusing translations of unchanged frames.
+    Args:
+        predict: Callable mapping a list of normalized `[height, width, 3]`
+        images to their translations.
+        threshold(float): Largest mean absolute thumbnail difference, in
+        [0, 1], of a frame that reuses the key frame translation.
+        batch_size(int): Number of key frames per generator call.
+        input_img_size(tuple): Size frames are resized to before translation,
+        or None to translate them at their native resolution.
+        num_writers(int): Threads encoding and writing translations.
+    Returns:
+        A summary with the frame counts, the skip rate, the frames per second
+        and the `(path, error)` of every frame that failed to decode or write.
+    """
+    paths = sorted(list_image_paths(input_dir), key=natural_sort_key)
+    writers = ThreadPoolExecutor(num_writers)
+    # Submitted writes with the output files they write
+    writes = []
+    failed = []
+    decoded_paths = set()
+    inference_seconds = 0.0
+
+    # Key frames waiting for translation, each with the output files of the frames reusing it
+    pending = []
+    key_thumbnail = None
+    key_write = None
+    num_translated = 0
+
+    def collect(write, output_files):
+        # Failed writes are reported, not dropped with their future
+        try:
+            write.result()
+        except Exception as e:
+            failed.extend((output_file, str(e)) for output_file in output_files)
+
+    def flush():
+        nonlocal inference_seconds, key_write
+        start = time.perf_counter()
+        translations = predict([img for img, _ in pending])
+        inference_seconds += time.perf_counter() - start
+        for translation, (_, output_files) in zip(translations, pending):
+            key_write = writers.submit(write_key_frame, np.asarray(translation), output_files)
+            writes.append((key_write, output_files))
+        pending.clear()
+        # Finished writes hold on to their encoded bytes, and too many queued ones to translations
+        for write in [write for write in writes if write[0].done()]:
+            writes.remove(write)
+            collect(*write)
+        while len(writes) > 4 * num_writers:
+            collect(*writes.pop(0))
+
+    start_time = time.perf_counter()
+    for path, img, thumbnail in frame_dataset(paths, input_img_size):
+        path = path.numpy().decode("utf8")
+        decoded_paths.add(path)
+        output_file = output_path_for(path, input_dir, output_dir, output_format)
+        if key_thumbnail is not None and float(tf.reduce_mean(tf.abs(thumbnail - key_thumbnail))) < threshold:
+            if pending:
+                pending[-1][1].append(output_file)
+            else:
+                # The key frame was already translated, write its encoded bytes once they exist
+                writes.append((writers.submit(write_reused_frame, key_write, output_file), [output_file]))
+            continue
+        key_thumbnail = thumbnail
+        pending.append((img, [output_file]))
+        num_translated += 1
+        if len(pending) == batch_size:
+            flush()
+    if pending:
+        flush()
+    for write in writes:
+        collect(*write)
+    writers.shutdown()
+    wall_time = time.perf_counter() - start_time
+    failed = [(path, decode_error(path)) for path in paths if path not in decoded_paths] + failed
+
+    num_frames = len(decoded_paths)
+    return {
+        "frames": num_frames,
+        "translated": num_translated,
+        "reused": num_frames - num_translated,
+        "skip_rate": (num_frames - num_translated) / max(num_frames, 1),
+        "failed": failed,
+        "seconds": wall_time,
+        "frames_per_second": num_frames / max(wall_time, 1e-9),
+        "generator_frames_per_second": num_translated / max(inference_seconds, 1e-9),
+    }
+
+
+def write_key_frame(translation, output_files):
+    # Encode once, then write the same bytes for the key frame and every frame reusing it
+    data = encode_translation(translation, output_files[0])
+    for output_file in output_files:
+        write_file_atomically(data, output_file)
+    return data
+
+
+def write_reused_frame(key_write, output_file):
+    # The key frame write was submitted first, so it is running or done by the time this waits on it
+    write_file_atomically(key_write.result(), output_file)
+
+
+def format_sequence_summary(summary):
+    lines = [
+        "%d frames: translated %d, reused %d (%.1f%% skipped) in %.1f s, %d failed\n"
+        "effective %.2f frames/sec, generator %.2f frames/sec"
+        % (
+            summary["frames"],
+            summary["translated"],
+            summary["reused"],
+            summary["skip_rate"] * 100.0,
+            summary["seconds"],
+            len(summary["failed"]),
+            summary["frames_per_second"],
+            summary["generator_frames_per_second"],
+        )
+    ]
+    for path, error in summary["failed"]:
+        lines.append("failed: %s (%s)" % (path, error.splitlines()[0] if error else ""))
+    return "\n".join(lines)
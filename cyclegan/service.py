@@ -0,0 +1,238 @@
+"""
+## Local HTTP translation service
+Loads the generators once and translates uploaded images over HTTP:
+```
+POST /translate/A2B               JPG or PNG bytes in, PNG bytes out
+POST /translate/B2A
+POST /translate/horse2zebra/A2B   with a `ModelRegistry`, one route per model and direction
+GET  /metrics                     JSON latency, batch size and throughput metrics
+GET  /health
+```
+Running the generator at batch size 1 leaves most of the CPU idle, so
+concurrent requests are coalesced into micro-batches: the first request of a
+batch waits at most `max_latency_ms` for others to join, and a batch is run
+as soon as it holds `max_batch_size` images. Requests are decoded and encoded
+on their own handler threads, the batching thread only runs the generator.
+With a `ResultCache`, repeated uploads are answered without translating them.
+"""
+import collections
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import tensorflow as tf
+
+from cyclegan.data import denormalize_img, normalize_img
+
+
+class ServiceMetrics:
+    """Collects request latencies and batch sizes over a sliding window."""
+
+    def __init__(self, window=1000):
+        self.lock = threading.Lock()
+        self.start_time = time.perf_counter()
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.latencies = collections.deque(maxlen=window)
+        self.queue_waits = collections.deque(maxlen=window)
+        self.batch_sizes = collections.deque(maxlen=window)
+
+    def record_batch(self, size, queue_waits):
+        with self.lock:
+            self.batches += 1
+            self.batch_sizes.append(size)
+            self.queue_waits.extend(queue_waits)
+
+    def record_request(self, latency, error=False):
+        with self.lock:
+            self.requests += 1
+            self.errors += int(error)
+            if not error:
+                self.latencies.append(latency)
+
+    def snapshot(self):
+        with self.lock:
+            uptime = time.perf_counter() - self.start_time
+            latencies = np.array(self.latencies or [0.0]) * 1000.0
+            return {
+                "uptime_s": uptime,
+                "requests": self.requests,
+                "errors": self.errors,
+                "batches": self.batches,
+                "requests_per_second": self.requests / max(uptime, 1e-9),
+                "mean_batch_size": float(np.mean(self.batch_sizes)) if self.batch_sizes else 0.0,
+                "latency_ms": {
+                    "p50": float(np.percentile(latencies, 50)),
+                    "p95": float(np.percentile(latencies, 95)),
+                    "p99": float(np.percentile(latencies, 99)),
+                },
+                "mean_queue_wait_ms": float(np.mean(self.queue_waits)) * 1000.0 if self.queue_waits else 0.0,
+            }
+
+
+class MicroBatcher:
+    """Coalesces single-image translation requests into batches on one thread.
+    Args:
+        predict: Callable mapping a list of normalized `[height, width, 3]`
+        images to their translations, e.g. `Translator.translate_batch`.
+        max_batch_size(int): Largest number of images per generator call.
+        max_latency_ms(float): Longest time the first request of a batch
+        waits for more requests before the batch is run.
+    """
+
+    def __init__(self, predict, metrics, max_batch_size=8, max_latency_ms=20.0):
+        self.predict = predict
+        self.metrics = metrics
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000.0
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, img):
+        """Queues one normalized image and returns a `Future` of its translation."""
+        future = Future()
+        self.requests.put((img, future, time.perf_counter()))
+        return future
+
+    def next_batch(self):
+        batch = [self.requests.get()]
+        deadline = batch[0][2] + self.max_latency
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            start = time.perf_counter()
+            self.metrics.record_batch(len(batch), [start - submitted for _, _, submitted in batch])
+            try:
+                translations = self.predict([img for img, _, _ in batch])
+            except Exception as e:  # Fail the requests of the batch, not the service
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), translation in zip(batch, translations):
+                future.set_result(translation)
+
+
+def make_handler(batchers, metrics, input_img_sizes, cache=None, key_fns=None, reports=None):
+    class TranslationHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def send_body(self, status, body, content_type):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_json(self, status, value):
+            self.send_body(status, json.dumps(value).encode("utf8"), "application/json")
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                snapshot = metrics.snapshot()
+                for name, report in (reports or {}).items():
+                    snapshot[name] = report()
+                self.send_json(200, snapshot)
+            elif self.path == "/health":
+                self.send_json(200, {"status": "ok", "routes": sorted(batchers)})
+            else:
+                self.send_json(404, {"error": "Unknown path %s" % self.path})
+
+        def do_POST(self):
+            start = time.perf_counter()
+            route = self.path[len("/translate/") :]
+            data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if not self.path.startswith("/translate/") or route not in batchers:
+                self.send_json(404, {"error": "Available routes: %s" % ", ".join(sorted(batchers))})
+                return
+            input_img_size = input_img_sizes.get(route)
+            key = key_fns[route](data) if cache is not None else None
+            cached_data = cache.get(key) if cache is not None else None
+            if cached_data is not None:
+                metrics.record_request(time.perf_counter() - start)
+                self.send_body(200, cached_data, "image/png")
+                return
+            try:
+                img = tf.io.decode_image(data, channels=3, expand_animations=False)
+            except tf.errors.OpError:
+                metrics.record_request(time.perf_counter() - start, error=True)
+                self.send_json(400, {"error": "The request body is not a JPG or PNG image"})
+                return
+            original_size = img.shape[:2]
+            if input_img_size is not None:
+                img = tf.image.resize(img, input_img_size[:2])
+            try:
+                translation = batchers[route].submit(normalize_img(img)).result()
+            except Exception as e:
+                metrics.record_request(time.perf_counter() - start, error=True)
+                self.send_json(500, {"error": str(e)})
+                return
+            if input_img_size is not None:
+                translation = tf.image.resize(translation, original_size)
+            body = tf.io.encode_png(denormalize_img(translation)).numpy()
+            if cache is not None:
+                cache.put(key, body)
+            metrics.record_request(time.perf_counter() - start)
+            self.send_body(200, body, "image/png")
+
+        def log_message(self, format, *args):
+            # Per-request logging would dominate the output under load, see /metrics instead
+            pass
+
+    return TranslationHandler
+
+
+def serve(
+    generators,
+    host="127.0.0.1",
+    port=8000,
+    max_batch_size=8,
+    max_latency_ms=20.0,
+    input_img_sizes=None,
+    cache=None,
+    key_fns=None,
+    reports=None,
+):
+    """Serves the generators over HTTP until interrupted.
+    Args:
+        generators(dict): Maps routes (e.g. "A2B" or "horse2zebra/A2B") to
+        callables taking a list of normalized images.
+        input_img_sizes(dict): Maps routes to the size images are resized to
+        before translation. Routes without a size translate images at their
+        native resolution.
+        cache: `ResultCache` of encoded translations.
+        key_fns(dict): Maps routes to callables computing the cache key of
+        the uploaded bytes.
+        reports(dict): Extra `/metrics` sections, mapping names to callables
+        returning JSON serializable values.
+    """
+    metrics = ServiceMetrics()
+    batchers = {
+        route: MicroBatcher(predict, metrics, max_batch_size, max_latency_ms) for route, predict in generators.items()
+    }
+    server = ThreadingHTTPServer(
+        (host, port), make_handler(batchers, metrics, input_img_sizes or {}, cache, key_fns, reports)
+    )
+    server.daemon_threads = True
+    print("Serving %s on http://%s:%d" % (", ".join(sorted(batchers)), host, server.server_port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
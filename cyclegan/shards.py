@@ -0,0 +1,180 @@
+"""
+## Tar shards of encoded images
+Reading a domain folder means one small random read per image, which is
+slow on network filesystems and object storage mirrors. `write_shards` packs
+a folder into a few large tar files of the encoded images, in the style of
+WebDataset, and the readers stream them back with large sequential reads:
+```
+shards/trainA/
+    index.json          shards, member names, offsets and sizes
+    train-000000.tar    sub/img_001.jpg, img_002.png, ...
+    train-000001.tar
+    test-000000.tar     held-out images, if any
+```
+Every image keeps its relative path and its original encoded bytes. The
+images are shuffled across the shards when they are written, and readers
+shuffle the shard order and interleave several shards, so a small shuffle
+buffer is enough to mix the training samples.
+
+A shard folder can be passed wherever a domain folder is expected: the
+training datasets, `image_folder_dataset`, `sample_dataset`, the evaluation
+and the batch command all read it transparently. Only local files are
+needed; mount or mirror remote storage to read it.
+"""
+import io
+import json
+import os
+import random
+import tarfile
+
+import tensorflow as tf
+
+from cyclegan.data import autotune, list_image_paths
+
+INDEX_FILE = "index.json"
+
+
+def is_shard_dir(path):
+    return path is not None and os.path.isfile(os.path.join(path, INDEX_FILE))
+
+
+def read_index(shard_dir):
+    with open(os.path.join(shard_dir, INDEX_FILE)) as f:
+        return json.load(f)
+
+
+def shard_paths(shard_dir, split="train"):
+    """Returns the tar files of one split of a shard folder."""
+    return [os.path.join(shard_dir, shard["file"]) for shard in read_index(shard_dir)["splits"].get(split, [])]
+
+
+def has_test_split(shard_dir):
+    # Whether held-out test shards were written, see `write_shards`
+    return bool(shard_paths(shard_dir, "test"))
+
+
+def write_shards(input_dir, output_dir, shard_size_mb=256, validation_split=0.1, seed=0):
+    """Packs the images below `input_dir` into tar shards in `output_dir`.
+    Args:
+        shard_size_mb(float): A new shard is started once a shard reaches this size.
+        validation_split(float): Fraction of the images written to separate
+        `test` shards, which the training datasets hold out.
+        seed(int): Seed of the order of the images in the shards.
+    Returns:
+        The index, listing the shards of every split with their members.
+    """
+    paths = list_image_paths(input_dir)
+    random.Random(seed).shuffle(paths)
+    num_test = int(round(len(paths) * validation_split)) if validation_split else 0
+    splits = {"train": paths[num_test:], "test": paths[:num_test]}
+
+    os.makedirs(output_dir, exist_ok=True)
+    index = {"format": 1, "splits": {}}
+    for split, split_paths in splits.items():
+        shards = []
+        tar = None
+        for path in split_paths:
+            if tar is None or tar.offset >= shard_size_mb * 2 ** 20:
+                if tar is not None:
+                    tar.close()
+                shards.append({"file": "%s-%06d.tar" % (split, len(shards)), "members": []})
+                tar = tarfile.open(os.path.join(output_dir, shards[-1]["file"]), "w", format=tarfile.PAX_FORMAT)
+            with open(path, "rb") as f:
+                data = f.read()
+            name = os.path.relpath(path, input_dir).replace(os.sep, "/")
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+            # Data offsets let single images be read without scanning the shard
+            offset = tar.offset - -(-len(data) // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+            shards[-1]["members"].append([name, offset, len(data)])
+        if tar is not None:
+            tar.close()
+        if shards:
+            index["splits"][split] = shards
+    # Written last, so a folder without an index is never mistaken for complete shards
+    with open(os.path.join(output_dir, INDEX_FILE), "w") as f:
+        json.dump(index, f)
+    return index
+
+
+def iter_shard_members(path):
+    """Yields the `(name, data)` of every file of a tar shard, reading it sequentially."""
+    if isinstance(path, bytes):
+        path = path.decode("utf8")
+    with open(path, "rb", buffering=2 ** 20) as f, tarfile.open(fileobj=f, mode="r|") as tar:
+        for member in tar:
+            if member.isfile():
+                yield member.name, tar.extractfile(member).read()
+
+
+def shard_files_dataset(shard_dir, split="train", shuffle=True, cycle_length=4, seed=None):
+    """Streams the `(name, encoded bytes)` pairs of one split of a shard folder.
+    Args:
+        shuffle(bool): Shuffle the shard order every epoch and interleave the
+        shards without a fixed order. Otherwise the shards are read one after
+        the other, in the order they were written.
+        cycle_length(int): Number of shards read at the same time when shuffling.
+    """
+    paths = shard_paths(shard_dir, split)
+    if not paths:
+        raise ValueError("No %s shards in %s" % (split, shard_dir))
+    dataset = tf.data.Dataset.from_tensor_slices(paths)
+    signature = (tf.TensorSpec([], tf.string), tf.TensorSpec([], tf.string))
+
+    def read_shard(path):
+        return tf.data.Dataset.from_generator(iter_shard_members, args=(path,), output_signature=signature)
+
+    if not shuffle:
+        return dataset.flat_map(read_shard)
+    dataset = dataset.shuffle(len(paths), seed=seed, reshuffle_each_iteration=True)
+    return dataset.interleave(
+        read_shard, cycle_length=min(cycle_length, len(paths)), num_parallel_calls=autotune, deterministic=False
+    )
+
+
+def shard_dataset(shard_dir, label=0, split="train", shuffle=True, cycle_length=4, seed=None):
+    """Streams decoded `(image, label)` pairs from a shard folder, like `image_folder_dataset`."""
+
+    def decode(name, data):
+        return tf.io.decode_image(data, channels=3, expand_animations=False), label
+
+    return shard_files_dataset(shard_dir, split, shuffle, cycle_length, seed).map(decode, num_parallel_calls=autotune)
+
+
+def read_members(shard_dir, members):
+    """Reads the encoded bytes of a few `[name, offset, size]` index members with one seek each."""
+    data = []
+    for shard_file, (_, offset, size) in members:
+        with open(os.path.join(shard_dir, shard_file), "rb") as f:
+            f.seek(offset)
+            data.append(f.read(size))
+    return data
+
+
+def sample_members(shard_dir, num_samples, seed=None, split="train"):
+    """Picks `num_samples` random images of a shard folder, as `(shard file, member)` pairs."""
+    members = [
+        (shard["file"], member) for shard in read_index(shard_dir)["splits"].get(split, []) for member in shard["members"]
+    ]
+    return random.Random(seed).sample(members, min(num_samples, len(members)))
+
+
+def shard_datasets(input_dir, output_dir):
+    """Streams the `(image, label)` datasets of two shard folders, like `load_datasets`.
+    Returns:
+        train_src, train_dst, test_src and test_dst datasets. The test sets
+        are the `test` shards, or the training shards if none were written:
+        good enough for sample plots, but not for validation losses.
+    """
+
+    def test_dataset(shard_dir, label):
+        split = "test" if has_test_split(shard_dir) else "train"
+        return shard_dataset(shard_dir, label, split, shuffle=False)
+
+    return (
+        shard_dataset(input_dir, 0),
+        shard_dataset(output_dir, 1),
+        test_dataset(input_dir, 0),
+        test_dataset(output_dir, 1),
+    )
@@ -0,0 +1,64 @@
+"""
+## Compact checkpoints
+Two formats that take less storage than a float32 H5 file of all four
+networks every epoch:
+
+* Generator snapshots: `gen_G` and `gen_F` only, stored as compressed
+  float16. Enough for sampling, translating and evaluating an epoch.
+* Delta checkpoints: every network, stored as the compressed bitwise XOR
+  against a periodic full base checkpoint of the same folder. Lossless, so
+  training can continue from them exactly.
+
+Both use the layout of `CycleGan.save_weights`, and `read_network_weights`
+reads them transparently, so every loader (`load_generator`,
+`CycleGan.load_weights`, the command line) accepts them like full files. A
+delta checkpoint needs its base file next to it.
+"""
+import json
+import os
+
+import h5py
+import numpy as np
+
+from cyclegan.models import read_network_weights, read_weight_names, save_network_weights, xor_weights
+
+
+def save_generator_snapshot(model, model_path):
+    """Saves the generators of a CycleGAN as compressed float16."""
+    save_network_weights([model.gen_G, model.gen_F], model_path, model.generator_config, np.float16, "gzip")
+
+
+def save_delta_checkpoint(model, model_path, base_path):
+    """Saves every network of a CycleGAN as its difference from the full checkpoint `base_path`."""
+    networks = [model.gen_G, model.gen_F, model.disc_X, model.disc_Y]
+    with h5py.File(model_path, "w") as f:
+        # Keep the Keras version attributes of the base, Keras reads older files differently
+        with h5py.File(base_path, "r") as base_file:
+            for key, value in base_file.attrs.items():
+                f.attrs[key] = value
+        f.attrs["layer_names"] = [network.name.encode("utf8") for network in networks]
+        # Relative to the checkpoint, so the folder can be moved as a whole
+        f.attrs["delta_base"] = os.path.relpath(os.path.abspath(base_path), os.path.dirname(os.path.abspath(model_path)))
+        if model.generator_config is not None:
+            f.attrs["generator_config"] = json.dumps(dict(model.generator_config))
+        for network in networks:
+            group = f.create_group(network.name)
+            group.attrs["weight_names"] = [weight.name.encode("utf8") for weight in network.weights]
+            base_values = read_network_weights(base_path, network.name)
+            for weight, value, base in zip(network.weights, network.get_weights(), base_values):
+                group.create_dataset(weight.name, data=xor_weights(value, base), compression="gzip", shuffle=True)
+
+
+def reconstruct_checkpoint(model_path, output_path):
+    """Writes any checkpoint or delta checkpoint back as a standalone float32 H5 file."""
+    with h5py.File(model_path, "r") as source, h5py.File(output_path, "w") as f:
+        for key, value in source.attrs.items():
+            if key != "delta_base":
+                f.attrs[key] = value
+        for name in source:
+            group = f.create_group(name)
+            for key, value in source[name].attrs.items():
+                group.attrs[key] = value
+            weight_names = read_weight_names(source[name])
+            for weight_name, value in zip(weight_names, read_network_weights(model_path, name)):
+                group.create_dataset(weight_name, data=value)
@@ -0,0 +1,331 @@
+"""
+## Hyperparameter sweeps
+Runs many short training trials in parallel and stops the weak ones early:
+
+* Every trial is a process pinned to its own CPU cores, with TensorFlow and
+  OpenMP limited to that many threads, so trials do not fight over cores.
+* The dataset folders are decoded, split and resized once into `.npy` files
+  that every trial loads, and that later sweeps over the same folders reuse.
+* Successive halving: all trials train for `min_epochs`, are ranked by a
+  held-out validation metric, and only the best `1 / reduction_factor` of
+  them continue from their checkpoint, until `max_epochs`.
+
+Every rung of every trial is appended to `results.jsonl` in the sweep folder,
+and the last rung of each trial is summarized in `results.md`.
+"""
+import contextlib
+import hashlib
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from cyclegan.variants import DEFAULT_VARIANT
+
+# Hyperparameters a trial can set, with the defaults of build_cycle_gan and the train command
+TRIAL_DEFAULTS = {
+    "lambda_cycle": 10.0,
+    "lambda_identity": 0.5,
+    "learning_rate": 2e-4,
+    "generator": DEFAULT_VARIANT,
+    "width_multiplier": 1.0,
+}
+
+
+def sweep_trials(space, num_trials=None, seed=0):
+    """Returns the trials of a grid of hyperparameters.
+    Args:
+        space(dict): Maps keys of `TRIAL_DEFAULTS` to the values to try.
+        num_trials(int): Randomly picks this many grid points instead of all of them.
+    """
+    keys = sorted(space)
+    grid = [dict(zip(keys, values)) for values in itertools.product(*(space[key] for key in keys))]
+    if num_trials is not None and num_trials < len(grid):
+        grid = random.Random(seed).sample(grid, num_trials)
+    return [dict(TRIAL_DEFAULTS, trial="trial_%03d" % i, **params) for i, params in enumerate(grid)]
+
+
+def halving_budgets(min_epochs, max_epochs, reduction_factor=3):
+    """Epochs trained by the end of every rung, e.g. 1, 3, 9."""
+    budgets = []
+    budget = min_epochs
+    while budget < max_epochs:
+        budgets.append(budget)
+        budget *= reduction_factor
+    return budgets + [max_epochs]
+
+
+def prepare_dataset_cache(input_path, output_path, cache_dir, dataset_dimensions=(256, 256), input_img_size=(256, 256, 3), validation_split=0.1):
+    """Decodes, splits and resizes the dataset folders once for every trial.
+    Returns:
+        The folder holding one uint8 `.npy` file per split. Training images are
+        resized to `dataset_dimensions` and held-out ones to `input_img_size`,
+        so the trial pipelines only crop, flip and normalize them.
+    """
+    from cyclegan.data import list_image_paths
+
+    digest = hashlib.sha256()
+    for folder in (input_path, output_path):
+        for path in list_image_paths(folder):
+            stat = os.stat(path)
+            digest.update(("%s\0%d\0%d\n" % (path, stat.st_size, stat.st_mtime_ns)).encode("utf8"))
+    digest.update(json.dumps([list(dataset_dimensions), list(input_img_size), validation_split]).encode("utf8"))
+    dataset_dir = os.path.join(cache_dir, digest.hexdigest()[:16])
+    if os.path.isdir(dataset_dir):
+        return dataset_dir
+
+    import tensorflow as tf
+
+    from cyclegan.data import load_data, split_holdout
+
+    src_X, src_Y, dst_X, dst_Y = load_data(input_path, output_path)
+    src_X, _, test_src_X, _ = split_holdout(src_X, src_Y, validation_split)
+    dst_X, _, test_dst_X, _ = split_holdout(dst_X, dst_Y, validation_split)
+    arrays = {
+        "train_src": (src_X, dataset_dimensions),
+        "train_dst": (dst_X, dataset_dimensions),
+        "test_src": (test_src_X, input_img_size[:2]),
+        "test_dst": (test_dst_X, input_img_size[:2]),
+    }
+    # Written next to the final folder and renamed, so concurrent sweeps never read half a cache
+    temporary_dir = "%s.tmp%d" % (dataset_dir, os.getpid())
+    os.makedirs(temporary_dir, exist_ok=True)
+    for name, (images, size) in arrays.items():
+        resized = tf.image.resize(images, [*size]).numpy()
+        np.save(os.path.join(temporary_dir, name + ".npy"), np.round(resized).clip(0, 255).astype(np.uint8))
+    os.replace(temporary_dir, dataset_dir)
+    return dataset_dir
+
+
+def assign_cores(num_workers=None, threads_per_trial=4):
+    """Splits the CPU cores this process may use into one set per worker."""
+    if hasattr(os, "sched_getaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+    else:
+        cores = list(range(os.cpu_count() or 1))
+    threads_per_trial = min(threads_per_trial, len(cores))
+    if num_workers is None:
+        num_workers = max(1, len(cores) // threads_per_trial)
+    # More workers than cores share them round robin
+    return [
+        [cores[(worker * threads_per_trial + i) % len(cores)] for i in range(threads_per_trial)]
+        for worker in range(num_workers)
+    ]
+
+
+THREAD_VARIABLES = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+
+@contextlib.contextmanager
+def thread_environment(threads):
+    """Sets the thread count of the BLAS and OpenMP libraries for the processes started inside the block.
+    The libraries read it when they are loaded, and a spawned worker loads
+    numpy while it imports this module, before `init_worker` runs.
+    """
+    saved = {name: os.environ.get(name) for name in THREAD_VARIABLES}
+    os.environ.update({name: str(threads) for name in THREAD_VARIABLES})
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def init_worker(core_sets, threads):
+    # Runs once in every worker process, before TensorFlow creates its thread pools
+    cores = core_sets.get()
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    import tensorflow as tf
+
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def train_trial(trial, epochs, dataset_dir, sweep_dir, settings):
+    """Trains one trial up to `epochs`, continuing from its last checkpoint.
+    Args:
+        trial(dict): Hyperparameters of the trial, see `sweep_trials`.
+        settings(dict): `batch_size`, `crops_per_image`, `dataset_dimensions`,
+        `input_img_size` and `validation_batch_size` shared by every trial.
+    Returns:
+        The last training and validation losses of the trial, including
+        `val_cycle_l1`, the cycle loss without its `lambda_cycle` weight so
+        trials with different weights can be ranked together. The `val_`
+        losses are averaged over every held-out image, the training losses
+        are those of the last batch only.
+    """
+    import tensorflow as tf
+    from tensorflow import keras
+
+    from cyclegan.data import train_pipeline, validation_pipeline
+    from cyclegan.models import build_cycle_gan
+    from cyclegan.variants import generator_config
+
+    start = time.perf_counter()
+    # Workers are reused by later trials, drop the graphs of the previous one
+    keras.backend.clear_session()
+
+    def dataset(name):
+        images = np.load(os.path.join(dataset_dir, name + ".npy"))
+        return tf.data.Dataset.from_tensor_slices((images, np.zeros(len(images), np.int64)))
+
+    input_img_size = tuple(settings["input_img_size"])
+    batch_size = settings["batch_size"]
+    crops_per_image = settings.get("crops_per_image", 1)
+    train_data = tf.data.Dataset.zip(
+        (
+            train_pipeline(dataset("train_src"), batch_size, settings["dataset_dimensions"], input_img_size, crops_per_image),
+            train_pipeline(dataset("train_dst"), batch_size, settings["dataset_dimensions"], input_img_size, crops_per_image),
+        )
+    )
+    validation_data = validation_pipeline(dataset("test_src"), dataset("test_dst"), settings["validation_batch_size"], input_img_size)
+
+    cycle_gan_model = build_cycle_gan(
+        input_img_size,
+        generator_config(trial["generator"], trial["width_multiplier"]),
+        trial["lambda_cycle"],
+        trial["lambda_identity"],
+        trial["learning_rate"],
+    )
+    # The optimizer states are part of the checkpoint, so promoted trials continue seamlessly
+    checkpoint = tf.train.Checkpoint(model=cycle_gan_model)
+    trial_dir = os.path.join(sweep_dir, trial["trial"])
+    state_file = os.path.join(trial_dir, "state.json")
+    initial_epoch = 0
+    if os.path.exists(state_file):
+        with open(state_file) as f:
+            state = json.load(f)
+        checkpoint.read(state["checkpoint"]).expect_partial()
+        initial_epoch = state["epochs"]
+
+    history = cycle_gan_model.fit(
+        train_data,
+        initial_epoch=initial_epoch,
+        epochs=epochs,
+        validation_data=validation_data,
+        validation_freq=[epochs],
+        verbose=0,
+    )
+
+    os.makedirs(trial_dir, exist_ok=True)
+    with open(state_file, "w") as f:
+        json.dump({"epochs": epochs, "checkpoint": checkpoint.write(os.path.join(trial_dir, "checkpoint"))}, f)
+    model_path = os.path.join(trial_dir, "model.h5")
+    cycle_gan_model.save_weights(model_path)
+
+    result = dict(trial, epochs=epochs, model_path=model_path, seconds=time.perf_counter() - start)
+    # The val_ losses come from the single evaluation after the last epoch
+    result.update({name: float(values[-1]) for name, values in history.history.items()})
+    result["val_cycle_l1"] = result["val_cycle_loss"] / trial["lambda_cycle"]
+    return result
+
+
+def is_ranking_metric(metric):
+    # Training losses are those of a single batch, too noisy to promote trials on
+    return metric.startswith("val_")
+
+
+def metric_value(result, metric):
+    value = result.get(metric, math.inf)
+    return math.inf if math.isnan(value) else value
+
+
+def run_sweep(trials, dataset_dir, sweep_dir, settings, min_epochs=1, max_epochs=9, reduction_factor=3, metric="val_cycle_l1", num_workers=None, threads_per_trial=4):
+    """Trains the trials in parallel processes with successive halving.
+    Args:
+        trials(list): Trials of `sweep_trials`.
+        dataset_dir(str): Folder of `prepare_dataset_cache`.
+        sweep_dir(str): Folder of the trial checkpoints and the results.
+        metric(str): Validation result trials are ranked by, lower is
+        better. Only the `val_` losses are averaged over the held-out images,
+        so other results cannot be used.
+        num_workers(int): Trials trained at the same time, by default as many
+        as there are sets of `threads_per_trial` cores.
+    Returns:
+        The last result of every trial, best first.
+    """
+    if not is_ranking_metric(metric):
+        raise ValueError("Trials are ranked by a validation loss starting with val_, not %r" % metric)
+    os.makedirs(sweep_dir, exist_ok=True)
+    budgets = halving_budgets(min_epochs, max_epochs, reduction_factor)
+    core_sets = assign_cores(num_workers, threads_per_trial)
+    # Spawned workers start without the parent's TensorFlow state and thread pools
+    context = multiprocessing.get_context("spawn")
+    core_queue = context.Queue()
+    for cores in core_sets:
+        core_queue.put(cores)
+
+    latest = {}
+    seconds = {}
+    survivors = list(trials)
+    # Workers are started on demand, so the environment stays set for the whole sweep
+    with thread_environment(len(core_sets[0])), ProcessPoolExecutor(
+        len(core_sets), mp_context=context, initializer=init_worker, initargs=(core_queue, len(core_sets[0]))
+    ) as pool, open(os.path.join(sweep_dir, "results.jsonl"), "a") as log:
+        for rung, epochs in enumerate(budgets):
+            futures = {pool.submit(train_trial, trial, epochs, dataset_dir, sweep_dir, settings): trial for trial in survivors}
+            rung_results = []
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as error:
+                    result = dict(futures[future], epochs=epochs, error=repr(error))
+                result["rung"] = rung
+                seconds[result["trial"]] = seconds.get(result["trial"], 0.0) + result.get("seconds", 0.0)
+                rung_results.append(result)
+                print("rung %d  %s  %d epochs  %s %.4f" % (rung, result["trial"], epochs, metric, metric_value(result, metric)))
+
+            rung_results.sort(key=lambda result: metric_value(result, metric))
+            last_rung = rung == len(budgets) - 1
+            num_promoted = 0 if last_rung else max(1, math.ceil(len(rung_results) / reduction_factor))
+            for i, result in enumerate(rung_results):
+                if "error" in result:
+                    result["status"] = "failed"
+                elif last_rung:
+                    result["status"] = "finished"
+                else:
+                    result["status"] = "promoted" if i < num_promoted else "stopped"
+                log.write(json.dumps(result) + "\n")
+                latest[result["trial"]] = dict(result, total_seconds=seconds[result["trial"]])
+            log.flush()
+            survivors = [trial for trial in trials if latest[trial["trial"]]["status"] == "promoted"]
+            if not survivors:
+                break
+
+    results = sorted(latest.values(), key=lambda result: (-result["epochs"], metric_value(result, metric)))
+    with open(os.path.join(sweep_dir, "results.md"), "w") as f:
+        f.write(format_sweep_results(results, metric) + "\n")
+    return results
+
+
+def format_sweep_results(results, metric="val_cycle_l1"):
+    keys = sorted(TRIAL_DEFAULTS)
+    lines = [
+        "| trial | %s | epochs | %s | val G | val F | seconds | status |" % (" | ".join(keys), metric),
+        "|---|%s---|---|---|---|---|---|" % ("---|" * len(keys)),
+    ]
+    for result in results:
+        lines.append(
+            "| %s | %s | %d | %.4f | %.4f | %.4f | %.1f | %s |"
+            % (
+                result["trial"],
+                " | ".join(str(result[key]) for key in keys),
+                result["epochs"],
+                metric_value(result, metric),
+                result.get("val_G_loss", math.nan),
+                result.get("val_F_loss", math.nan),
+                result["total_seconds"],
+                result["status"],
+            )
+        )
+    return "\n".join(lines)
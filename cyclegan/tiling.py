@@ -0,0 +1,223 @@
+"""
+## Tiled translation of very large images
+Images too large to translate in one pass (e.g. 10k x 10k satellite tiles of
+the `maps` dataset) are split into overlapping tiles, translated in batches
+and blended back with a feathered window, so the seams between tiles fade
+into each other instead of showing as hard edges:
+```
+ ______________
+|    |xx|    |     every tile is weighted by a window that ramps up across
+|____|xx|____|     the overlap (xx), and every output pixel is the weighted
+|xxxxxxxxxxxx|     mean of the tiles covering it
+|____|xx|____|
+```
+Only one row of tiles is held in memory at a time. The source is read from a
+memory mapped `.npy` file, and the translation is written row by row to a
+`.npy` or `.png` file, so for `.npy` sources the image size is limited by disk
+space only. Other formats are decoded into memory once and copied into a
+temporary `.npy` file, so they must fit in memory; images that would not fit
+are rejected before decoding.
+"""
+import os
+import struct
+import tempfile
+import time
+import zlib
+
+import numpy as np
+
+from cyclegan.data import denormalize_img, normalize_img
+
+
+def tile_origins(size, tile_size, overlap):
+    """Returns the start of every tile along an axis of `size` pixels.
+    The last tile is moved back to end at the image border, so every tile is full size.
+    """
+    if size <= tile_size:
+        return [0]
+    stride = tile_size - overlap
+    origins = list(range(0, size - tile_size, stride))
+    origins.append(size - tile_size)
+    return origins
+
+
+def feather_window(tile_size, overlap):
+    """Returns the `[tile_size, tile_size, 1]` blending weights of a tile.
+    Weights ramp up linearly across the overlap and stay positive at the
+    borders, so pixels covered by a single tile keep their value.
+    """
+    ramp = np.minimum(np.arange(tile_size) + 1, np.arange(tile_size)[::-1] + 1) / float(overlap + 1)
+    ramp = np.minimum(ramp, 1.0).astype(np.float32)
+    return np.outer(ramp, ramp)[:, :, np.newaxis]
+
+
+def available_memory():
+    """Bytes of memory available without swapping, from `/proc/meminfo`, or None if unknown."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def open_source(path, scratch_dir=None, max_decode_bytes=None):
+    """Opens an image as a read-only `[height, width, 3]` uint8 array backed by disk.
+    `.npy` files are memory mapped directly, whatever their size. Other images
+    are decoded into memory once and copied into a temporary `.npy` file in
+    `scratch_dir`, so they must fit in memory.
+    Args:
+        max_decode_bytes(int): Largest decoded size accepted for non `.npy`
+        images, by default the available memory. Larger images raise a
+        ValueError before decoding.
+    """
+    if path.lower().endswith(".npy"):
+        return np.load(path, mmap_mode="r")
+
+    from PIL import Image
+
+    # The images are large on purpose, not decompression bombs
+    Image.MAX_IMAGE_PIXELS = None
+    # Opening only reads the header, the pixels are decoded on first access
+    img = Image.open(path)
+    width, height = img.size
+    decoded_bytes = width * height * len(img.getbands())
+    max_decode_bytes = max_decode_bytes or available_memory()
+    if max_decode_bytes is not None and decoded_bytes > max_decode_bytes:
+        raise ValueError(
+            "Decoding the %dx%d image %s needs %.1f MB of memory, more than the %.1f MB allowed. "
+            "Convert it to a uint8 .npy array, which is memory mapped instead of decoded."
+            % (width, height, path, decoded_bytes / 2 ** 20, max_decode_bytes / 2 ** 20)
+        )
+    img.load()
+    handle, scratch_file = tempfile.mkstemp(suffix=".npy", dir=scratch_dir)
+    os.close(handle)
+    source = np.lib.format.open_memmap(scratch_file, mode="w+", dtype=np.uint8, shape=(height, width, 3))
+    # Convert to RGB strip by strip, so only the decoded image is held in memory in full
+    for top in range(0, height, 1024):
+        bottom = min(top + 1024, height)
+        source[top:bottom] = np.asarray(img.crop((0, top, width, bottom)).convert("RGB"))
+    source.flush()
+    del img, source
+    source = np.load(scratch_file, mmap_mode="r")
+    # The mapping stays valid after unlinking, and the file is removed once it is closed
+    os.remove(scratch_file)
+    return source
+
+
+class NpyRowWriter:
+    """Writes the rows of a uint8 image into a memory mapped `.npy` file."""
+
+    def __init__(self, path, height, width):
+        self.output = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=(height, width, 3))
+        self.row = 0
+
+    def write(self, rows):
+        self.output[self.row : self.row + len(rows)] = rows
+        self.row += len(rows)
+
+    def close(self):
+        self.output.flush()
+        del self.output
+
+
+class PngRowWriter:
+    """Streams the rows of a uint8 RGB image into a PNG file without holding the image in memory."""
+
+    def __init__(self, path, height, width):
+        self.file = open(path, "wb")
+        self.compressor = zlib.compressobj(6)
+        self.file.write(b"\x89PNG\r\n\x1a\n")
+        # 8 bit RGB, no interlacing
+        self.chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def chunk(self, kind, data):
+        self.file.write(struct.pack(">I", len(data)) + kind + data)
+        self.file.write(struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+    def write(self, rows):
+        # Every scanline starts with its filter type, 0 (none)
+        scanlines = np.concatenate([np.zeros((len(rows), 1), np.uint8), rows.reshape(len(rows), -1)], axis=1)
+        data = self.compressor.compress(scanlines.tobytes())
+        if data:
+            self.chunk(b"IDAT", data)
+
+    def close(self):
+        self.chunk(b"IDAT", self.compressor.flush())
+        self.chunk(b"IEND", b"")
+        self.file.close()
+
+
+def open_writer(path, height, width):
+    if path.lower().endswith(".npy"):
+        return NpyRowWriter(path, height, width)
+    if path.lower().endswith(".png"):
+        return PngRowWriter(path, height, width)
+    raise ValueError("Tiled outputs are written as .png or .npy, got %s" % path)
+
+
+def translate_tiled(predict, source, output_path, tile_size=512, overlap=64, batch_size=4):
+    """Translates a large image tile by tile and writes the blended translation to disk.
+    Args:
+        predict: Callable mapping a list of normalized `[height, width, 3]`
+        images to their translations, e.g. `Translator.translate_batch`.
+        source: `[height, width, 3]` uint8 array, e.g. from `open_source`.
+        output_path(str): `.png` or `.npy` file the translation is written to.
+        tile_size(int): Height and width of the tiles, a multiple of 4.
+        overlap(int): Number of pixels neighbouring tiles share.
+        batch_size(int): Number of tiles per generator call.
+    Returns:
+        A summary with the number of tiles, the time taken and the tiles per second.
+    """
+    if tile_size % 4:
+        raise ValueError("The tile size must be a multiple of 4, got %d" % tile_size)
+    if not 0 <= overlap < tile_size:
+        raise ValueError("The overlap must be smaller than the tile size, got %d" % overlap)
+    height, width = source.shape[:2]
+    rows = tile_origins(height, tile_size, overlap)
+    columns = tile_origins(width, tile_size, overlap)
+    window = feather_window(tile_size, overlap)
+
+    # Weighted sums of the translations covering the current band of rows
+    band_top = 0
+    band_height = min(tile_size, height)
+    values = np.zeros((band_height, width, 3), np.float32)
+    weights = np.zeros((band_height, width, 1), np.float32)
+
+    writer = open_writer(output_path, height, width)
+    start_time = time.perf_counter()
+    try:
+        for top in rows:
+            # Rows above this tile row are final, write them and move the band down
+            shift = top - band_top
+            if shift:
+                writer.write(denormalize_img(values[:shift] / weights[:shift]).numpy())
+                values = np.concatenate([values[shift:], np.zeros((shift, width, 3), np.float32)])
+                weights = np.concatenate([weights[shift:], np.zeros((shift, width, 1), np.float32)])
+                band_top = top
+
+            for first in range(0, len(columns), batch_size):
+                lefts = columns[first : first + batch_size]
+                tiles = [
+                    normalize_img(np.asarray(source[top : top + tile_size, left : left + tile_size])) for left in lefts
+                ]
+                for left, translation in zip(lefts, predict(tiles)):
+                    tile_height, tile_width = translation.shape[:2]
+                    tile_window = window[:tile_height, :tile_width]
+                    values[:tile_height, left : left + tile_width] += np.asarray(translation) * tile_window
+                    weights[:tile_height, left : left + tile_width] += tile_window
+
+        writer.write(denormalize_img(values / weights).numpy())
+    finally:
+        writer.close()
+    seconds = time.perf_counter() - start_time
+    num_tiles = len(rows) * len(columns)
+    return {
+        "height": height,
+        "width": width,
+        "tiles": num_tiles,
+        "seconds": seconds,
+        "tiles_per_second": num_tiles / max(seconds, 1e-9),
+    }
@@ -0,0 +1,164 @@
+"""
+## Arbitrary-resolution translation
+The generators are fully convolutional, so built with `None` spatial
+dimensions they translate images at their native resolution instead of
+squashing them to `dataset_dimensions`. The only constraint is that the two
+stride 2 downsampling blocks need sizes divisible by 4; images are reflection
+padded to a valid size and the translation is cropped back.
+
+Tracing a `tf.function` for every new image size would make mixed-size inputs
+retrace constantly, so images are padded up to shape buckets (multiples of
+`bucket`). Every bucket is traced once, and images of different sizes that
+fall into the same bucket are translated in one batch.
+"""
+import tensorflow as tf
+from tensorflow import keras
+
+from cyclegan.backends import DEFAULT_BACKEND, make_backend
+
+
+def _pad_symmetric(img, pad_height, pad_width, steps):
+    # Symmetric padding adds at most the current size per step, so `steps`
+    # doublings reach any padding of images down to a single pixel
+    for _ in range(steps):
+        step_height = tf.minimum(pad_height, tf.shape(img)[1])
+        step_width = tf.minimum(pad_width, tf.shape(img)[2])
+        img = tf.pad(img, [[0, 0], [0, step_height], [0, step_width], [0, 0]], mode="SYMMETRIC")
+        pad_height -= step_height
+        pad_width -= step_width
+    return img
+
+
+def pad_to_multiple(img, multiple=4):
+    """Reflection pads the bottom and right of an image batch to a multiple of `multiple`.
+    The two stride 2 downsampling blocks need sizes divisible by 4 for the
+    generator to return the input size. Images too small to reflect (fewer
+    pixels than the padding) are padded symmetrically instead.
+    """
+    height, width = tf.shape(img)[1], tf.shape(img)[2]
+    pad_height = (multiple - height % multiple) % multiple
+    pad_width = (multiple - width % multiple) % multiple
+    return tf.cond(
+        tf.logical_and(pad_height < height, pad_width < width),
+        lambda: tf.pad(img, [[0, 0], [0, pad_height], [0, pad_width], [0, 0]], mode="REFLECT"),
+        lambda: _pad_symmetric(img, pad_height, pad_width, max(int(multiple - 1).bit_length(), 1)),
+    )
+
+
+def pad_to_size(img, height, width):
+    """Reflection pads the bottom and right of a `[height, width, 3]` image to the given size."""
+    while img.shape[0] < height or img.shape[1] < width:
+        # Reflection adds at most one pixel less than the current size per step,
+        # single rows or columns are padded symmetrically, which adds up to their size
+        mode, limit = ("REFLECT", 1) if min(img.shape[0], img.shape[1]) > 1 else ("SYMMETRIC", 0)
+        pad_height = min(height - img.shape[0], img.shape[0] - limit)
+        pad_width = min(width - img.shape[1], img.shape[1] - limit)
+        img = tf.pad(img, [[0, pad_height], [0, pad_width], [0, 0]], mode=mode)
+    return img
+
+
+class Translator:
+    """Translates normalized images of any size with a generator.
+    Args:
+        generator: Keras generator built with `None` spatial dimensions, or
+        any callable accepting batches of any size (e.g. an `ExportedGenerator`).
+        bucket(int): Images are padded to multiples of this size, which must
+        be a multiple of 4. Larger buckets mean fewer traces but more padding.
+        backend(str): Backend of `cyclegan.backends` the Keras generator runs
+        with, set up once per bucket.
+    """
+
+    def __init__(self, generator, bucket=64, backend=DEFAULT_BACKEND):
+        if bucket % 4:
+            raise ValueError("The bucket size must be a multiple of 4, got %d" % bucket)
+        self.generator = generator
+        self.bucket = bucket
+        self.backend = backend
+        self.functions = {}
+
+    def bucket_shape(self, height, width):
+        return (-(-height // self.bucket) * self.bucket, -(-width // self.bucket) * self.bucket)
+
+    def function_for(self, shape):
+        # Keras generators get one backend per bucket, other callables are used as they are
+        if not isinstance(self.generator, keras.Model):
+            return self.generator
+        if shape not in self.functions:
+            self.functions[shape] = make_backend(self.generator, self.backend, (*shape, 3))
+        return self.functions[shape]
+
+    @property
+    def num_traces(self):
+        return len(self.functions)
+
+    def translate_batch(self, images):
+        """Translates a list of normalized `[height, width, 3]` images of any sizes.
+        Returns:
+            The translations in the same order, each the size of its input.
+        """
+        buckets = {}
+        for i, img in enumerate(images):
+            buckets.setdefault(self.bucket_shape(img.shape[0], img.shape[1]), []).append(i)
+
+        translations = [None] * len(images)
+        for shape, indices in buckets.items():
+            batch = tf.stack([pad_to_size(images[i], *shape) for i in indices])
+            translated = self.function_for(shape)(batch)
+            for i, translation in zip(indices, translated):
+                # Crop the padding back off
+                translations[i] = translation[: images[i].shape[0], : images[i].shape[1]]
+        return translations
+
+    def __call__(self, img, training=False):
+        """Translates a normalized `[batch, height, width, 3]` batch of equally sized images."""
+        return tf.stack(self.translate_batch(list(img)))
+
+
+def load_translation_fn(
+    direction,
+    model_path=None,
+    export_dir=None,
+    input_img_size=None,
+    bucket=64,
+    backend=DEFAULT_BACKEND,
+    compile_cache_dir=None,
+):
+    """Loads one generator as a callable mapping a list of normalized images to their translations.
+    Args:
+        direction(str): Translation direction ("A2B" or "B2A").
+        model_path(str): H5 model saved during training.
+        export_dir(str): Directory of generators exported with `export_generator`,
+        used instead of `model_path`.
+        input_img_size(tuple): Size images are translated at, or None to
+        translate them at their native resolution in shape buckets.
+        bucket(int): Shape bucket size of native resolution translations.
+        backend(str): Backend of `cyclegan.backends` running H5 generators.
+        Exported generators always run their SavedModel signatures.
+        compile_cache_dir(str): Folder of `cyclegan.compile_cache`, where the
+        traced graphs of the `function` and `xla` backends are kept across
+        processes. None traces them in every process.
+    Returns:
+        The callable and the generator it runs.
+    """
+    if export_dir:
+        from cyclegan.export import load_exported_generator
+
+        if backend != DEFAULT_BACKEND:
+            raise ValueError("Exported generators run their SavedModel signatures, backends apply to H5 models")
+        generator = load_exported_generator(export_dir, direction)
+    elif compile_cache_dir and backend in ("function", "xla"):
+        from cyclegan.compile_cache import load_cached_generator
+
+        generator = load_cached_generator(model_path, direction, input_img_size, backend, compile_cache_dir)
+    else:
+        from cyclegan.models import load_generator
+
+        generator = load_generator(model_path, direction, input_img_size or (None, None, 3))
+
+    if input_img_size is None:
+        # Native resolution: images of similar sizes share a shape bucket and a traced function
+        return Translator(generator, bucket, backend).translate_batch, generator
+    if not isinstance(generator, keras.Model):
+        return (lambda images: generator(tf.stack(images))), generator
+    predict = make_backend(generator, backend, input_img_size)
+    return (lambda images: predict(tf.stack(images))), generator
@@ -0,0 +1,39 @@
+"""
+## Generator variants
+Named generator configurations, from the original ResNet generator down to
+small depthwise separable models for CPU inference. A configuration is a
+dictionary of `get_resnet_generator` arguments and is stored next to the
+weights of every saved model, so loaders rebuild the matching architecture.
+"""
+
+DEFAULT_VARIANT = "resnet9"
+
+GENERATOR_VARIANTS = {
+    # The original generator: c7s1-64, d128, d256, 9 x R256, u128, u64, c7s1-3
+    "resnet9": {"filters": 64, "num_residual_blocks": 9, "separable": False},
+    "resnet6": {"filters": 64, "num_residual_blocks": 6, "separable": False},
+    "half": {"filters": 32, "num_residual_blocks": 9, "separable": False},
+    "lite": {"filters": 32, "num_residual_blocks": 6, "separable": False},
+    # Depthwise separable residual blocks
+    "mobile": {"filters": 32, "num_residual_blocks": 6, "separable": True},
+    "tiny": {"filters": 16, "num_residual_blocks": 4, "separable": True},
+}
+
+
+def generator_config(variant=DEFAULT_VARIANT, width_multiplier=1.0, num_residual_blocks=None, separable=None):
+    """Returns the generator configuration of a named variant.
+    Args:
+        variant(str): Name of a variant in `GENERATOR_VARIANTS`.
+        width_multiplier(float): Scales the number of filters of every layer.
+        num_residual_blocks(int): Overrides the number of residual blocks.
+        separable(bool): Overrides the use of depthwise separable residual blocks.
+    """
+    if variant not in GENERATOR_VARIANTS:
+        raise ValueError("Unknown generator variant %r, expected one of %s" % (variant, sorted(GENERATOR_VARIANTS)))
+    config = dict(GENERATOR_VARIANTS[variant])
+    config["filters"] = max(1, int(round(config["filters"] * width_multiplier)))
+    if num_residual_blocks is not None:
+        config["num_residual_blocks"] = num_residual_blocks
+    if separable is not None:
+        config["separable"] = separable
+    return config